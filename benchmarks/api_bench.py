@@ -0,0 +1,261 @@
+"""
+Throughput and latency of the API endpoints against a synthetic catalog.
+
+Seeds a throwaway sqlite database with benchmarks/seed.py, then times every endpoint either in-process
+through the django test client (default) or over http against a local server started in this process:
+
+    python benchmarks/api_bench.py --movies 10000 --requests 200 --output bench.json
+    python benchmarks/api_bench.py --server wsgi --concurrency 8
+    python benchmarks/api_bench.py --server asgi            # needs uvicorn
+    python benchmarks/api_bench.py --compare bench.json     # p50/p99 change against an earlier run
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'watchlist.settings')
+
+import django
+from django.conf import settings
+from seed import seed_catalog, PASSWORD
+
+API = '/watchlist/v1/'
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class InProcessTransport:
+
+    def __init__(self):
+        from django.test import Client
+        self.client = Client()
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'HTTP_AUTHORIZATION': 'Token %s' % token} if token else {}
+        if method == 'GET':
+            response = self.client.get(path, **headers)
+        else:
+            response = self.client.post(path, json.dumps(body), content_type='application/json', **headers)
+        return response.status_code
+
+
+class HttpTransport:
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = 'Token %s' % token
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+def start_server(kind, port):
+    if kind == 'wsgi':
+        from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+        from django.core.wsgi import get_wsgi_application
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        server = ThreadedWSGIServer(('127.0.0.1', port), QuietHandler)
+        server.set_app(get_wsgi_application())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server.server_address[1]
+
+    import uvicorn
+    from django.core.asgi import get_asgi_application
+    server = uvicorn.Server(uvicorn.Config(get_asgi_application(), host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return port
+
+
+def scenarios(users, movies):
+    """name -> (method, path, body, token) factory called with the request number"""
+    from movie.models import Movie, AvailablePlatformsMovie, StreamPlatform
+    from rest_framework.authtoken.models import Token
+
+    watchers = [user for user in users if user.role == 'watcher']
+    reviewers = [user for user in users if user.role == 'reviewer']
+    tokens = {user.pk: Token.objects.create(user=user).key for user in users}
+    movie_ids = list(Movie.objects.values_list('id', flat=True))
+    platform = StreamPlatform.objects.first()
+    new_titles = count()
+    last_page = max(1, movies // settings.REST_FRAMEWORK.get('PAGE_SIZE', 3))
+
+    def new_movie(i):
+        title = 'bench movie %d' % next(new_titles)
+        platform.available_movie.add(AvailablePlatformsMovie.objects.create(title=title))
+        return ('POST', API + 'movie/', {'title': title, 'synopsis': 'benchmark', 'runtime': 100,
+                                         'genre': [{'name': 'genre 0'}], 'stream_platform': [{'name': platform.name}]},
+                None)
+
+    return {
+        'movie-list': lambda i: ('GET', API + 'movie-list/', None, None),
+        'movie-list deep page': lambda i: ('GET', API + 'movie-list/?page=%d' % last_page, None, None),
+        'movie-list cursor': lambda i: ('GET', API + 'movie-list/?paginate=cursor', None, None),
+        'movie-list search': lambda i: ('GET', API + 'movie-list/?search=movie %d' % (i % movies), None, None),
+        'movie-list facets': lambda i: ('GET', API + 'movie-list/?facets=true&genre=genre %d&runtime_min=120'
+                                        % (i % 20), None, None),
+        'trending': lambda i: ('GET', API + 'trending/', None, None),
+        'similar movies': lambda i: ('GET', API + 'moviedetail/%d/similar/' % movie_ids[i % len(movie_ids)], None,
+                                     None),
+        'recommendations': lambda i: ('GET', API + 'watch-list/recommendations/', None,
+                                      tokens[watchers[i % len(watchers)].pk]),
+        'moviedetail': lambda i: ('GET', API + 'moviedetail/%d/' % movie_ids[i % len(movie_ids)], None, None),
+        'watch-list': lambda i: ('GET', API + 'watch-list/', None, tokens[watchers[i % len(watchers)].pk]),
+        'movie-review-list': lambda i: ('GET', API + 'movie-review-list/', None, None),
+        'review feed': lambda i: ('GET', API + 'moviedetail/%d/reviews/' % movie_ids[i % len(movie_ids)], None,
+                                  None),
+        'login': lambda i: ('POST', API + 'login/', {'email': users[i % len(users)].email, 'password': PASSWORD},
+                            None),
+        'movie create': new_movie,
+        'watch-list create': lambda i: ('POST', API + 'watch-list/create/',
+                                        {'movie_title': 'movie %d' % (movies - 1 - i // len(watchers) % movies)},
+                                        tokens[watchers[i % len(watchers)].pk]),
+        'review create': lambda i: ('POST', API + 'review-movie/',
+                                    {'movie_title': 'movie %d' % (movies - 1 - i // len(reviewers) % movies),
+                                     'review': 'benchmark'}, tokens[reviewers[i % len(reviewers)].pk]),
+    }
+
+
+def run(transport, scenario, requests, concurrency, warmup):
+    for i in range(warmup):
+        transport.request(*scenario(i))
+    calls = [scenario(warmup + i) for i in range(requests)]
+
+    def timed(call):
+        start = time.perf_counter()
+        status = transport.request(*call)
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(timed, calls))
+    else:
+        results = [timed(call) for call in calls]
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000 for latency, _ in results]
+    return {
+        'requests': requests,
+        'errors': sum(1 for _, status in results if status >= 400),
+        'throughput_rps': requests / elapsed,
+        'mean_ms': sum(latencies) / len(latencies),
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+    }
+
+
+def compare(previous, current):
+    print('%-24s %12s %12s' % ('endpoint', 'p50 change', 'p99 change'))
+    for name, result in current['endpoints'].items():
+        before = previous['endpoints'].get(name)
+        if before:
+            print('%-24s %+11.1f%% %+11.1f%%' % (name, (result['p50_ms'] / before['p50_ms'] - 1) * 100,
+                                                (result['p99_ms'] / before['p99_ms'] - 1) * 100))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=Path(__file__).resolve().parent,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movies', type=int, default=1000)
+    parser.add_argument('--genres', type=int, default=20)
+    parser.add_argument('--platforms', type=int, default=10)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--watchlists', type=int, default=20, help='watchlist entries per user')
+    parser.add_argument('--reviews', type=int, default=5, help='reviews per user')
+    parser.add_argument('--requests', type=int, default=100, help='timed requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads, only used with --server')
+    parser.add_argument('--server', choices=('wsgi', 'asgi'))
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--endpoints', nargs='*', help='only run these endpoints')
+    parser.add_argument('--output')
+    parser.add_argument('--compare', help='earlier json output to compare against')
+    args = parser.parse_args()
+
+    database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+    settings.DATABASES['default']['NAME'] = database.name
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+    from django.core.management import call_command
+
+    try:
+        call_command('migrate', verbosity=0)
+        seed_start = time.perf_counter()
+        users = seed_catalog(movies=args.movies, genres=args.genres, platforms=args.platforms, users=args.users,
+                             watchlists=args.watchlists, reviews=args.reviews)
+        seed_seconds = time.perf_counter() - seed_start
+
+        if args.server:
+            port = start_server(args.server, args.port)
+            transport = HttpTransport('http://127.0.0.1:%d' % port)
+        else:
+            transport = InProcessTransport()
+        concurrency = args.concurrency if args.server else 1
+
+        endpoints = {}
+        for name, scenario in scenarios(users, args.movies).items():
+            if args.endpoints and name not in args.endpoints:
+                continue
+            endpoints[name] = run(transport, scenario, args.requests, concurrency, args.warmup)
+            print('%-24s %8.1f req/s  p50 %7.2f ms  p99 %7.2f ms  errors %d' % (
+                name, endpoints[name]['throughput_rps'], endpoints[name]['p50_ms'], endpoints[name]['p99_ms'],
+                endpoints[name]['errors']), file=sys.stderr)
+    finally:
+        os.unlink(database.name)
+
+    result = {
+        'commit': git_commit(),
+        'mode': args.server or 'in-process',
+        'concurrency': concurrency,
+        'scale': {'movies': args.movies, 'genres': args.genres, 'platforms': args.platforms, 'users': args.users,
+                  'watchlists': args.watchlists, 'reviews': args.reviews},
+        'seed_seconds': seed_seconds,
+        'endpoints': endpoints,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), result)
+    elif not args.output:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
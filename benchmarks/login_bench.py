@@ -0,0 +1,91 @@
+"""
+Logins per second on one core for each password hasher policy.
+
+Every configuration creates a user hashed with it and posts to login/ in-process on a single thread,
+so the number is roughly what one worker process can sustain:
+
+    python benchmarks/login_bench.py --logins 50
+    python benchmarks/login_bench.py --policies pbkdf2 --iterations 390000 100000 --output login.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'watchlist.settings')
+
+import django
+from django.conf import settings
+
+PASSWORD = 'benchmark-password'
+
+
+def bench(client, email, logins):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        for _ in range(logins):
+            response = client.post('/watchlist/v1/login/', {'email': email, 'password': PASSWORD})
+            assert response.status_code == 200, response.content
+        elapsed = time.perf_counter() - start
+    return {'logins_per_second': logins / elapsed, 'mean_ms': elapsed * 1000 / logins,
+            'queries_per_login': len(queries) / logins}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--policies', nargs='*', default=['pbkdf2', 'scrypt'],
+                        choices=list(settings.PASSWORD_HASHER_POLICIES))
+    parser.add_argument('--iterations', nargs='*', type=int, default=[settings.PASSWORD_HASH_ITERATIONS],
+                        help='pbkdf2 iteration counts to try')
+    parser.add_argument('--logins', type=int, default=30)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+    settings.DATABASES['default']['NAME'] = database.name
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+    from django.core.management import call_command
+    from django.test import Client
+    from django.test.utils import override_settings
+    from user.models import CustomUser
+
+    configurations = [('pbkdf2', iterations) for iterations in args.iterations if 'pbkdf2' in args.policies]
+    configurations += [(policy, None) for policy in args.policies if policy != 'pbkdf2']
+    results = []
+    try:
+        call_command('migrate', verbosity=0)
+        for index, (policy, iterations) in enumerate(configurations):
+            preferred = settings.PASSWORD_HASHER_POLICIES[policy]
+            hashers = [preferred] + [hasher for hasher in settings.PASSWORD_HASHERS if hasher != preferred]
+            with override_settings(PASSWORD_HASHERS=hashers,
+                                   PASSWORD_HASH_ITERATIONS=iterations or settings.PASSWORD_HASH_ITERATIONS):
+                email = 'user%d@example.com' % index
+                CustomUser.objects.create_user(email=email, password=PASSWORD, first_name='user',
+                                               last_name=str(index), username='user %d' % index, role='watcher')
+                result = {'policy': policy, 'iterations': iterations}
+                result.update(bench(Client(), email, args.logins))
+            results.append(result)
+            print('%-8s %10s  %7.1f logins/s  %7.1f ms  %.1f queries' % (
+                policy, iterations or '', result['logins_per_second'], result['mean_ms'],
+                result['queries_per_login']), file=sys.stderr)
+    finally:
+        os.unlink(database.name)
+
+    report = json.dumps({'cpu_count': os.cpu_count(), 'logins': args.logins, 'results': results}, indent=2)
+    if args.output:
+        Path(args.output).write_text(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
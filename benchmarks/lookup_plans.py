@@ -0,0 +1,82 @@
+"""
+Query plans and timings for the hot lookup columns, before and after movie migration 0010
+(unique constraints on titles/names and on (user, movie) for watchlists and reviews).
+
+Runs against a throwaway sqlite file, never the project database:
+
+    python benchmarks/lookup_plans.py --movies 20000 --output lookup_plans.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'watchlist.settings')
+
+import django
+from django.conf import settings
+from seed import seed_catalog
+
+
+def lookups(movies, user_id, movie_id):
+    from movie.models import Genre, Movie, StreamPlatform, AvailablePlatformsMovie, WatchList, MovieReview
+
+    title = 'movie %d' % (movies - 1)
+    return {
+        'Movie.title': Movie.objects.filter(title=title),
+        'Genre.name': Genre.objects.filter(name='genre 49'),
+        'StreamPlatform.name': StreamPlatform.objects.filter(name='platform 49'),
+        'AvailablePlatformsMovie.title': AvailablePlatformsMovie.objects.filter(title=title),
+        'WatchList(user, movie)': WatchList.objects.filter(user_id=user_id, movie_id=movie_id),
+        'MovieReview(user, movie)': MovieReview.objects.filter(user_id=user_id, movie_id=movie_id),
+    }
+
+
+def measure(queryset, repeat):
+    # only the primary key is selected, later migrations add columns the 0009 schema doesn't have
+    queryset = queryset.values('pk')
+    start = time.perf_counter()
+    for _ in range(repeat):
+        queryset.exists()
+    return {'plan': queryset.explain(), 'mean_ms': (time.perf_counter() - start) * 1000 / repeat}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movies', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+    settings.DATABASES['default']['NAME'] = database.name
+    django.setup()
+    from django.core.management import call_command
+    from movie.models import WatchList
+
+    try:
+        call_command('migrate', verbosity=0)
+        users = seed_catalog(movies=args.movies, genres=50, platforms=50, users=100, watchlists=args.movies // 100,
+                             reviews=args.movies // 100)
+        user_id, movie_id = WatchList.objects.filter(user=users[-1]).values_list('user_id', 'movie_id')[0]
+        results = {name: {'after': measure(queryset, args.repeat)}
+                   for name, queryset in lookups(args.movies, user_id, movie_id).items()}
+        # unapplying 0010 (and what came after it) rebuilds the tables without the unique indexes
+        call_command('migrate', 'movie', '0009', verbosity=0)
+        for name, queryset in lookups(args.movies, user_id, movie_id).items():
+            results[name]['before'] = measure(queryset, args.repeat)
+    finally:
+        os.unlink(database.name)
+
+    report = json.dumps({'movies': args.movies, 'repeat': args.repeat, 'lookups': results}, indent=2)
+    if args.output:
+        Path(args.output).write_text(report)
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Synthetic catalog for the benchmarks, written with bulk inserts. Call after django.setup() against a
+throwaway database.
+"""
+from django.contrib.auth.hashers import make_password
+
+BATCH_SIZE = 1000
+PASSWORD = 'benchmark-password'
+
+
+def seed_catalog(movies=1000, genres=20, platforms=10, users=100, watchlists=20, reviews=5, genres_per_movie=3,
+                 platforms_per_movie=2):
+    """creates the catalog and returns the created users, the first half are watchers and the rest reviewers.
+    every user watchlists `watchlists` movies and reviews `reviews` movies, all users share PASSWORD"""
+    from movie.models import Genre, Movie, StreamPlatform, AvailablePlatformsMovie, WatchList, MovieReview
+    from movie import search, counters, trending, recommendations
+    from user.models import CustomUser
+
+    Genre.objects.bulk_create([Genre(name='genre %d' % i) for i in range(genres)])
+    StreamPlatform.objects.bulk_create([StreamPlatform(name='platform %d' % i, description='platform %d' % i)
+                                        for i in range(platforms)])
+    AvailablePlatformsMovie.objects.bulk_create([AvailablePlatformsMovie(title='movie %d' % i)
+                                                 for i in range(movies)], batch_size=BATCH_SIZE)
+    Movie.objects.bulk_create([Movie(title='movie %d' % i, synopsis='synopsis of movie %d' % i, runtime=80 + i % 100)
+                               for i in range(movies)], batch_size=BATCH_SIZE)
+
+    genre_ids = list(Genre.objects.values_list('id', flat=True))
+    platform_ids = list(StreamPlatform.objects.values_list('id', flat=True))
+    movie_ids = list(Movie.objects.order_by('id').values_list('id', flat=True))
+    available_ids = list(AvailablePlatformsMovie.objects.order_by('id').values_list('id', flat=True))
+
+    genre_through = Movie.genre.through
+    genre_through.objects.bulk_create([
+        genre_through(movie_id=movie_id, genre_id=genre_ids[(index + offset) % len(genre_ids)])
+        for index, movie_id in enumerate(movie_ids) for offset in range(min(genres_per_movie, len(genre_ids)))
+    ], batch_size=BATCH_SIZE)
+    platform_through = Movie.stream_platform.through
+    available_through = StreamPlatform.available_movie.through
+    pairs = [(index, movie_id, platform_ids[(index + offset) % len(platform_ids)])
+             for index, movie_id in enumerate(movie_ids)
+             for offset in range(min(platforms_per_movie, len(platform_ids)))]
+    platform_through.objects.bulk_create([platform_through(movie_id=movie_id, streamplatform_id=platform_id)
+                                          for _, movie_id, platform_id in pairs], batch_size=BATCH_SIZE)
+    available_through.objects.bulk_create([
+        available_through(streamplatform_id=platform_id, availableplatformsmovie_id=available_ids[index])
+        for index, _, platform_id in pairs], batch_size=BATCH_SIZE)
+
+    password = make_password(PASSWORD)
+    CustomUser.objects.bulk_create([
+        CustomUser(email='user%d@example.com' % i, username='user %d' % i, first_name='user', last_name=str(i),
+                   password=password, role='watcher' if i < users // 2 else 'reviewer')
+        for i in range(users)], batch_size=BATCH_SIZE)
+    created_users = list(CustomUser.objects.filter(email__endswith='@example.com').order_by('id'))
+
+    WatchList.objects.bulk_create([
+        WatchList(user_id=user.pk, movie_id=movie_ids[(index * watchlists + offset) % len(movie_ids)])
+        for index, user in enumerate(created_users) for offset in range(min(watchlists, len(movie_ids)))
+    ], batch_size=BATCH_SIZE)
+    MovieReview.objects.bulk_create([
+        MovieReview(user_id=user.pk, movie_id=movie_ids[(index * reviews + offset) % len(movie_ids)],
+                    review='review %d' % offset)
+        for index, user in enumerate(created_users) for offset in range(min(reviews, len(movie_ids)))
+    ], batch_size=BATCH_SIZE)
+
+    # bulk_create skips signals and counters, so the search index, counters, rankings and the recommendation
+    # index are filled in one pass
+    search.rebuild_index()
+    counters.reconcile()
+    trending.rebuild()
+    recommendations.build()
+    return created_users
@@ -0,0 +1,190 @@
+"""
+Throughput of the development settings against watchlist.settings_production under concurrent reads and
+writes.
+
+Each profile runs in its own process (settings load once per process) against a fresh sqlite file seeded
+with benchmarks/seed.py. Worker threads call the wsgi application directly, like a threaded wsgi server
+does, so connections are opened and closed per request exactly as CONN_MAX_AGE dictates. Every worker
+sends a mix of list/detail reads and watchlist/review writes:
+
+    python benchmarks/settings_bench.py --threads 8 --requests 2000 --writes 20
+    python benchmarks/settings_bench.py --profiles production --output bench.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from wsgiref.util import setup_testing_defaults
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+PROFILES = {
+    'development': 'watchlist.settings',
+    'production': 'watchlist.settings_production',
+}
+API = '/watchlist/v1/'
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def call(application, method, path, body=None, token=None):
+    """one request through the wsgi application, returns the status code"""
+    data = json.dumps(body).encode() if body is not None else b''
+    path, _, query = path.partition('?')
+    environ = {'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query, 'wsgi.input': BytesIO(data),
+               'CONTENT_LENGTH': str(len(data)), 'CONTENT_TYPE': 'application/json'}
+    if token:
+        environ['HTTP_AUTHORIZATION'] = 'Token %s' % token
+    setup_testing_defaults(environ)
+    result = {}
+
+    def start_response(status, headers, exc_info=None):
+        result['status'] = int(status.split()[0])
+
+    response = application(environ, start_response)
+    try:
+        for _ in response:
+            pass
+    finally:
+        # fires request_finished, which closes the connection unless CONN_MAX_AGE keeps it
+        response.close()
+    return result['status']
+
+
+def requests_mix(users, movies, count, writes):
+    """`count` (method, path, body, token) calls, `writes` percent of them writes. watchlist and review
+    writes go to distinct (user, movie) pairs so they insert instead of failing as duplicates"""
+    from movie.models import Movie
+    from rest_framework.authtoken.models import Token
+
+    tokens = {user.pk: Token.objects.create(user=user).key for user in users}
+    watchers = [user for user in users if user.role == 'watcher']
+    reviewers = [user for user in users if user.role == 'reviewer']
+    movie_ids = list(Movie.objects.values_list('id', flat=True))
+    random.seed(0)
+    calls = []
+    for i in range(count):
+        if random.randrange(100) < writes:
+            if i % 2:
+                user = watchers[i % len(watchers)]
+                calls.append(('POST', API + 'watch-list/create/',
+                              {'movie_title': 'movie %d' % (movies - 1 - i // len(watchers) % movies)},
+                              tokens[user.pk]))
+            else:
+                user = reviewers[i % len(reviewers)]
+                calls.append(('POST', API + 'review-movie/',
+                              {'movie_title': 'movie %d' % (movies - 1 - i // len(reviewers) % movies),
+                               'review': 'benchmark'}, tokens[user.pk]))
+        else:
+            movie_id = movie_ids[i % len(movie_ids)]
+            calls.append(random.choice([
+                ('GET', API + 'movie-list/?page=%d' % (i % 50 + 1), None, None),
+                ('GET', API + 'moviedetail/%d/' % movie_id, None, None),
+                ('GET', API + 'movie-review-list/?paginate=cursor', None, None),
+            ]))
+    return calls
+
+
+def run_profile(args):
+    """runs in the child process, DJANGO_SETTINGS_MODULE is already set"""
+    import django
+    from django.conf import settings
+    from seed import seed_catalog
+
+    database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+    database.close()
+    settings.DATABASES['default']['NAME'] = database.name
+    django.setup()
+    from django.core.management import call_command
+    from django.core.wsgi import get_wsgi_application
+    from django.db import connection
+
+    try:
+        call_command('migrate', verbosity=0)
+        users = seed_catalog(movies=args.movies, users=args.users, watchlists=5, reviews=2)
+        calls = requests_mix(users, args.movies, args.requests, args.writes)
+        connection.close()
+        application = get_wsgi_application()
+        for method, path, body, token in calls[:args.warmup]:
+            if method == 'GET':
+                call(application, method, path, body, token)
+
+        def timed(request):
+            start = time.perf_counter()
+            try:
+                status = call(application, *request)
+            except Exception:
+                status = 599
+            return request[0], time.perf_counter() - start, status
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads, thread_name_prefix='worker') as pool:
+            results = list(pool.map(timed, calls))
+        elapsed = time.perf_counter() - start
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(database.name + suffix):
+                os.unlink(database.name + suffix)
+
+    summary = {'requests': len(results), 'seconds': elapsed, 'throughput_rps': len(results) / elapsed}
+    for method, kind in (('GET', 'reads'), ('POST', 'writes')):
+        latencies = [latency * 1000 for request_method, latency, _ in results if request_method == method]
+        statuses = [status for request_method, _, status in results if request_method == method]
+        summary[kind] = {
+            'requests': len(latencies),
+            'errors': sum(1 for status in statuses if status >= 500),
+            'p50_ms': percentile(latencies, 50) if latencies else None,
+            'p99_ms': percentile(latencies, 99) if latencies else None,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='*', choices=PROFILES, default=list(PROFILES))
+    parser.add_argument('--movies', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=2000, help='timed requests per profile')
+    parser.add_argument('--writes', type=int, default=20, help='percent of the requests that write')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--output')
+    parser.add_argument('--child', choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_profile(args)))
+        return
+
+    results = {}
+    cache_directory = tempfile.TemporaryDirectory()
+    for profile in args.profiles:
+        environment = dict(os.environ, DJANGO_SETTINGS_MODULE=PROFILES[profile])
+        environment.setdefault('WATCHLIST_SECRET_KEY', 'benchmark-only-secret-key')
+        environment.setdefault('WATCHLIST_ALLOWED_HOSTS', '127.0.0.1')
+        environment.setdefault('WATCHLIST_CACHE_URL', 'file://' + cache_directory.name)
+        output = subprocess.check_output([sys.executable, __file__, '--child', profile] + sys.argv[1:],
+                                         env=environment, cwd=Path(__file__).resolve().parent)
+        results[profile] = result = json.loads(output.decode().strip().splitlines()[-1])
+        print('%-12s %8.1f req/s  reads p50 %7.2f ms p99 %7.2f ms  writes p50 %7.2f ms p99 %7.2f ms  '
+              'errors %d' % (profile, result['throughput_rps'], result['reads']['p50_ms'], result['reads']['p99_ms'],
+                             result['writes']['p50_ms'] or 0, result['writes']['p99_ms'] or 0,
+                             result['reads']['errors'] + result['writes']['errors']), file=sys.stderr)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Memory use and load time of the in-memory catalog snapshot (movie/snapshot.py) against a synthetic catalog:
+
+    python benchmarks/snapshot_memory.py --movies 100000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'watchlist.settings')
+
+import django
+from django.conf import settings
+from seed import seed_catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movies', type=int, default=100000)
+    parser.add_argument('--genres', type=int, default=20)
+    parser.add_argument('--platforms', type=int, default=10)
+    args = parser.parse_args()
+
+    database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+    settings.DATABASES['default']['NAME'] = database.name
+    django.setup()
+    from django.core.management import call_command
+    from movie import snapshot
+
+    try:
+        call_command('migrate', verbosity=0)
+        seed_catalog(movies=args.movies, genres=args.genres, platforms=args.platforms, users=2, watchlists=1,
+                     reviews=1)
+        print(json.dumps(snapshot.measure(), indent=2))
+    finally:
+        os.unlink(database.name)
+
+
+if __name__ == '__main__':
+    main()
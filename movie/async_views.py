@@ -0,0 +1,194 @@
+"""async variants of the hot read endpoints, for deployments served through watchlist/asgi.py
+every db access goes through the async orm (acount, aget, async iteration), token authentication and the
+role checks are done without blocking the event loop, so slow clients don't hold a worker thread
+responses have the same shape as the sync views they mirror, facets and the catalog snapshot included"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views import View
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import APIException
+from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from user.authentication import cached_user, token_cache
+from .models import WatchList, MovieReview
+from .serializers import WatchListSerializer, MovieReviewSerializer
+from .pagination import OptInCursorPagination, AddedAtCursorPagination, KeysetCursorPagination
+from .filters import CatalogFilter
+from .views import CatalogListMixin
+from . import cache as movie_cache
+from . import snapshot
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder)
+
+
+async def authenticate(request):
+    """async counterpart of TokenAuthentication, returns the user or None"""
+    header = request.headers.get('Authorization', '').split()
+    if len(header) != 2 or header[0].lower() != 'token':
+        return None
+    user = cached_user(header[1])
+    if user is None:
+        try:
+            token = await Token.objects.select_related('user').aget(key=header[1])
+        except Token.DoesNotExist:
+            return None
+        user = token.user
+        token_cache.set(header[1], user)
+    return user if user.is_active else None
+
+
+class AsyncListView(View):
+
+    """list endpoint with the filter backends and pagination of the sync ListAPIView it mirrors
+    subclasses set `queryset` and `serializer_class`, or override get_queryset() like AsyncWatchListAPI
+    page number pagination runs on the async orm, ?paginate=cursor is handed to the keyset paginator"""
+
+    queryset = None
+    serializer_class = None
+    pagination_class = OptInCursorPagination
+    filter_backends = (SearchFilter, OrderingFilter)
+    search_fields = ()
+    required_role = None
+
+    def get_queryset(self):
+        assert self.queryset is not None, (
+            "'%s' should either include a `queryset` attribute, or override the `get_queryset()` method."
+            % self.__class__.__name__)
+        return self.queryset.all()
+
+    def get_serializer_class(self):
+        assert self.serializer_class is not None, (
+            "'%s' should either include a `serializer_class` attribute, or override the "
+            "`get_serializer_class()` method." % self.__class__.__name__)
+        return self.serializer_class
+
+    def filter_queryset(self, queryset):
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(self.request, queryset, self)
+        return queryset
+
+    async def get(self, request):
+        self.request = Request(request)
+        if self.required_role is not None:
+            user = await authenticate(request)
+            if user is None:
+                response = json_response({'detail': 'Authentication credentials were not provided.'}, status=401)
+                response['WWW-Authenticate'] = 'Token'
+                return response
+            if user.role != self.required_role:
+                return json_response({'detail': 'user is not %s' % self.required_role}, status=403)
+            self.request.user = user
+        try:
+            return json_response(await self.list())
+        except Http404:
+            return json_response({'detail': 'Invalid page.'}, status=404)
+        except APIException as exc:
+            # the filter backends and the cursor paginator, answered like rest_framework's exception handler
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return json_response(data, status=exc.status_code)
+
+    async def list(self):
+        # the backends can resolve names through movie.cache, which queries on a miss
+        queryset = await sync_to_async(self.filter_queryset)(self.get_queryset())
+
+        if self.request.query_params.get('paginate') == 'cursor':
+            paginator = KeysetCursorPagination()
+            paginator.ordering = self.pagination_class.ordering
+            page = await sync_to_async(paginator.paginate_queryset)(queryset, self.request, self)
+            return paginator.get_paginated_response(self.serialize(page)).data
+        return await self.paginate(queryset)
+
+    async def paginate(self, queryset):
+        data, start, stop = self.get_page(await queryset.acount())
+        data['results'] = self.serialize([item async for item in queryset[start:stop]])
+        return data
+
+    def get_page(self, count):
+        """the count and links of the requested page plus the slice of the items it holds, raises Http404
+        when there is no such page"""
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        try:
+            page_number = int(self.request.query_params.get('page', 1))
+        except ValueError:
+            page_number = 0
+        last_page = max(1, -(-count // page_size))
+        if page_number < 1 or page_number > last_page:
+            raise Http404()
+
+        url = self.request.build_absolute_uri()
+        next_url = replace_query_param(url, 'page', page_number + 1) if page_number < last_page else None
+        previous_url = None
+        if page_number == 2:
+            previous_url = remove_query_param(url, 'page')
+        elif page_number > 2:
+            previous_url = replace_query_param(url, 'page', page_number - 1)
+        start = (page_number - 1) * page_size
+        return {'count': count, 'next': next_url, 'previous': previous_url}, start, start + page_size
+
+    def serialize(self, page):
+        return self.get_serializer_class()(page, many=True).data
+
+
+class AsyncMovieListAPI(CatalogListMixin, AsyncListView):
+
+    async def list(self):
+        ordering = self.get_snapshot_ordering(self.request)
+        # building a snapshot, resolving filter names and counting facets can query
+        catalog = await sync_to_async(snapshot.get)() if ordering else None
+        if catalog is None:
+            data = await super().list()
+        else:
+            filters = await sync_to_async(CatalogFilter().get_filters)(self.request)
+            page = snapshot.Page(catalog, catalog.select(filters, ordering))
+            data, start, stop = self.get_page(len(page))
+            data['results'] = page[start:stop]
+        if self.wants_facets(self.request):
+            data['facets'] = await sync_to_async(self.get_facets)(self.request)
+        return data
+
+
+class AsyncReviewsAPI(AsyncListView):
+    # the serializer prints the movie, so it is joined in instead of loaded per review
+    queryset = MovieReview.objects.select_related('movie').order_by('id')
+    serializer_class = MovieReviewSerializer
+    pagination_class = AddedAtCursorPagination
+    search_fields = ['movie__title']
+
+
+class AsyncWatchListAPI(AsyncListView):
+    serializer_class = WatchListSerializer
+    pagination_class = AddedAtCursorPagination
+    search_fields = ['movie__title']
+    required_role = 'watcher'
+
+    def get_queryset(self):
+        return WatchList.objects.filter(user=self.request.user).select_related('movie').order_by('id')
+
+
+class AsyncMovieDetail(View):
+
+    """same validators and cache as MovieDetail, a matching If-None-Match is answered from the cache"""
+
+    async def get(self, request, pk):
+        etag = await sync_to_async(movie_cache.movie_etag)(pk)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        try:
+            data, last_modified, etag = await movie_cache.aget_movie_detail(pk)
+        except Http404:
+            return json_response({'detail': 'Not found.'}, status=404)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+        if not_modified is not None:
+            return not_modified
+        response = json_response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
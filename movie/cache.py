@@ -0,0 +1,205 @@
+import hashlib
+import threading
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from watchlist.replicas import primary
+from .models import Genre, Movie, StreamPlatform
+
+# genres and stream platforms are small and rarely change, so their lookups are cached on two levels:
+# the django cache (shared between workers) and a dict in this process. every entry is stored under a
+# generation token kept in the django cache, invalidating a table just replaces its token, which makes
+# both levels miss in every process on their next read. entries are always loaded from the primary
+# database, a lagging read replica would otherwise get cached under the new generation
+
+CACHE_TIMEOUT = 60 * 60
+GENRE = 'genre'
+STREAM_PLATFORM = 'stream_platform'
+MOVIE = 'movie:%s'
+REVIEWS = 'reviews:%s'
+# bumped by every change to movies, genres or stream platforms, see movie.snapshot
+CATALOG = 'catalog'
+
+_local = {}
+
+
+def _generation(table):
+    key = 'movie:%s:generation' % table
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        generation = cache.get(key)
+    return generation
+
+
+def _get(table, name, load):
+    generation = _generation(table)
+    local_key = (table, name)
+    entry = _local.get(local_key)
+    if entry is not None and entry[0] == generation:
+        return entry[1]
+
+    key = 'movie:%s:%s:%s' % (table, name, generation)
+    value = cache.get(key)
+    if value is None:
+        with primary():
+            value = load()
+        cache.set(key, value, CACHE_TIMEOUT)
+    _local[local_key] = (generation, value)
+    return value
+
+
+def invalidate(table):
+    cache.set('movie:%s:generation' % table, uuid.uuid4().hex, None)
+
+
+def catalog_version():
+    return _generation(CATALOG)
+
+
+class CatalogLocal:
+
+    """process-local value derived from the catalog, built by build() and rebuilt when the catalog version
+    moves or, with max_age (a callable returning seconds), when it gets too old. one thread rebuilds and
+    swaps the value in with a single assignment, the others keep serving the previous value meanwhile"""
+
+    def __init__(self, build, max_age=None):
+        self.build = build
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.current = None
+
+    def get(self):
+        version = catalog_version()
+        current = self.current
+        if current is not None and current[0] == version and \
+                (self.max_age is None or time.monotonic() - current[1] < self.max_age()):
+            return current[2]
+        if not self.lock.acquire(blocking=current is None):
+            return current[2]
+        try:
+            if self.current is current:
+                with primary():
+                    self.current = (version, time.monotonic(), self.build())
+            return self.current[2]
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.current = None
+
+
+def get_genre_ids():
+    """genre name -> id"""
+    return _get(GENRE, 'ids', lambda: dict(Genre.objects.values_list('name', 'id')))
+
+
+def get_stream_platform_ids():
+    """stream platform name -> id"""
+    return _get(STREAM_PLATFORM, 'ids', lambda: dict(StreamPlatform.objects.values_list('name', 'id')))
+
+
+def get_genre_list():
+    from .serializers import GenreSerializer
+    return _get(GENRE, 'list', lambda: list(GenreSerializer(Genre.objects.all(), many=True).data))
+
+
+def get_stream_platform_list():
+    from .serializers import StreamPlatformSerializer
+    return _get(STREAM_PLATFORM, 'list', lambda: list(StreamPlatformSerializer(
+        StreamPlatform.objects.prefetch_related('available_movie'), many=True).data))
+
+
+# detail payloads are cached per object and versioned by the generations they depend on, a movie also
+# depends on its own generation (bumped on save, delete and relation changes). the etag is derived from
+# the generations alone, so a matching If-None-Match is answered without touching the db or the payload
+
+
+def _etag(*tables):
+    generations = ':'.join(str(_generation(table)) for table in tables)
+    return '"%s"' % hashlib.md5(generations.encode()).hexdigest()
+
+
+def _get_detail(key, load):
+    entry = cache.get(key)
+    if entry is None:
+        with primary():
+            entry = load()
+        cache.set(key, entry, CACHE_TIMEOUT)
+    return entry
+
+
+def movie_etag(pk):
+    return _etag(MOVIE % pk, GENRE, STREAM_PLATFORM)
+
+
+def get_movie_detail(pk):
+    """returns (payload, last modified, etag) for a movie, raises Http404 if it does not exist"""
+    from .serializers import MovieSerializer, MOVIE_PREFETCH
+
+    def load():
+        movie = get_object_or_404(Movie.objects.prefetch_related(*MOVIE_PREFETCH), pk=pk)
+        return dict(MovieSerializer(movie).data), movie.updated_at
+
+    etag = movie_etag(pk)
+    data, last_modified = _get_detail('movie:detail:movie:%s:%s' % (pk, etag), load)
+    return data, last_modified, etag
+
+
+async def aget_movie_detail(pk):
+    """get_movie_detail for async views, the movie is loaded with the async orm on a cache miss"""
+    from .serializers import MovieSerializer, MOVIE_PREFETCH
+
+    etag = await sync_to_async(movie_etag)(pk)
+    key = 'movie:detail:movie:%s:%s' % (pk, etag)
+    entry = await cache.aget(key)
+    if entry is None:
+        try:
+            with primary():
+                movie = await Movie.objects.prefetch_related(*MOVIE_PREFETCH).aget(pk=pk)
+        except Movie.DoesNotExist:
+            raise Http404
+        entry = dict(MovieSerializer(movie).data), movie.updated_at
+        await cache.aset(key, entry, CACHE_TIMEOUT)
+    data, last_modified = entry
+    return data, last_modified, etag
+
+
+def stream_platform_etag(pk):
+    return _etag(STREAM_PLATFORM)
+
+
+def get_stream_platform_detail(pk):
+    """returns (payload, last modified, etag) for a stream platform, raises Http404 if it does not exist"""
+    from .serializers import StreamPlatformSerializer
+
+    def load():
+        stream_platform = get_object_or_404(StreamPlatform.objects.prefetch_related('available_movie'), pk=pk)
+        # platforms have no timestamp, the payload is rebuilt after every change so its build time is used
+        return dict(StreamPlatformSerializer(stream_platform).data), timezone.now()
+
+    etag = stream_platform_etag(pk)
+    data, last_modified = _get_detail('movie:detail:stream_platform:%s:%s' % (pk, etag), load)
+    return data, last_modified, etag
+
+
+def get_review_feed(pk, url, load):
+    """first page of a movie's review feed, versioned by the movie's review generation (bumped on review
+    create, update and delete). the page links depend on the request url, so it is part of the key"""
+    key = 'movie:reviews:%s:%s:%s' % (pk, _generation(REVIEWS % pk), hashlib.md5(url.encode()).hexdigest())
+    return _get_detail(key, load)
+
+
+def invalidate_reviews(movie_ids):
+    for pk in set(movie_ids):
+        invalidate(REVIEWS % pk)
+
+
+def invalidate_movies(pks):
+    for pk in pks:
+        invalidate(MOVIE % pk)
+    invalidate(CATALOG)
@@ -0,0 +1,94 @@
+from django.conf import settings
+from .models import CatalogChange, Genre, Movie, StreamPlatform
+
+# change feed of the catalog for mirrors
+#
+# movie.refresh appends a CatalogChange row for every movie, genre and stream platform that is written or
+# deleted, once the transaction of the write commits.
+# the row id is the sequence number: a mirror keeps the last one it applied and asks for the changes after
+# it. upserts carry the object as it is when the feed is read, so replaying them is idempotent and an
+# object changed several times is simply sent several times.
+# on databases that commit concurrent transactions out of id order (postgresql) a mirror can see a later
+# sequence number before an earlier one commits, reading a few seconds behind the head avoids that
+
+MOVIE = CatalogChange.MOVIE
+GENRE = CatalogChange.GENRE
+STREAM_PLATFORM = CatalogChange.STREAM_PLATFORM
+UPSERT = CatalogChange.UPSERT
+DELETE = CatalogChange.DELETE
+DEFAULTS = {
+    'DEFAULT_LIMIT': 100,
+    'MAX_LIMIT': 1000,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'CHANGELOG', {}).get(name, DEFAULTS[name])
+
+
+def record(kind, object_ids, action=UPSERT):
+    record_changes([((kind, object_id), action) for object_id in object_ids])
+
+
+def record_changes(changes):
+    """appends ((kind, id), action) pairs in one insert"""
+    changes = dict(changes)
+    if changes:
+        CatalogChange.objects.bulk_create([CatalogChange(kind=kind, object_id=object_id, action=action)
+                                           for (kind, object_id), action in changes.items()])
+
+
+class Expired(Exception):
+    """the requested sequence number is older than the oldest change kept, the mirror has to resync"""
+
+
+def payloads(changes):
+    """(kind, id) -> current payload of every upserted object still existing, one query per kind"""
+    from .serializers import MovieSerializer, GenreSerializer, StreamPlatformSerializer, MOVIE_PREFETCH
+
+    ids = {}
+    for change in changes:
+        if change.action == UPSERT:
+            ids.setdefault(change.kind, set()).add(change.object_id)
+    loaders = {
+        MOVIE: (Movie.objects.prefetch_related(*MOVIE_PREFETCH), MovieSerializer),
+        GENRE: (Genre.objects.all(), GenreSerializer),
+        STREAM_PLATFORM: (StreamPlatform.objects.prefetch_related('available_movie'), StreamPlatformSerializer),
+    }
+    result = {}
+    for kind, object_ids in ids.items():
+        queryset, serializer_class = loaders[kind]
+        for instance in queryset.filter(pk__in=object_ids):
+            result[kind, instance.pk] = serializer_class(instance).data
+    return result
+
+
+def changes_since(since, limit):
+    """up to `limit` changes after sequence number `since`, with their payloads, raises Expired when
+    changes after `since` were already pruned"""
+    changes = list(CatalogChange.objects.filter(id__gt=since).order_by('id')[:limit + 1])
+    # since=0 reads from the first change, sequence 1, which is gone too once the log was pruned
+    if not changes or changes[0].id > since + 1:
+        oldest = CatalogChange.objects.order_by('id').values_list('id', flat=True).first()
+        if oldest is not None and oldest > since + 1:
+            raise Expired()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    data = payloads(changes)
+    return [{
+        'sequence': change.id,
+        'kind': change.kind,
+        'id': change.object_id,
+        'action': change.action,
+        'changed_at': change.changed_at,
+        'data': data.get((change.kind, change.object_id)) if change.action == UPSERT else None,
+    } for change in changes], has_more
+
+
+def prune(before):
+    """deletes the changes logged before `before`, the newest change is always kept so later reads can
+    still tell whether a mirror fell behind the pruned range"""
+    newest = CatalogChange.objects.order_by('-id').values_list('id', flat=True).first()
+    if newest is None:
+        return 0
+    return CatalogChange.objects.filter(changed_at__lt=before, id__lt=newest).delete()[0]
@@ -0,0 +1,36 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from .models import Movie, WatchList, MovieReview
+
+# denormalized per movie counters, always changed with an UPDATE ... SET count = count + n so concurrent
+# writers never lose an increment. call them inside the transaction that adds or removes the rows.
+# decrements stop at 0: rows added or removed where the counters are not maintained (the admin, raw sql)
+# make them drift, reconcile_movie_counters brings them back
+
+WATCHLIST = 'watchlist_count'
+REVIEW = 'review_count'
+COUNTED = {WATCHLIST: WatchList, REVIEW: MovieReview}
+
+
+def add(field, movie_ids, amount=1):
+    """movie_ids may repeat, a movie listed n times is changed by n * amount"""
+    by_amount = {}
+    for movie_id in movie_ids:
+        by_amount[movie_id] = by_amount.get(movie_id, 0) + amount
+    grouped = {}
+    for movie_id, total in by_amount.items():
+        grouped.setdefault(total, []).append(movie_id)
+    for total, ids in grouped.items():
+        value = F(field) + total if total > 0 else Greatest(F(field) + total, 0)
+        Movie.objects.filter(pk__in=ids).update(**{field: value})
+
+
+def reconcile():
+    """recounts every counter from its table, returns how many movies had drifted per counter"""
+    drifted = {}
+    for field, model in COUNTED.items():
+        counts = model.objects.filter(movie=OuterRef('pk')).order_by().values('movie').annotate(count=Count('id'))
+        actual = Coalesce(Subquery(counts.values('count')), 0)
+        drifted[field] = Movie.objects.annotate(actual=actual).exclude(**{field: F('actual')}).update(
+            **{field: actual})
+    return drifted
@@ -0,0 +1,120 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from django.db import transaction
+from .models import Genre, Movie, StreamPlatform
+from . import cache as movie_cache
+
+# facet counts for the movie list, served from a bitmap index instead of a GROUP BY per request
+#
+# every movie gets a bit (its position in id order) and every genre and stream platform a python int with
+# the bits of its movies set. runtimes are kept as cumulative bitmaps over the sorted distinct values, so a
+# runtime range is one AND NOT of two of them. a count is then a few big-int ANDs and a popcount, which
+# run in C over 12.5 KB per 100k movies. the index is rebuilt per process when the catalog version moves,
+# reading the movies and both relations in one transaction like the snapshot, so they agree with each other
+
+
+def bitmap(positions, size):
+    buffer = bytearray((size + 7) // 8)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def popcount(bits):
+    # int.bit_count() needs python 3.10
+    return bin(bits).count('1')
+
+
+class FacetIndex:
+
+    __slots__ = ('ids', 'all', 'genres', 'platforms', 'runtime_values', 'runtime_below')
+
+    def __init__(self):
+        with transaction.atomic():
+            rows = list(Movie.objects.order_by('id').values_list('id', 'runtime').iterator(chunk_size=5000))
+            self.ids = array('q', (pk for pk, _ in rows))
+            size = len(rows)
+            self.all = (1 << size) - 1
+            position = {pk: index for index, pk in enumerate(self.ids)}
+
+            by_runtime = {}
+            for index, (_, runtime) in enumerate(rows):
+                by_runtime.setdefault(runtime, []).append(index)
+            self.runtime_values = sorted(by_runtime)
+            # runtime_below[i] has the movies with a runtime lower than runtime_values[i]
+            self.runtime_below = [0]
+            for value in self.runtime_values:
+                self.runtime_below.append(self.runtime_below[-1] | bitmap(by_runtime[value], size))
+
+            self.genres = self._relation(Genre, Movie.genre.through, 'genre_id', position, size)
+            self.platforms = self._relation(StreamPlatform, Movie.stream_platform.through, 'streamplatform_id',
+                                            position, size)
+
+    @staticmethod
+    def _relation(model, through, column, position, size):
+        """(id, name) -> bitmap of its movies, ordered by name"""
+        movies = {}
+        for movie_id, related_id in through.objects.values_list('movie_id', column).iterator(chunk_size=5000):
+            if movie_id in position:
+                movies.setdefault(related_id, []).append(position[movie_id])
+        return {(pk, name): bitmap(movies.get(pk, ()), size)
+                for pk, name in model.objects.order_by('name').values_list('id', 'name')}
+
+    def positions_of(self, movie_ids):
+        positions = []
+        for movie_id in movie_ids:
+            index = bisect_left(self.ids, movie_id)
+            if index < len(self.ids) and self.ids[index] == movie_id:
+                positions.append(index)
+        return bitmap(positions, len(self.ids))
+
+    def _related(self, bitmaps, ids):
+        result = 0
+        for (pk, _), movies in bitmaps.items():
+            if pk in ids:
+                result |= movies
+        return result
+
+    def _runtime(self, low, high):
+        start = bisect_left(self.runtime_values, low) if low is not None else 0
+        end = bisect_right(self.runtime_values, high) if high is not None else len(self.runtime_values)
+        return self.runtime_below[max(start, end)] & ~self.runtime_below[start]
+
+    def counts(self, filters, within=None):
+        """facet counts for the filters of CatalogFilter.get_filters, restricted to the `within` bitmap
+        each facet is counted with every filter but its own, so the other values of a facet keep their
+        counts once one is picked"""
+        masks = {
+            'genre': self._related(self.genres, filters['genre']) if 'genre' in filters else None,
+            'stream_platform': (self._related(self.platforms, filters['stream_platform'])
+                                if 'stream_platform' in filters else None),
+            'runtime': (self._runtime(filters.get('runtime_min'), filters.get('runtime_max'))
+                        if 'runtime_min' in filters or 'runtime_max' in filters else None),
+        }
+
+        def combined(*skip):
+            result = self.all if within is None else within
+            for name, mask in masks.items():
+                if mask is not None and name not in skip:
+                    result &= mask
+            return result
+
+        genre_base, platform_base = combined('genre'), combined('stream_platform')
+        return {
+            'total': popcount(combined()),
+            'genre': [{'id': pk, 'name': name, 'count': popcount(genre_base & movies)}
+                      for (pk, name), movies in self.genres.items()],
+            'stream_platform': [{'id': pk, 'name': name, 'count': popcount(platform_base & movies)}
+                                for (pk, name), movies in self.platforms.items()],
+        }
+
+
+_index = movie_cache.CatalogLocal(FacetIndex)
+
+
+def get():
+    return _index.get()
+
+
+def clear():
+    _index.clear()
@@ -0,0 +1,56 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from .models import Movie
+from . import cache as movie_cache
+
+
+class CatalogFilter(BaseFilterBackend):
+
+    """structured movie filters:
+    ?genre=<name> / ?genre_id=<id>, ?stream_platform=<name> / ?stream_platform_id=<id>, ?runtime_min / ?runtime_max
+    repeat a relation parameter to match any of several values, different parameters must all match.
+    relations are matched through subqueries, so movies are never duplicated by the joins and no DISTINCT
+    is needed"""
+
+    relations = {
+        'genre': (Movie.genre.through, 'genre_id', movie_cache.get_genre_ids),
+        'stream_platform': (Movie.stream_platform.through, 'streamplatform_id', movie_cache.get_stream_platform_ids),
+    }
+    ranges = ('runtime_min', 'runtime_max')
+
+    def get_filters(self, request):
+        """the filters of the request with names resolved to ids, {'genre': {ids}, 'stream_platform': {ids},
+        'runtime_min': int, 'runtime_max': int}, only for the parameters present. an unknown name matches
+        no movie"""
+        params = request.query_params
+        filters = {}
+        for param, (_, _, get_ids) in self.relations.items():
+            names, ids = params.getlist(param), params.getlist(param + '_id')
+            if not names and not ids:
+                continue
+            known = get_ids() if names else {}
+            filters[param] = {known[name] for name in names if name in known} | {
+                self.to_int(param + '_id', value) for value in ids}
+        for param in self.ranges:
+            if params.get(param):
+                filters[param] = self.to_int(param, params[param])
+        return filters
+
+    @staticmethod
+    def to_int(param, value):
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({param: 'must be a number'})
+
+    def filter_queryset(self, request, queryset, view):
+        filters = self.get_filters(request)
+        for param, (through, column, _) in self.relations.items():
+            if param in filters:
+                queryset = queryset.filter(pk__in=through.objects.filter(**{column + '__in': filters[param]})
+                                           .values('movie_id'))
+        if 'runtime_min' in filters:
+            queryset = queryset.filter(runtime__gte=filters['runtime_min'])
+        if 'runtime_max' in filters:
+            queryset = queryset.filter(runtime__lte=filters['runtime_max'])
+        return queryset
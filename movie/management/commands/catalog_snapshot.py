@@ -0,0 +1,10 @@
+import json
+from django.core.management.base import BaseCommand
+from movie import snapshot
+
+
+class Command(BaseCommand):
+    help = 'Loads the in-memory catalog snapshot and reports its load time and memory use'
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(snapshot.measure(), indent=2))
@@ -0,0 +1,29 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from movie.parsers import iter_ndjson
+from movie.serializers import import_reviews, BULK_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = ('Imports reviews from an ndjson file of {"user": <reviewer email>, "movie_title", "review"} rows, '
+            'streamed in batches')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='ndjson file, - reads stdin')
+        parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        stream = sys.stdin.buffer if options['path'] == '-' else open(options['path'], 'rb')
+        try:
+            summary = import_reviews(iter_ndjson(stream), batch_size=options['batch_size'])
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        for error in summary['errors']:
+            self.stderr.write('row %d: %s' % (error['index'], error['error']))
+        self.stdout.write('%d rows, %d created, %d duplicates, %d failed in %.1fs (%.0f rows/s)' % (
+            summary['rows'], summary['created'], summary['duplicates'], summary['failed'], summary['seconds'],
+            summary['rows_per_second']))
+        if 'error' in summary:
+            raise CommandError(summary['error'])
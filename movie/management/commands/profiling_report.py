@@ -0,0 +1,31 @@
+import json
+from django.core.management.base import BaseCommand
+from watchlist import profiling
+
+
+class Command(BaseCommand):
+    help = 'Prints per endpoint latency and query percentiles collected by the profiling middleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sort', default='wall_ms', choices=profiling.METRICS,
+                            help='metric whose p99 orders the endpoints')
+        parser.add_argument('--json', action='store_true', help='print the raw report as json')
+
+    def handle(self, *args, **options):
+        report = profiling.report(profiling.collect())
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        if not report:
+            self.stdout.write('no samples, is PROFILING enabled and a shared cache configured?')
+            return
+
+        sort = options['sort']
+        self.stdout.write('%-45s %8s %10s %10s %8s %10s %6s' % ('view', 'requests', 'p50 ms', 'p99 ms',
+                                                              'queries', 'sql ms', 'dupes'))
+        for view, stats in sorted(report.items(), key=lambda item: -item[1][sort].get('p99', 0)):
+            self.stdout.write('%-45s %8d %10.1f %10.1f %8d %10.1f %6d' % (
+                view, stats['requests'], stats['wall_ms']['p50'], stats['wall_ms']['p99'],
+                stats['queries']['p99'], stats['sql_ms']['p99'], stats['duplicate_queries']['p99']))
+            for similar in stats['n_plus_one']:
+                self.stdout.write('    possible N+1 in %d requests: %s' % (similar['requests'], similar['sql'][:100]))
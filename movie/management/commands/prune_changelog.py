@@ -0,0 +1,15 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from movie import changelog
+
+
+class Command(BaseCommand):
+    help = 'Deletes the catalog changes older than DAYS days, mirrors further behind have to reload the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='keep the changes of the last DAYS days')
+
+    def handle(self, *args, **options):
+        deleted = changelog.prune(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write('%d changes pruned' % deleted)
@@ -0,0 +1,14 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+from movie import trending
+
+
+class Command(BaseCommand):
+    help = 'Moves the trending epoch to today and rescales the scores to it, run it periodically (e.g. monthly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--day', type=date.fromisoformat, help='the new epoch, YYYY-MM-DD, today by default')
+
+    def handle(self, *args, **options):
+        day = trending.rebase(options['day'])
+        self.stdout.write('trending epoch moved to %s' % day)
@@ -0,0 +1,21 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from movie import recommendations
+from movie.models import WatchList
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the "watchlisted together" index behind the similar movies and recommendations endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, metavar='HOURS',
+                            help='only refresh the movies watchlisted in the last HOURS hours')
+
+    def handle(self, *args, **options):
+        movie_ids = None
+        if options['since'] is not None:
+            since = timezone.now() - timedelta(hours=options['since'])
+            movie_ids = set(WatchList.objects.filter(added_at__gte=since).values_list('movie_id', flat=True))
+        rows = recommendations.build(movie_ids)
+        self.stdout.write('%d similar movie rows written' % rows)
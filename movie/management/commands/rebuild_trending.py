@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from movie import trending
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the trending rankings from the watchlist and review tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='only count the activity of the last DAYS days')
+
+    def handle(self, *args, **options):
+        rows = trending.rebuild(options['days'])
+        self.stdout.write('%d rankings rebuilt' % rows)
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from movie import counters
+
+
+class Command(BaseCommand):
+    help = 'Recounts the watchlist and review counters of every movie and fixes the ones that drifted'
+
+    def handle(self, *args, **options):
+        for field, drifted in counters.reconcile().items():
+            self.stdout.write('%s: %d movies fixed' % (field, drifted))
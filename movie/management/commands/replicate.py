@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from watchlist import replicas
+
+
+class Command(BaseCommand):
+    help = 'Copies the primary sqlite database into the read replicas, a stand-in for real replication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='keep copying every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        aliases = replicas.get_setting('ALIASES')
+        if not aliases:
+            raise CommandError('no replicas configured, set DATABASE_REPLICAS or WATCHLIST_REPLICAS')
+        while True:
+            start = time.perf_counter()
+            replicas.replicate()
+            self.stdout.write('%s replicated in %.3fs' % (', '.join(aliases), time.perf_counter() - start))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
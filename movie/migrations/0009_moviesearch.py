@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE movie_moviesearch USING fts5(title, synopsis, genre, stream_platform)')
+    schema_editor.execute("""
+        INSERT INTO movie_moviesearch (rowid, title, synopsis, genre, stream_platform)
+        SELECT m.id, m.title, m.synopsis,
+               (SELECT group_concat(g.name, ' ') FROM movie_movie_genre mg
+                JOIN movie_genre g ON g.id = mg.genre_id WHERE mg.movie_id = m.id),
+               (SELECT group_concat(p.name, ' ') FROM movie_movie_stream_platform mp
+                JOIN movie_streamplatform p ON p.id = mp.streamplatform_id WHERE mp.movie_id = m.id)
+        FROM movie_movie m
+    """)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE movie_moviesearch')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0008_availableplatformsmovie_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
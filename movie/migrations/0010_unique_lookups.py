@@ -0,0 +1,41 @@
+# Generated by Django 4.1.13 on 2026-10-18 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0009_moviesearch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='availableplatformsmovie',
+            name='title',
+            field=models.CharField(max_length=250, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='genre',
+            name='name',
+            field=models.CharField(max_length=80, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='movie',
+            name='title',
+            field=models.CharField(max_length=250, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='streamplatform',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='moviereview',
+            constraint=models.UniqueConstraint(fields=('user', 'movie'), name='unique_moviereview_user_movie'),
+        ),
+        migrations.AddConstraint(
+            model_name='watchlist',
+            constraint=models.UniqueConstraint(fields=('user', 'movie'), name='unique_watchlist_user_movie'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.13 on 2026-10-18 17:14
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing(apps, schema_editor):
+    Movie = apps.get_model('movie', 'Movie')
+    for related, field in (('WatchList', 'watchlist_count'), ('MovieReview', 'review_count')):
+        model = apps.get_model('movie', related)
+        counts = model.objects.filter(movie=OuterRef('pk')).order_by().values('movie').annotate(count=Count('id'))
+        Movie.objects.update(**{field: Coalesce(Subquery(counts.values('count')), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0010_unique_lookups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='watchlist_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.1.13 on 2026-10-18 17:16
+
+from datetime import date
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+# movie.trending's EPOCH and default half life when this was written, a migration can't follow the module as it
+# changes. `manage.py rebuild_trending` recomputes the scores with the current ones
+EPOCH = date(2026, 1, 1)
+HALF_LIFE_DAYS = 7
+
+
+def weight(day):
+    return 2 ** ((day - EPOCH).days / HALF_LIFE_DAYS)
+
+
+def rank_existing(apps, schema_editor):
+    MovieTrend = apps.get_model('movie', 'MovieTrend')
+    rows = []
+    for related, kind in (('WatchList', 'watchlist'), ('MovieReview', 'review')):
+        model = apps.get_model('movie', related)
+        scores = {}
+        for row in model.objects.values('movie', day=TruncDate('added_at')).annotate(count=Count('id')):
+            scores[row['movie']] = scores.get(row['movie'], 0) + row['count'] * weight(row['day'])
+        rows.extend(MovieTrend(kind=kind, movie_id=movie_id, score=score) for movie_id, score in scores.items())
+    MovieTrend.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0011_movie_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieTrend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('watchlist', 'watchlist'), ('review', 'review')], max_length=20)),
+                ('score', models.FloatField(default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='movie.movie')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='movietrend',
+            index=models.Index(fields=['kind', '-score'], name='movietrend_kind_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='movietrend',
+            constraint=models.UniqueConstraint(fields=('kind', 'movie'), name='unique_movietrend_kind_movie'),
+        ),
+        migrations.RunPython(rank_existing, migrations.RunPython.noop),
+    ]
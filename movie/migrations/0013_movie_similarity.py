@@ -0,0 +1,31 @@
+# Generated by Django 4.1.13 on 2026-10-18 17:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0012_movie_trend'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movie.movie')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movie.movie')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='moviesimilarity',
+            index=models.Index(fields=['movie', '-score'], name='moviesimilar_movie_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='moviesimilarity',
+            constraint=models.UniqueConstraint(fields=('movie', 'similar'), name='unique_moviesimilarity_movie_similar'),
+        ),
+    ]
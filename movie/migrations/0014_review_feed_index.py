@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0013_movie_similarity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='moviereview',
+            index=models.Index(fields=['movie', '-added_at'], name='moviereview_movie_added_idx'),
+        ),
+    ]
@@ -3,7 +3,7 @@ from user.models import CustomUser
 
 
 class Genre(models.Model):
-    name = models.CharField(max_length=80)
+    name = models.CharField(max_length=80, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -12,14 +12,14 @@ class Genre(models.Model):
 
 
 class AvailablePlatformsMovie(models.Model):
-    title = models.CharField(max_length=250)
+    title = models.CharField(max_length=250, unique=True)
 
     def __str__(self):
         return self.title
 
 
 class StreamPlatform(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
     description = models.TextField()
     available_movie = models.ManyToManyField(AvailablePlatformsMovie)
 
@@ -28,11 +28,14 @@ class StreamPlatform(models.Model):
 
 
 class Movie(models.Model):
-    title = models.CharField(max_length=250)
+    title = models.CharField(max_length=250, unique=True)
     genre = models.ManyToManyField(Genre)
     synopsis = models.TextField()
     runtime = models.IntegerField()
     stream_platform = models.ManyToManyField(StreamPlatform)
+    # maintained by movie.counters when watchlist entries and reviews are added or removed
+    watchlist_count = models.PositiveIntegerField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -45,6 +48,11 @@ class WatchList(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'movie'], name='unique_watchlist_user_movie'),
+        ]
+
     def __str__(self):
         return self.movie
 
@@ -55,5 +63,89 @@ class MovieReview(models.Model):
     review = models.TextField()
     added_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'movie'], name='unique_moviereview_user_movie'),
+        ]
+        indexes = [
+            # per movie review feed, newest first
+            models.Index(fields=['movie', '-added_at'], name='moviereview_movie_added_idx'),
+        ]
+
     def __str__(self):
         return self.movie
+
+
+class MovieTrend(models.Model):
+
+    """precomputed ranking row maintained by movie.trending, one per movie and kind of activity"""
+
+    WATCHLIST = 'watchlist'
+    REVIEW = 'review'
+    KINDS = [(WATCHLIST, 'watchlist'), (REVIEW, 'review')]
+
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KINDS)
+    score = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'movie'], name='unique_movietrend_kind_movie'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', '-score'], name='movietrend_kind_score_idx'),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.kind, self.movie_id)
+
+
+class TrendEpoch(models.Model):
+
+    """the day the MovieTrend scores are relative to, a single row moved forward by movie.trending.rebase"""
+
+    day = models.DateField()
+
+    def __str__(self):
+        return str(self.day)
+
+
+class MovieSimilarity(models.Model):
+
+    """top-N item-item index built by movie.recommendations, `similar` was watchlisted with `movie`"""
+
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    similar = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'similar'], name='unique_moviesimilarity_movie_similar'),
+        ]
+        indexes = [
+            models.Index(fields=['movie', '-score'], name='moviesimilar_movie_score_idx'),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.movie_id, self.similar_id)
+
+
+class CatalogChange(models.Model):
+
+    """append-only log of catalog writes kept by movie.changelog, the id is the sequence number of the feed"""
+
+    MOVIE = 'movie'
+    GENRE = 'genre'
+    STREAM_PLATFORM = 'stream_platform'
+    KINDS = [(MOVIE, 'movie'), (GENRE, 'genre'), (STREAM_PLATFORM, 'stream platform')]
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ACTIONS = [(UPSERT, 'upsert'), (DELETE, 'delete')]
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '%s %s %s' % (self.action, self.kind, self.object_id)
@@ -0,0 +1,140 @@
+from base64 import b64decode
+from urllib import parse
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination, Cursor
+
+
+class KeysetCursorPagination(CursorPagination):
+
+    """cursor pagination over the whole (ordering..., id) key, no OFFSET and no COUNT(*)
+    the ordering always ends with the primary key and the cursor holds the value of every ordering field
+    of the row it points at, pages continue with `(f1 < v1) or (f1 = v1 and id < i)`, so rows sharing
+    created_at are neither skipped nor repeated and pages stay stable while rows are being inserted.
+    ordering fields must not be null, the cursor of a null can't be compared"""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        for index, field in enumerate(ordering):
+            if field.lstrip('-') in ('id', 'pk'):
+                # the primary key is unique, fields after it never decide the order
+                return ordering[:index + 1]
+        return ordering + (('-id',) if ordering[0].startswith('-') else ('id',))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(_keyset_filter(ordering, position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # one row more tells whether a page follows
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering) if self.page else \
+            self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering) if self.page else \
+            self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'), keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        position = tokens.get('p')
+        # a cursor of another ordering, or of the offset based pagination, doesn't point at a row here
+        if position is None or len(position) != len(self.ordering) or 'o' in tokens:
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=reverse, position=tuple(position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        position = []
+        for field in ordering:
+            name = field.lstrip('-')
+            position.append(str(instance[name] if isinstance(instance, dict) else getattr(instance, name)))
+        return position
+
+
+def _reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+
+
+def _keyset_filter(ordering, position):
+    """rows after `position` in `ordering`, compared field by field like a tuple"""
+    query = Q()
+    equal = {}
+    for field, value in zip(ordering, position):
+        name = field.lstrip('-')
+        query |= Q(**equal, **{name + ('__lt' if field.startswith('-') else '__gt'): value})
+        equal[name] = value
+    return query
+
+
+class OptInCursorPagination(PageNumberPagination):
+
+    """page number pagination by default, ?paginate=cursor switches the request to keyset pagination
+    the next/previous links keep the paginate parameter so clients only opt in on the first request"""
+
+    cursor_query_value = 'cursor'
+    ordering = '-created_at'
+
+    def __init__(self):
+        self.cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get('paginate') == self.cursor_query_value:
+            self.cursor_paginator = KeysetCursorPagination()
+            self.cursor_paginator.ordering = self.ordering
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class AddedAtCursorPagination(OptInCursorPagination):
+    ordering = '-added_at'
+
+
+class ReviewFeedPagination(KeysetCursorPagination):
+    ordering = '-added_at'
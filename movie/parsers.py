@@ -0,0 +1,38 @@
+import json
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+def iter_ndjson(lines, encoding='utf-8'):
+    """yields the objects of newline delimited json lines (bytes), blank lines are skipped so trailing
+    newlines are accepted, raises ParseError on the first invalid line"""
+    for line_number, line in enumerate(lines, start=1):
+        line = line.decode(encoding).strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ParseError('NDJSON parse error on line %d - %s' % (line_number, e))
+
+
+class NDJSONParser(BaseParser):
+
+    """parses newline delimited json, one object per line, into a list of objects"""
+
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        return list(iter_ndjson(stream, parser_context.get('encoding', settings.DEFAULT_CHARSET)))
+
+
+class StreamingNDJSONParser(NDJSONParser):
+
+    """NDJSONParser that hands the view an iterator, lines are read from the request body as the view
+    consumes them so large uploads are never held in memory, parse errors surface while iterating"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        return iter_ndjson(stream, parser_context.get('encoding', settings.DEFAULT_CHARSET))
@@ -0,0 +1,103 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+from itertools import groupby, islice
+from operator import itemgetter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from .models import Movie, MovieSimilarity, WatchList
+
+# "watchlisted together" recommendations from an item-item index
+#
+# the watchlist table is a sparse user x movie matrix, build() walks it once grouped by user and counts every
+# pair of movies that share a user (the sparse product of the matrix with its transpose, kept as one Counter
+# per movie). a pair scores its cosine similarity, co-occurrences / sqrt(watchlists of a * watchlists of b),
+# blended with the jaccard overlap of their genres. only the TOP_N best pairs per movie are stored, so the
+# index stays O(movies * TOP_N) and a request reads a handful of rows through the (movie, -score) index
+
+DEFAULTS = {
+    'TOP_N': 20,
+    # share of the score that comes from genre overlap, the rest is watchlist co-occurrence
+    'GENRE_WEIGHT': 0.2,
+    # most recent entries of a user that are paired, a user's cost is quadratic in it
+    'MAX_ITEMS_PER_USER': 500,
+    'DEFAULT_LIMIT': 10,
+    'MAX_LIMIT': 50,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'RECOMMENDATIONS', {}).get(name, DEFAULTS[name])
+
+
+def co_occurrences(movie_ids=None):
+    """movie -> Counter of the movies watchlisted by the same users, only for movie_ids when given"""
+    entries = WatchList.objects.order_by('user_id', '-added_at')
+    targets = None
+    if movie_ids is not None:
+        targets = set(movie_ids)
+        entries = entries.filter(user__in=WatchList.objects.filter(movie_id__in=targets).values('user'))
+    max_items = get_setting('MAX_ITEMS_PER_USER')
+    pairs = defaultdict(Counter)
+    rows = entries.values_list('user_id', 'movie_id').iterator(chunk_size=2000)
+    for _, group in groupby(rows, key=itemgetter(0)):
+        movies = [movie_id for _, movie_id in islice(group, max_items)]
+        for movie_id in movies:
+            if targets is None or movie_id in targets:
+                pairs[movie_id].update(other for other in movies if other != movie_id)
+    return pairs
+
+
+def build(movie_ids=None):
+    """rebuilds the index, or only the lists of movie_ids, and returns how many rows were written
+    a partial build refreshes those movies' own lists, the other movies pick up the change on the next full one"""
+    pairs = co_occurrences(movie_ids)
+    popularity = dict(Movie.objects.values_list('id', 'watchlist_count'))
+    genres = defaultdict(set)
+    for movie_id, genre_id in Movie.genre.through.objects.values_list('movie_id', 'genre_id').iterator():
+        genres[movie_id].add(genre_id)
+    genre_weight = get_setting('GENRE_WEIGHT')
+
+    def score(movie_id, other, together):
+        # counters that drifted below the co-occurrence count must not push the cosine above 1
+        cosine = together / math.sqrt(max(popularity.get(movie_id, 0), together) *
+                                      max(popularity.get(other, 0), together))
+        shared = genres[movie_id] | genres[other]
+        overlap = len(genres[movie_id] & genres[other]) / len(shared) if shared else 0
+        return (1 - genre_weight) * cosine + genre_weight * overlap
+
+    rows = []
+    for movie_id, others in pairs.items():
+        best = heapq.nlargest(get_setting('TOP_N'), ((score(movie_id, other, together), other)
+                                                     for other, together in others.items()))
+        rows.extend(MovieSimilarity(movie_id=movie_id, similar_id=other, score=value) for value, other in best)
+    with transaction.atomic():
+        stale = MovieSimilarity.objects.all()
+        if movie_ids is not None:
+            stale = stale.filter(movie_id__in=movie_ids)
+        stale.delete()
+        MovieSimilarity.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def similar(movie_id, limit):
+    """movies most often watchlisted with movie_id, each with its similarity in `score`"""
+    rows = MovieSimilarity.objects.filter(movie_id=movie_id).select_related('similar')
+    rows = rows.order_by('-score', 'similar')[:limit]
+    movies = []
+    for row in rows:
+        row.similar.score = round(row.score, 4)
+        movies.append(row.similar)
+    return movies
+
+
+def for_user(user, limit):
+    """movies the user has not watchlisted yet, ranked by their summed similarity to the user's watchlist"""
+    watched = WatchList.objects.filter(user=user).values('movie')
+    ranked = list(MovieSimilarity.objects.filter(movie__in=watched).exclude(similar__in=watched)
+                  .values('similar').annotate(total=Sum('score')).order_by('-total', 'similar')[:limit])
+    movies = Movie.objects.in_bulk([row['similar'] for row in ranked])
+    for row in ranked:
+        movies[row['similar']].score = round(row['total'], 4)
+    return [movies[row['similar']] for row in ranked]
@@ -0,0 +1,125 @@
+import logging
+import threading
+from django.db import transaction
+from django.utils import timezone
+from .models import Movie
+from . import search, changelog
+from . import cache as movie_cache
+
+# side effects of catalog writes, batched per transaction
+#
+# the signals in movie.signals and the bulk write paths only note what changed. once the transaction
+# commits, the batch is flushed a single time: the search index, updated_at bump and change log of every
+# changed movie are written in one short transaction, then the cache generations are bumped. bumping them
+# after the commit matters, a reader between the bump and the commit would load the old rows and cache them
+# under the new generation. outside a transaction the batch is flushed right away
+#
+# a crash between the commit and the flush loses the refresh, search.rebuild_index() and a mirror reload
+# repair it. so does an error in the flush: it runs after the write committed, raising there would answer a
+# write that succeeded with a 500, so it is logged instead and the cache generations are still bumped
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+
+
+class Batch:
+
+    def __init__(self):
+        # movies saved (their updated_at is current), whose relations changed, and deleted
+        self.saved = set()
+        self.touched = set()
+        self.deleted = set()
+        # (kind, id) -> action of the genres and stream platforms, in order of their last change
+        self.related = {}
+        self.tables = set()
+        self.reviews = set()
+
+    def flush(self):
+        if getattr(_local, 'batch', None) is self:
+            _local.batch = None
+        movie_ids = self.saved | self.touched | self.deleted
+        try:
+            self.write(movie_ids)
+        except Exception:
+            logger.exception('refreshing the search index and change log of movies %s failed', sorted(movie_ids))
+        try:
+            self.invalidate(movie_ids)
+        except Exception:
+            logger.exception('bumping the cache generations failed')
+
+    def write(self, movie_ids):
+        if movie_ids or self.related:
+            with transaction.atomic():
+                # a savepoint rolled back after a delete leaves the movie in place
+                existing = movie_ids - self.deleted
+                if self.deleted:
+                    existing |= set(Movie.objects.filter(pk__in=self.deleted).values_list('pk', flat=True))
+                if self.touched - self.saved:
+                    # relation changes don't save the movie, updated_at is bumped here to keep Last-Modified honest
+                    Movie.objects.filter(pk__in=self.touched - self.saved).update(updated_at=timezone.now())
+                search.index_movies(movie_ids)
+                changes = list(self.related.items())
+                changes += [((changelog.MOVIE, pk), changelog.UPSERT if pk in existing else changelog.DELETE)
+                            for pk in sorted(movie_ids)]
+                changelog.record_changes(changes)
+
+    def invalidate(self, movie_ids):
+        if movie_ids:
+            movie_cache.invalidate_movies(movie_ids)
+        for table in self.tables:
+            movie_cache.invalidate(table)
+        movie_cache.invalidate_reviews(self.reviews)
+
+
+def _batch():
+    """the batch of the current transaction, registered to flush when it commits"""
+    connection = transaction.get_connection()
+    batch = getattr(_local, 'batch', None)
+    # a rolled back transaction or savepoint drops its on_commit callbacks, and the batch with them
+    if batch is None or not any(entry[1] == batch.flush for entry in connection.run_on_commit):
+        batch = Batch()
+        if connection.in_atomic_block:
+            _local.batch = batch
+            transaction.on_commit(batch.flush)
+    return batch
+
+
+def _flush_outside_transaction(batch):
+    if not transaction.get_connection().in_atomic_block:
+        batch.flush()
+
+
+def movies_saved(movie_ids):
+    batch = _batch()
+    batch.saved.update(movie_ids)
+    batch.deleted.difference_update(movie_ids)
+    _flush_outside_transaction(batch)
+
+
+def movies_touched(movie_ids):
+    """movies whose genres or stream platforms changed"""
+    batch = _batch()
+    batch.touched.update(movie_ids)
+    _flush_outside_transaction(batch)
+
+
+def movies_deleted(movie_ids):
+    batch = _batch()
+    batch.deleted.update(movie_ids)
+    _flush_outside_transaction(batch)
+
+
+def related_changed(kind, object_ids, action=changelog.UPSERT, tables=()):
+    """genres or stream platforms written or deleted, `tables` are the cache generations to bump"""
+    batch = _batch()
+    for object_id in object_ids:
+        batch.related.pop((kind, object_id), None)
+        batch.related[kind, object_id] = action
+    batch.tables.update(tables)
+    _flush_outside_transaction(batch)
+
+
+def reviews_changed(movie_ids):
+    batch = _batch()
+    batch.reviews.update(movie_ids)
+    _flush_outside_transaction(batch)
@@ -0,0 +1,87 @@
+from django.db import connection
+from rest_framework.filters import SearchFilter
+from .models import Genre, Movie, StreamPlatform
+
+# full text index over movie title, synopsis, genre names and platform names, the rowid is the movie id
+# the table is created by migration 0009 and only exists on sqlite, everywhere else search falls back to SearchFilter
+SEARCH_TABLE = 'movie_moviesearch'
+
+
+def is_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def _index_sql(where):
+    return """
+        INSERT INTO {search} (rowid, title, synopsis, genre, stream_platform)
+        SELECT m.id, m.title, m.synopsis,
+               (SELECT group_concat(g.name, ' ') FROM {movie_genre} mg
+                JOIN {genre} g ON g.id = mg.genre_id WHERE mg.movie_id = m.id),
+               (SELECT group_concat(p.name, ' ') FROM {movie_platform} mp
+                JOIN {platform} p ON p.id = mp.streamplatform_id WHERE mp.movie_id = m.id)
+        FROM {movie} m {where}
+    """.format(search=SEARCH_TABLE, movie=Movie._meta.db_table, genre=Genre._meta.db_table,
+               platform=StreamPlatform._meta.db_table, movie_genre=Movie.genre.through._meta.db_table,
+               movie_platform=Movie.stream_platform.through._meta.db_table, where=where)
+
+
+def index_movies(movie_ids):
+    """(re)indexes the given movies from their current rows"""
+    movie_ids = list(movie_ids)
+    if not is_enabled() or not movie_ids:
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(movie_ids), 500):
+            chunk = movie_ids[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (SEARCH_TABLE, placeholders), chunk)
+            cursor.execute(_index_sql('WHERE m.id IN (%s)' % placeholders), chunk)
+
+
+def unindex_movies(movie_ids):
+    movie_ids = list(movie_ids)
+    if not is_enabled() or not movie_ids:
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(movie_ids), 500):
+            chunk = movie_ids[start:start + 500]
+            cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (SEARCH_TABLE, ', '.join(['%s'] * len(chunk))),
+                           chunk)
+
+
+def rebuild_index():
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % SEARCH_TABLE)
+        cursor.execute(_index_sql(''))
+
+
+def to_match_query(search_terms):
+    # every term is quoted so user input can't inject fts5 syntax, the trailing * makes it a prefix match
+    return ' '.join('"%s"*' % term.replace('"', '""') for term in search_terms)
+
+
+def search_movies(queryset, search_terms):
+    """filters the movie queryset down to the full text matches, best bm25 rank first
+    the index is joined once, so sqlite runs the MATCH a single time and looks the movies up by id"""
+    match = to_match_query(search_terms)
+    return queryset.extra(
+        tables=[SEARCH_TABLE],
+        where=['%s.rowid = %s.id' % (SEARCH_TABLE, Movie._meta.db_table), '%s MATCH %%s' % SEARCH_TABLE],
+        params=[match],
+        select={'search_rank': 'bm25(%s)' % SEARCH_TABLE},
+    ).order_by('search_rank', 'id')
+
+
+class FullTextSearchFilter(SearchFilter):
+
+    """SearchFilter backed by the fts5 index, the view's search_fields are only used by the fallback"""
+
+    def filter_queryset(self, request, queryset, view):
+        if not is_enabled():
+            return super().filter_queryset(request, queryset, view)
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        return search_movies(queryset, search_terms)
@@ -1,6 +1,16 @@
+import time
+from contextlib import contextmanager
+from itertools import islice
+from operator import attrgetter
 from rest_framework import serializers
 from rest_framework import permissions
+from rest_framework.exceptions import ParseError
+from rest_framework.fields import empty
+from django.db import IntegrityError, transaction
+from user.models import CustomUser
 from .models import *
+from . import counters, refresh, trending
+from . import cache as movie_cache
 
 
 class IsWatcher(permissions.BasePermission):
@@ -28,12 +38,15 @@ class GenreSerializer(serializers.ModelSerializer):
     class Meta:
         model = Genre
         fields = ['name']
+        # uniqueness is enforced by the database, the views turn the IntegrityError into a 400
+        extra_kwargs = {'name': {'validators': []}}
 
 
 class AvailablePlatformsMovieSerializer(serializers.ModelSerializer):
     class Meta:
         model = AvailablePlatformsMovie
         fields = ['id', 'title']
+        extra_kwargs = {'title': {'validators': []}}
 
 
 class StreamPlatformSerializer(serializers.ModelSerializer):
@@ -43,43 +56,52 @@ class StreamPlatformSerializer(serializers.ModelSerializer):
         model = StreamPlatform
         fields = ['id', 'name', 'description', 'available_movie']
         extra_kwargs = {
+            'name': {'validators': []},
             'description': {'required': False},
             'available_movie': {'required': False},
         }
 
     def create(self, validated_data):
-        available_movies_data = validated_data.pop('available_movie')
-        available_movies = []
-        for available_movie_data in available_movies_data:
-            try:
-                available_movie = AvailablePlatformsMovie.objects.get(title=available_movie_data['title'])
-                if available_movie in available_movies:
-                    raise serializers.ValidationError('movie was already added to this platform')
-            except AvailablePlatformsMovie.DoesNotExist:
-                available_movie = AvailablePlatformsMovie.objects.create(title=available_movie_data['title'])
-            available_movies.append(available_movie)
-        av_movie = StreamPlatform.objects.create(**validated_data)
+        available_movies = self.get_available_movies(validated_data.pop('available_movie'))
+        with self.name_conflict():
+            av_movie = StreamPlatform.objects.create(**validated_data)
         av_movie.available_movie.set(available_movies)
         return av_movie
 
     def update(self, instance, validated_data):
-        available_movies_data = validated_data.pop('available_movie')
-        available_movies = []
-        for available_movie_data in available_movies_data:
-            try:
-                available_movie = AvailablePlatformsMovie.objects.get(title=available_movie_data['title'])
-                if available_movie in available_movies:
-                    raise serializers.ValidationError('movie was already added to this platform')
-            except AvailablePlatformsMovie.DoesNotExist:
-                available_movie = AvailablePlatformsMovie.objects.create(title=available_movie_data['title'])
-            available_movies.append(available_movie)
-
+        available_movies = self.get_available_movies(validated_data.pop('available_movie'))
         instance.name = validated_data.get('name', instance.name)
         instance.description = validated_data.get('description', instance.description)
-        instance.save()
+        with self.name_conflict():
+            instance.save()
         instance.available_movie.set(available_movies)
         return instance
 
+    @staticmethod
+    def get_available_movies(available_movies_data):
+        available_movies = []
+        for available_movie_data in available_movies_data:
+            # a title inserted concurrently is fetched again by get_or_create instead of failing
+            available_movie, _ = AvailablePlatformsMovie.objects.get_or_create(title=available_movie_data['title'])
+            if available_movie in available_movies:
+                raise serializers.ValidationError('movie was already added to this platform')
+            available_movies.append(available_movie)
+        return available_movies
+
+    @staticmethod
+    @contextmanager
+    def name_conflict():
+        """a platform of the same name inserted since the view checked, reported on the name field"""
+        try:
+            with transaction.atomic():
+                yield
+        except IntegrityError:
+            raise serializers.ValidationError({'name': ['stream platform already exist']})
+
+
+# relations MovieSerializer reads, querysets it serializes should prefetch these
+MOVIE_PREFETCH = ('genre', 'stream_platform', 'stream_platform__available_movie')
+
 
 class MovieSerializer(serializers.ModelSerializer):
     genre = GenreSerializer(many=True)
@@ -88,44 +110,40 @@ class MovieSerializer(serializers.ModelSerializer):
     class Meta:
         model = Movie
         fields = ['id', 'title', 'genre', 'synopsis', 'runtime', 'stream_platform']
+        extra_kwargs = {'title': {'validators': []}}
 
     def validate(self, data):
         if len(data['title']) < 3:
             raise serializers.ValidationError("title should have at least 3 letters")
         return data
 
-    def create(self, validated_data):
-
-        title = validated_data['title']
-        stream_platforms_data = validated_data['stream_platform']
-        for platform_data in stream_platforms_data:
-
-            try:
-                stream_platform = StreamPlatform.objects.get(name=platform_data['name'])
-            except StreamPlatform.DoesNotExist:
-                raise serializers.ValidationError("stream platform does not exist")
-            if not stream_platform.available_movie.filter(title=title).exists():
-                raise serializers.ValidationError("this movie does not exist on the specified streaming platform")
-
-        genres_data = validated_data.pop('genre')
-        genres = []
+    def _get_genres(self, genres_data):
+        genre_ids = movie_cache.get_genre_ids()
         for genre_data in genres_data:
+            if genre_data['name'] not in genre_ids:
+                raise serializers.ValidationError("invalid Genre: %s" % genre_data['name'])
+        return [genre_ids[genre_data['name']] for genre_data in genres_data]
+
+    def _get_stream_platforms(self, platforms_data, title, unavailable_message):
+        # names come from the cached name -> id map, the availability of the movie is checked in a single query
+        stream_platform_ids = movie_cache.get_stream_platform_ids()
+        for platform_data in platforms_data:
+            if platform_data['name'] not in stream_platform_ids:
+                raise serializers.ValidationError("stream platform does not exist: %s" % platform_data['name'])
+        ids = [stream_platform_ids[platform_data['name']] for platform_data in platforms_data]
+        available = set(StreamPlatform.available_movie.through.objects.filter(
+            streamplatform_id__in=ids, availableplatformsmovie__title=title).values_list('streamplatform_id', flat=True))
+        for platform_data, platform_id in zip(platforms_data, ids):
+            if platform_id not in available:
+                raise serializers.ValidationError("%s: %s" % (unavailable_message, platform_data['name']))
+        return ids
 
-            try:
-                genre = Genre.objects.get(name=genre_data['name'])
-            except Genre.DoesNotExist:
-                raise serializers.ValidationError("invalid Genre")
-            genres.append(genre)
-
-        stream_platforms_data = validated_data.pop('stream_platform')
-        stream_platforms = []
-        for platform_data in stream_platforms_data:
+    def create(self, validated_data):
 
-            try:
-                stream_platform = StreamPlatform.objects.get(name=platform_data['name'])
-            except StreamPlatform.DoesNotExist:
-                raise serializers.ValidationError("stream platform does not exist")
-            stream_platforms.append(stream_platform)
+        title = validated_data['title']
+        stream_platforms = self._get_stream_platforms(validated_data.pop('stream_platform'), title,
+                                                      "this movie does not exist on the specified streaming platform")
+        genres = self._get_genres(validated_data.pop('genre'))
 
         movie = Movie.objects.create(**validated_data)
         movie.genre.set(genres)
@@ -135,35 +153,9 @@ class MovieSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
 
         title = validated_data.get('title', instance.title)
-        stream_platforms_data = validated_data.get('stream_platform', instance.stream_platform.all())
-        for platform_data in stream_platforms_data:
-
-            try:
-                stream_platform = StreamPlatform.objects.get(name=platform_data['name'])
-            except StreamPlatform.DoesNotExist:
-                raise serializers.ValidationError("stream platform does not exist")
-            if not stream_platform.available_movie.filter(title=title).exists():
-                raise serializers.ValidationError("this movie is not available on this platform you specified")
-
-        genres_data = validated_data.pop('genre')
-        genres = []
-        for genre_data in genres_data:
-
-            try:
-                genre = Genre.objects.get(name=genre_data['name'])
-            except Genre.DoesNotExist:
-                raise serializers.ValidationError("invalid Genre")
-            genres.append(genre)
-
-        stream_platforms_data = validated_data.pop('stream_platform')
-        stream_platforms = []
-        for platform_data in stream_platforms_data:
-
-            try:
-                stream_platform = StreamPlatform.objects.get(name=platform_data['name'])
-            except StreamPlatform.DoesNotExist:
-                raise serializers.ValidationError("stream platform does not exist")
-            stream_platforms.append(stream_platform)
+        stream_platforms = self._get_stream_platforms(validated_data.pop('stream_platform'), title,
+                                                      "this movie is not available on this platform you specified")
+        genres = self._get_genres(validated_data.pop('genre'))
 
         instance.title = title
         instance.synopsis = validated_data.get('synopsis', instance.synopsis)
@@ -174,6 +166,26 @@ class MovieSerializer(serializers.ModelSerializer):
         return instance
 
 
+class MovieListSerializer(MovieSerializer):
+
+    """MovieSerializer plus the denormalized counters, which are also valid ?ordering= fields"""
+
+    class Meta(MovieSerializer.Meta):
+        fields = MovieSerializer.Meta.fields + ['watchlist_count', 'review_count']
+        read_only_fields = ['watchlist_count', 'review_count']
+
+
+class RankedMovieSerializer(serializers.ModelSerializer):
+
+    """score is set by the ranking that picked the movie, trending.top or movie.recommendations"""
+
+    score = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Movie
+        fields = ['id', 'title', 'watchlist_count', 'review_count', 'score']
+
+
 class WatchListSerializer(serializers.ModelSerializer):
     movie = serializers.StringRelatedField()
 
@@ -190,3 +202,214 @@ class MovieReviewSerializer(serializers.ModelSerializer):
         fields = ['id', 'movie', 'review']
 
 
+class MovieReviewFeedSerializer(MovieReviewSerializer):
+
+    """review with its author and date, querysets should select_related('movie', 'user')"""
+
+    user = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta(MovieReviewSerializer.Meta):
+        fields = ['id', 'movie', 'user', 'review', 'added_at']
+
+
+BULK_BATCH_SIZE = 500
+
+
+def _chunks(items, size=BULK_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def bulk_create_movies(rows):
+
+    """validates and inserts many movies at once, returns one result per row
+    genres, platforms and platform availability are preloaded into maps so a row costs no queries,
+    valid movies and their genre/platform links are then written with bulk_create in one transaction
+    invalid rows are reported and skipped, they do not abort the rest of the batch"""
+
+    results = [None] * len(rows)
+    candidates = []
+    for index, row in enumerate(rows):
+        serializer = MovieSerializer(data=row)
+        if not serializer.is_valid():
+            results[index] = {'index': index, 'status': 'error', 'error': serializer.errors}
+            continue
+        candidates.append((index, serializer.validated_data))
+
+    titles = list({data['title'] for _, data in candidates})
+    existing_titles = set()
+    for titles_chunk in _chunks(titles):
+        existing_titles.update(Movie.objects.filter(title__in=titles_chunk).values_list('title', flat=True))
+    genres = movie_cache.get_genre_ids()
+    stream_platforms = movie_cache.get_stream_platform_ids()
+    available = set()
+    availability_through = StreamPlatform.available_movie.through
+    for titles_chunk in _chunks(titles):
+        available.update(availability_through.objects.filter(availableplatformsmovie__title__in=titles_chunk)
+                         .values_list('streamplatform_id', 'availableplatformsmovie__title'))
+
+    valid = []
+    for index, data in candidates:
+        title = data['title']
+        try:
+            if title in existing_titles:
+                raise serializers.ValidationError('movie already exist')
+            platform_ids = []
+            for platform_data in data['stream_platform']:
+                if platform_data['name'] not in stream_platforms:
+                    raise serializers.ValidationError("stream platform does not exist: %s" % platform_data['name'])
+                platform_id = stream_platforms[platform_data['name']]
+                if (platform_id, title) not in available:
+                    raise serializers.ValidationError("this movie does not exist on the specified streaming platform: %s"
+                                                      % platform_data['name'])
+                platform_ids.append(platform_id)
+            genre_ids = []
+            for genre_data in data['genre']:
+                if genre_data['name'] not in genres:
+                    raise serializers.ValidationError("invalid Genre: %s" % genre_data['name'])
+                genre_ids.append(genres[genre_data['name']])
+        except serializers.ValidationError as e:
+            results[index] = {'index': index, 'title': title, 'status': 'error', 'error': e.detail}
+            continue
+        existing_titles.add(title)
+        movie = Movie(title=title, synopsis=data['synopsis'], runtime=data['runtime'])
+        valid.append((index, movie, set(genre_ids), set(platform_ids)))
+
+    with transaction.atomic():
+        movies = Movie.objects.bulk_create([movie for _, movie, _, _ in valid], batch_size=BULK_BATCH_SIZE)
+        genre_through = Movie.genre.through
+        platform_through = Movie.stream_platform.through
+        genre_through.objects.bulk_create(
+            [genre_through(movie_id=movie.pk, genre_id=genre_id)
+             for movie, (_, _, genre_ids, _) in zip(movies, valid) for genre_id in genre_ids],
+            batch_size=BULK_BATCH_SIZE)
+        platform_through.objects.bulk_create(
+            [platform_through(movie_id=movie.pk, streamplatform_id=platform_id)
+             for movie, (_, _, _, platform_ids) in zip(movies, valid) for platform_id in platform_ids],
+            batch_size=BULK_BATCH_SIZE)
+        # bulk_create sends no signals, the search index, change log and catalog version are refreshed here
+        refresh.movies_saved([movie.pk for movie in movies])
+
+    for index, movie, _, _ in valid:
+        results[index] = {'index': index, 'title': movie.title, 'status': 'created', 'id': movie.pk}
+    return results
+
+
+MAX_REPORTED_ERRORS = 100
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _resolve(known, queryset, field, values):
+    """adds value -> id to `known` for the values not looked up yet, values that do not exist map to None"""
+    missing = [value for value in values if value not in known]
+    for missing_chunk in _chunks(missing):
+        known.update(dict.fromkeys(missing_chunk))
+        known.update(queryset.filter(**{field + '__in': missing_chunk}).values_list(field, 'id'))
+
+
+def insert_new(model, objects, fields):
+    """bulk inserts the objects and returns those inserted, the ones another writer inserted first since they
+    were checked (same values of the unique `fields`) are skipped. call it inside a transaction"""
+    while objects:
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(objects)
+            break
+        except IntegrityError:
+            key = attrgetter(*fields)
+            taken = set(model.objects.filter(**{field + '__in': {getattr(obj, field) for obj in objects}
+                                                for field in fields}).values_list(*fields))
+            remaining = [obj for obj in objects if key(obj) not in taken]
+            if len(remaining) == len(objects):
+                raise
+            objects = remaining
+    return objects
+
+
+def import_reviews(rows, user=None, batch_size=BULK_BATCH_SIZE):
+
+    """imports reviews from an iterable of {"movie_title", "review"} rows, plus "user" (a reviewer's email)
+    when no user is given, and returns a summary with the import throughput
+    rows are consumed batch_size at a time, so any number of them streams in constant memory. titles and
+    emails are resolved once against maps that grow with the import, a (user, movie) pair that repeats
+    within a batch or already has a review is counted as a duplicate, and each batch is written with one
+    bulk_create in its own transaction along with the counters and rankings it changes"""
+
+    summary = {'rows': 0, 'created': 0, 'duplicates': 0, 'failed': 0, 'errors': []}
+    movie_ids, user_ids = {}, {}
+    reviewers = CustomUser.objects.filter(role='reviewer')
+    # the review field of MovieReviewSerializer, validating with it alone skips building a serializer per row
+    review_field = MovieReviewSerializer().fields['review']
+    start = time.perf_counter()
+
+    def fail(index, error):
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'index': index, 'error': error})
+
+    try:
+        for batch in _batches(rows, batch_size):
+            valid = []
+            for index, row in enumerate(batch, start=summary['rows']):
+                if not isinstance(row, dict):
+                    fail(index, 'expected an object')
+                    continue
+                try:
+                    review = review_field.run_validation(row.get('review', empty))
+                except serializers.ValidationError as e:
+                    fail(index, {'review': e.detail})
+                    continue
+                if not row.get('movie_title'):
+                    fail(index, 'movie_title is required')
+                elif user is None and not row.get('user'):
+                    fail(index, 'user is required')
+                else:
+                    valid.append((index, row['movie_title'], row.get('user'), review))
+            summary['rows'] += len(batch)
+
+            _resolve(movie_ids, Movie.objects.all(), 'title', {title for _, title, _, _ in valid})
+            if user is None:
+                _resolve(user_ids, reviewers, 'email', {email for _, _, email, _ in valid})
+            candidates = {}
+            for index, title, email, review in valid:
+                movie_id = movie_ids[title]
+                user_id = user.pk if user is not None else user_ids[email]
+                if movie_id is None:
+                    fail(index, 'movie does not exist: %s' % title)
+                elif user_id is None:
+                    fail(index, 'reviewer does not exist: %s' % email)
+                elif (user_id, movie_id) in candidates:
+                    summary['duplicates'] += 1
+                else:
+                    candidates[user_id, movie_id] = MovieReview(user_id=user_id, movie_id=movie_id, review=review)
+
+            existing = set()
+            if candidates:
+                existing.update(MovieReview.objects.filter(user_id__in={user_id for user_id, _ in candidates},
+                                                           movie_id__in={movie_id for _, movie_id in candidates})
+                                .values_list('user_id', 'movie_id'))
+            new_reviews = [review for key, review in candidates.items() if key not in existing]
+            with transaction.atomic():
+                # a review written concurrently for the same pair is skipped and counted as a duplicate.
+                # bulk_create sends no signals, the review feeds are refreshed here
+                new_reviews = insert_new(MovieReview, new_reviews, ('user_id', 'movie_id'))
+                counters.add(counters.REVIEW, [review.movie_id for review in new_reviews])
+                trending.add(trending.REVIEW, [(review.movie_id, review.added_at) for review in new_reviews])
+                refresh.reviews_changed([review.movie_id for review in new_reviews])
+            summary['created'] += len(new_reviews)
+            summary['duplicates'] += len(candidates) - len(new_reviews)
+    except ParseError as e:
+        summary['error'] = str(e.detail)
+
+    summary['errors'].sort(key=lambda error: error['index'])
+    summary['seconds'] = time.perf_counter() - start
+    summary['rows_per_second'] = summary['rows'] / summary['seconds'] if summary['seconds'] else 0
+    return summary
@@ -0,0 +1,103 @@
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Genre, Movie, StreamPlatform, AvailablePlatformsMovie, MovieReview
+from . import changelog, refresh
+from . import cache as movie_cache
+
+# the receivers only note what changed, movie.refresh writes the index and change log and bumps the cache
+# generations once the transaction commits
+RELATION_KINDS = {Genre: changelog.GENRE, StreamPlatform: changelog.STREAM_PLATFORM}
+RELATION_TABLES = {
+    Genre: (movie_cache.GENRE, movie_cache.CATALOG),
+    StreamPlatform: (movie_cache.STREAM_PLATFORM, movie_cache.CATALOG),
+}
+
+
+@receiver(post_save, sender=Movie)
+def refresh_saved_movie(sender, instance, **kwargs):
+    refresh.movies_saved([instance.pk])
+
+
+@receiver(post_delete, sender=Movie)
+def refresh_deleted_movie(sender, instance, **kwargs):
+    refresh.movies_deleted([instance.pk])
+
+
+@receiver(m2m_changed, sender=Movie.genre.through)
+@receiver(m2m_changed, sender=Movie.stream_platform.through)
+def refresh_movie_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh.movies_touched([instance.pk])
+        return
+    # reverse side, instance is a genre or platform and pk_set holds movie ids
+    if action == 'pre_clear':
+        instance._refresh_movie_ids = list(instance.movie_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        refresh.movies_touched(getattr(instance, '_refresh_movie_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        refresh.movies_touched(pk_set)
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=StreamPlatform)
+def refresh_saved_relation(sender, instance, created, **kwargs):
+    refresh.related_changed(RELATION_KINDS[sender], [instance.pk], tables=RELATION_TABLES[sender])
+    if not created:
+        # movies print the names of their genres and platforms
+        refresh.movies_touched(instance.movie_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=StreamPlatform)
+def collect_movies_of_deleted(sender, instance, **kwargs):
+    instance._refresh_movie_ids = list(instance.movie_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=StreamPlatform)
+def refresh_deleted_relation(sender, instance, **kwargs):
+    refresh.related_changed(RELATION_KINDS[sender], [instance.pk], changelog.DELETE, RELATION_TABLES[sender])
+    refresh.movies_touched(getattr(instance, '_refresh_movie_ids', []))
+
+
+def platforms_changed(platform_ids):
+    refresh.related_changed(changelog.STREAM_PLATFORM, platform_ids,
+                            tables=RELATION_TABLES[StreamPlatform])
+
+
+@receiver(m2m_changed, sender=StreamPlatform.available_movie.through)
+def refresh_platform_availability(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            platforms_changed([instance.pk])
+        return
+    # reverse side, instance is an available movie and pk_set holds platform ids
+    if action == 'pre_clear':
+        instance._refresh_platform_ids = list(instance.streamplatform_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        platforms_changed(getattr(instance, '_refresh_platform_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        platforms_changed(pk_set)
+
+
+@receiver(post_save, sender=AvailablePlatformsMovie)
+def refresh_renamed_available_movie(sender, instance, created, **kwargs):
+    if not created:
+        platforms_changed(instance.streamplatform_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=AvailablePlatformsMovie)
+def collect_platforms_of_deleted(sender, instance, **kwargs):
+    instance._refresh_platform_ids = list(instance.streamplatform_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=AvailablePlatformsMovie)
+def refresh_platforms_of_deleted(sender, instance, **kwargs):
+    platforms_changed(getattr(instance, '_refresh_platform_ids', []))
+
+
+@receiver(post_save, sender=MovieReview)
+@receiver(post_delete, sender=MovieReview)
+def refresh_review_feed(sender, instance, **kwargs):
+    refresh.reviews_changed([instance.movie_id])
@@ -0,0 +1,225 @@
+"""
+Read-only in-memory copy of the catalog, enabled with CATALOG_SNAPSHOT['ENABLED'] in settings.
+
+A Catalog holds every movie as a __slots__ row in id order, plus:
+- posting lists: for each genre and stream platform, an array of the row numbers of its movies
+- sort orders: for each orderable field, the row numbers in both directions, and each row's rank
+- the runtimes in runtime order, bisected by the runtime range filters
+
+Genre and platform payloads are serialized once and shared by every movie that has them. With these,
+MovieListAPI filters, orders and paginates without touching the database. Everything is read from the primary
+in one transaction, so the rows, links and payloads agree with each other.
+
+The snapshot is tied to the catalog version in movie.cache, which every write to movies, genres and
+stream platforms bumps. When the version moves, one thread builds the new snapshot and swaps it in with a
+single assignment; meanwhile, the other threads keep serving the old one. The watchlist and review counters
+do not bump the version, so they can lag by up to MAX_AGE seconds.
+"""
+import sys
+import time
+import tracemalloc
+from array import array
+from bisect import bisect_left, bisect_right
+from django.conf import settings
+from django.db import transaction
+from .models import Genre, Movie, StreamPlatform
+from . import cache as movie_cache
+
+DEFAULTS = {
+    'ENABLED': False,
+    # seconds a snapshot is served before it is reloaded even if the catalog version did not move
+    'MAX_AGE': 60,
+}
+ORDERABLE = ('id', 'title', 'runtime', 'watchlist_count', 'review_count')
+
+
+def get_setting(name):
+    return getattr(settings, 'CATALOG_SNAPSHOT', {}).get(name, DEFAULTS[name])
+
+
+class MovieRow:
+    __slots__ = ('id', 'title', 'synopsis', 'runtime', 'watchlist_count', 'review_count', 'genre_ids',
+                 'platform_ids')
+
+    def __init__(self, id, title, synopsis, runtime, watchlist_count, review_count):
+        self.id = id
+        self.title = title
+        self.synopsis = synopsis
+        self.runtime = runtime
+        self.watchlist_count = watchlist_count
+        self.review_count = review_count
+        self.genre_ids = ()
+        self.platform_ids = ()
+
+
+class Catalog:
+
+    __slots__ = ('rows', 'genres', 'platforms', 'genre_postings', 'platform_postings', 'orders', 'ranks',
+                 'runtimes')
+
+    def __init__(self):
+        from .serializers import StreamPlatformSerializer
+
+        with transaction.atomic():
+            rows = [MovieRow(*values) for values in Movie.objects.order_by('id').values_list(
+                'id', 'title', 'synopsis', 'runtime', 'watchlist_count', 'review_count').iterator(chunk_size=2000)]
+            position = {row.id: index for index, row in enumerate(rows)}
+
+            self.genres = {pk: {'name': name} for pk, name in Genre.objects.values_list('id', 'name')}
+            self.platforms = {platform['id']: platform for platform in StreamPlatformSerializer(
+                StreamPlatform.objects.prefetch_related('available_movie'), many=True).data}
+
+            self.genre_postings = self._postings(rows, position, self.genres, Movie.genre.through, 'genre_id',
+                                                 'genre_ids')
+            self.platform_postings = self._postings(rows, position, self.platforms, Movie.stream_platform.through,
+                                                    'streamplatform_id', 'platform_ids')
+        self.rows = tuple(rows)
+        # ties keep id order in both directions, like the database returns them. ranks are dense, equal
+        # values share a rank, so a stable sort of matching row numbers by rank keeps that tie order too
+        self.orders, self.ranks = {}, {}
+        for field in ORDERABLE[1:]:
+            order = sorted(range(len(rows)), key=lambda index: getattr(rows[index], field))
+            rank, place, previous = array('i', [0]) * len(rows), -1, object()
+            for index in order:
+                value = getattr(rows[index], field)
+                if value != previous:
+                    place, previous = place + 1, value
+                rank[index] = place
+            self.orders[field] = array('i', order)
+            self.orders['-' + field] = array('i', sorted(range(len(rows)), key=rank.__getitem__, reverse=True))
+            self.ranks[field] = rank
+        self.runtimes = array('i', (rows[index].runtime for index in self.orders['runtime']))
+
+    @staticmethod
+    def _postings(rows, position, payloads, through, column, attribute):
+        postings, related = {}, {}
+        links = through.objects.order_by('id').values_list('movie_id', column).iterator(chunk_size=5000)
+        for movie_id, related_id in links:
+            index = position.get(movie_id)
+            if index is None or related_id not in payloads:
+                # without snapshot isolation (postgresql's read committed) a link can reach a movie, genre or
+                # platform created after it was read, the next snapshot picks it up
+                continue
+            postings.setdefault(related_id, array('i')).append(index)
+            related.setdefault(index, []).append(related_id)
+        for index, related_ids in related.items():
+            setattr(rows[index], attribute, tuple(related_ids))
+        for posting in postings.values():
+            posting[:] = array('i', sorted(posting))
+        return postings
+
+    def matching(self, filters):
+        """row numbers of the movies matching the filters of CatalogFilter.get_filters, None when every
+        movie matches"""
+        matched = None
+        for param, postings in (('genre', self.genre_postings), ('stream_platform', self.platform_postings)):
+            if param in filters:
+                rows = set()
+                for pk in filters[param]:
+                    rows.update(postings.get(pk, ()))
+                matched = rows if matched is None else matched & rows
+        if 'runtime_min' in filters or 'runtime_max' in filters:
+            runtimes = self.runtimes
+            start = bisect_left(runtimes, filters['runtime_min']) if 'runtime_min' in filters else 0
+            end = bisect_right(runtimes, filters['runtime_max']) if 'runtime_max' in filters else len(runtimes)
+            rows = set(self.orders['runtime'][start:end])
+            matched = rows if matched is None else matched & rows
+        return matched
+
+    def select(self, filters, ordering):
+        """row numbers of the matching movies in the requested order, `ordering` is a field of ORDERABLE
+        optionally prefixed with '-'"""
+        field = ordering.lstrip('-')
+        descending = ordering.startswith('-')
+        matched = self.matching(filters)
+        if field == 'id':
+            selected = range(len(self.rows)) if matched is None else sorted(matched)
+            return selected[::-1] if descending else selected
+        if matched is None:
+            return self.orders[ordering]
+        return sorted(sorted(matched), key=self.ranks[field].__getitem__, reverse=descending)
+
+    def payload(self, index):
+        """the row as MovieListSerializer renders it"""
+        row = self.rows[index]
+        return {
+            'id': row.id,
+            'title': row.title,
+            'genre': [self.genres[pk] for pk in row.genre_ids],
+            'synopsis': row.synopsis,
+            'runtime': row.runtime,
+            'stream_platform': [self.platforms[pk] for pk in row.platform_ids],
+            'watchlist_count': row.watchlist_count,
+            'review_count': row.review_count,
+        }
+
+
+class Page:
+
+    """sequence of payloads over selected row numbers, for django's Paginator, rows are only rendered
+    once their page is sliced out"""
+
+    def __init__(self, catalog, selected):
+        self.catalog = catalog
+        self.selected = selected
+
+    def __len__(self):
+        return len(self.selected)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.catalog.payload(index) for index in self.selected[item]]
+        return self.catalog.payload(self.selected[item])
+
+
+_snapshot = movie_cache.CatalogLocal(Catalog, max_age=lambda: get_setting('MAX_AGE'))
+
+
+def get():
+    """the current snapshot, rebuilt first if the catalog changed or it expired, None when disabled"""
+    if not get_setting('ENABLED'):
+        return None
+    return _snapshot.get()
+
+
+def warm():
+    """loads the snapshot at worker startup, so the first request does not pay for it"""
+    get()
+
+
+def clear():
+    _snapshot.clear()
+
+
+def size(catalog):
+    """approximate bytes held by a snapshot, rows with their strings and tuples, arrays and lookups
+    the genre and platform payloads are not counted"""
+    total = sys.getsizeof(catalog.rows)
+    for row in catalog.rows:
+        total += sys.getsizeof(row) + sys.getsizeof(row.title) + sys.getsizeof(row.synopsis)
+        total += sys.getsizeof(row.genre_ids) + sys.getsizeof(row.platform_ids)
+    for arrays in (catalog.genre_postings, catalog.platform_postings, catalog.orders, catalog.ranks):
+        total += sys.getsizeof(arrays) + sum(sys.getsizeof(value) for value in arrays.values())
+    total += sys.getsizeof(catalog.runtimes)
+    return total
+
+
+def measure():
+    """loads a snapshot and reports its memory use, estimated by size() and traced by tracemalloc"""
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        catalog = Catalog()
+        seconds = time.perf_counter() - start
+        traced, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    movies = len(catalog.rows)
+    return {
+        'movies': movies,
+        'load_seconds': seconds,
+        'estimated_bytes': size(catalog),
+        'traced_bytes': traced,
+        'peak_bytes': peak,
+        'traced_bytes_per_100k_movies': int(traced * 100000 / movies) if movies else 0,
+    }
@@ -1,3 +1,1331 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from urllib import parse
+from unittest import mock
+from django.core.management import call_command, CommandError
+from django.core.cache import cache
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.utils import ConnectionHandler
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .models import Genre, Movie, StreamPlatform, AvailablePlatformsMovie, MovieReview, WatchList, MovieTrend, \
+    CatalogChange
+from . import cache as movie_cache
+from . import counters, facets, recommendations, search, snapshot, trending
+from .serializers import insert_new
+from rest_framework.authtoken.models import Token
+from user.models import CustomUser
+from watchlist import profiling, replicas
 
-# Create your tests here.
+
+def create_catalog(count):
+    genres = [Genre.objects.create(name=name) for name in ('Action', 'Drama')]
+    available = [AvailablePlatformsMovie.objects.create(title='movie %d' % i) for i in range(count)]
+    platforms = []
+    for name in ('Netflix', 'Hulu'):
+        platform = StreamPlatform.objects.create(name=name, description=name)
+        platform.available_movie.set(available)
+        platforms.append(platform)
+    movies = []
+    for i in range(count):
+        movie = Movie.objects.create(title='movie %d' % i, synopsis='synopsis', runtime=90 + i)
+        movie.genre.set(genres)
+        movie.stream_platform.set(platforms)
+        movies.append(movie)
+    return movies
+
+
+def create_user(role, email=None):
+    user = CustomUser.objects.create_user(email=email or '%s@example.com' % role, password='password',
+                                          first_name=role, last_name=role, username=email or role, role=role)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+    return user, client
+
+
+class MovieQueryCountTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_movie_list_query_count_does_not_grow_with_page_size(self):
+        create_catalog(10)
+        # count + page + genre + stream_platform + available_movie
+        with self.assertNumQueries(5):
+            response = self.client.get('/watchlist/v1/movie-list/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 10)
+
+    def test_movie_detail_query_count(self):
+        cache.clear()
+        movie = create_catalog(1)[0]
+        with self.assertNumQueries(4):
+            response = self.client.get('/watchlist/v1/moviedetail/%d/' % movie.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['stream_platform'][0]['available_movie']), 1)
+
+
+class MovieWriteTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        for name in ('Action', 'Drama', 'Comedy'):
+            Genre.objects.create(name=name)
+        available = AvailablePlatformsMovie.objects.create(title='Inception')
+        for name in ('Netflix', 'Hulu', 'Max'):
+            StreamPlatform.objects.create(name=name, description=name).available_movie.add(available)
+        StreamPlatform.objects.create(name='Prime', description='Prime')
+
+    def movie_payload(self, genres=('Action', 'Drama', 'Comedy'), platforms=('Netflix', 'Hulu', 'Max')):
+        return {
+            'title': 'Inception',
+            'synopsis': 'dreams',
+            'runtime': 148,
+            'genre': [{'name': name} for name in genres],
+            'stream_platform': [{'name': name} for name in platforms],
+        }
+
+    def test_create_resolves_names_in_batch(self):
+        movie_cache.get_genre_ids()
+        movie_cache.get_stream_platform_ids()
+        # begin + availability check + insert + 2 x (2 selects, insert) for the m2m sets, then one refresh on
+        # commit: begin + search index (delete, insert) + change log insert. genre and platform names come from
+        # the cache and the title is checked by its constraint
+        with self.assertNumQueries(13):
+            response = self.client.post('/watchlist/v1/movie/', self.movie_payload(), format='json')
+        self.assertEqual(response.status_code, 201)
+        movie = Movie.objects.get(title='Inception')
+        self.assertEqual(movie.genre.count(), 3)
+        self.assertEqual(movie.stream_platform.count(), 3)
+
+    def test_refreshes_once_after_commit(self):
+        version = movie_cache.catalog_version()
+        changes = CatalogChange.objects.count()
+        with transaction.atomic():
+            self.client.post('/watchlist/v1/movie/', self.movie_payload(), format='json')
+            # nothing is indexed, logged or invalidated before the commit
+            self.assertFalse(search.search_movies(Movie.objects.all(), ['dreams']).exists())
+            self.assertEqual(CatalogChange.objects.count(), changes)
+            self.assertEqual(movie_cache.catalog_version(), version)
+        self.assertEqual(search.search_movies(Movie.objects.all(), ['dreams']).get().title, 'Inception')
+        self.assertEqual(CatalogChange.objects.count(), changes + 1)
+        self.assertNotEqual(movie_cache.catalog_version(), version)
+
+    def test_rolled_back_writes_are_not_refreshed(self):
+        changes = CatalogChange.objects.count()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Movie.objects.create(title='Rolled back', synopsis='gone', runtime=90)
+            raise IntegrityError
+        self.assertFalse(search.search_movies(Movie.objects.all(), ['gone']).exists())
+        self.assertEqual(CatalogChange.objects.count(), changes)
+        Movie.objects.create(title='Kept', synopsis='kept', runtime=90)
+        self.assertEqual(search.search_movies(Movie.objects.all(), ['kept']).get().title, 'Kept')
+        self.assertEqual(CatalogChange.objects.count(), changes + 1)
+
+    def test_refresh_errors_do_not_fail_the_committed_write(self):
+        version = movie_cache.catalog_version()
+        with mock.patch('movie.changelog.record_changes', side_effect=RuntimeError('log is full')), \
+                self.assertLogs('movie.refresh', 'ERROR'):
+            response = self.client.post('/watchlist/v1/movie/', self.movie_payload(), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Movie.objects.filter(title='Inception').exists())
+        self.assertNotEqual(movie_cache.catalog_version(), version)
+
+    def test_create_duplicate_title_is_rejected_by_constraint(self):
+        self.client.post('/watchlist/v1/movie/', self.movie_payload(), format='json')
+        response = self.client.post('/watchlist/v1/movie/', self.movie_payload(), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['message'], 'movie already exist')
+        self.assertEqual(Movie.objects.count(), 1)
+
+    def test_create_names_missing_genre(self):
+        response = self.client.post('/watchlist/v1/movie/', self.movie_payload(genres=('Action', 'Horror')),
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Horror', response.data['error'])
+
+    def test_create_names_unavailable_platform(self):
+        response = self.client.post('/watchlist/v1/movie/', self.movie_payload(platforms=('Netflix', 'Prime')),
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Prime', response.data['error'])
+        self.assertFalse(Movie.objects.exists())
+
+
+class MovieBulkCreateTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        Genre.objects.create(name='Action')
+        netflix = StreamPlatform.objects.create(name='Netflix', description='Netflix')
+        for i in range(50):
+            netflix.available_movie.add(AvailablePlatformsMovie.objects.create(title='movie %d' % i))
+        Movie.objects.create(title='movie 0', synopsis='synopsis', runtime=90)
+
+    def movie_row(self, title, genre='Action'):
+        return {'title': title, 'synopsis': 'synopsis', 'runtime': 100,
+                'genre': [{'name': genre}], 'stream_platform': [{'name': 'Netflix'}]}
+
+    def test_bulk_create_reports_per_row_results(self):
+        rows = [self.movie_row('movie %d' % i) for i in range(49)]
+        rows.append(self.movie_row('movie 1'))
+        rows.append(self.movie_row('movie 49', genre='Horror'))
+        rows.append({'title': 'ab'})
+        response = self.client.post('/watchlist/v1/movie/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 48)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses[0], 'error')
+        self.assertEqual(statuses[1:49], ['created'] * 48)
+        self.assertEqual(statuses[49:], ['error'] * 3)
+        self.assertIn('Horror', response.data['results'][50]['error'][0])
+        self.assertEqual(Movie.objects.count(), 49)
+        self.assertEqual(Movie.objects.get(title='movie 2').genre.get().name, 'Action')
+        self.assertEqual(Movie.objects.get(title='movie 2').stream_platform.get().name, 'Netflix')
+
+    def test_bulk_create_query_count_does_not_grow_with_rows(self):
+        rows = [self.movie_row('movie %d' % i) for i in range(1, 50)]
+        # titles + genres + platforms + availability + begin, insert x3, then begin, search index x2, change log
+        with self.assertNumQueries(12):
+            response = self.client.post('/watchlist/v1/movie/bulk/', rows, format='json')
+        self.assertEqual(response.data['created'], 49)
+
+    def test_bulk_create_accepts_ndjson(self):
+        body = '\n'.join(json.dumps(self.movie_row('movie %d' % i)) for i in (1, 2)) + '\n'
+        response = self.client.post('/watchlist/v1/movie/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+
+
+class MovieExportTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        create_catalog(5)
+
+    def test_export_ndjson(self):
+        response = self.client.get('/watchlist/v1/movie-export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        movie = json.loads(lines[0])
+        self.assertEqual(movie['title'], 'movie 0')
+        self.assertEqual(movie['genre'], ['Action', 'Drama'])
+        self.assertEqual(movie['stream_platform'], ['Netflix', 'Hulu'])
+
+    def test_export_csv(self):
+        response = self.client.get('/watchlist/v1/movie-export/', {'output': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[0].startswith('id,title'))
+        self.assertIn('Action|Drama', lines[1])
+
+    def test_export_unknown_output(self):
+        response = self.client.get('/watchlist/v1/movie-export/', {'output': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class MovieCursorPaginationTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        create_catalog(7)
+
+    def walk(self, url, params):
+        titles = []
+        response = self.client.get(url, params)
+        while True:
+            titles.extend(movie['title'] for movie in response.data['results'])
+            if not response.data['next']:
+                return titles
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_mode_skips_count_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/watchlist/v1/movie-list/', {'paginate': 'cursor'})
+        self.assertNotIn('count', response.data)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+
+    def test_cursor_mode_walks_every_movie_once(self):
+        titles = self.walk('/watchlist/v1/movie-list/', {'paginate': 'cursor'})
+        self.assertEqual(titles, ['movie %d' % i for i in reversed(range(7))])
+
+    def test_cursor_mode_uses_ordering_filter(self):
+        titles = self.walk('/watchlist/v1/movie-list/', {'paginate': 'cursor', 'ordering': 'runtime'})
+        self.assertEqual(titles, ['movie %d' % i for i in range(7)])
+
+    def test_cursor_mode_is_stable_under_inserts(self):
+        response = self.client.get('/watchlist/v1/movie-list/', {'paginate': 'cursor', 'ordering': 'runtime'})
+        Movie.objects.create(title='early movie', synopsis='synopsis', runtime=1)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([movie['title'] for movie in response.data['results']], ['movie 3', 'movie 4', 'movie 5'])
+
+    def test_cursor_mode_pages_through_tied_created_at_by_id(self):
+        Movie.objects.update(created_at=timezone.now())
+        with CaptureQueriesContext(connection) as queries:
+            titles = self.walk('/watchlist/v1/movie-list/', {'paginate': 'cursor'})
+        self.assertEqual(titles, ['movie %d' % i for i in reversed(range(7))])
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+
+    def test_cursor_mode_walks_back_with_the_previous_links(self):
+        Movie.objects.update(created_at=timezone.now())
+        response = self.client.get('/watchlist/v1/movie-list/', {'paginate': 'cursor'})
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+        titles = []
+        while response.data['previous']:
+            response = self.client.get(response.data['previous'])
+            titles = [movie['title'] for movie in response.data['results']] + titles
+        self.assertEqual(titles, ['movie %d' % i for i in reversed(range(1, 7))])
+
+    def test_cursor_mode_rejects_a_cursor_of_another_ordering(self):
+        response = self.client.get('/watchlist/v1/movie-list/', {'paginate': 'cursor', 'ordering': 'runtime,title'})
+        cursor = parse.parse_qs(parse.urlsplit(response.data['next']).query)['cursor'][0]
+        response = self.client.get('/watchlist/v1/movie-list/', {'paginate': 'cursor', 'cursor': cursor})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_mode_is_default(self):
+        response = self.client.get('/watchlist/v1/movie-list/')
+        self.assertEqual(response.data['count'], 7)
+
+
+class MovieSearchTest(TransactionTestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.action = Genre.objects.create(name='Action')
+        self.netflix = StreamPlatform.objects.create(name='Netflix', description='Netflix')
+        self.heat = Movie.objects.create(title='Heat', synopsis='a heist in los angeles', runtime=170)
+        self.heat.genre.add(self.action)
+        self.up = Movie.objects.create(title='Up', synopsis='a house lifted by balloons', runtime=96)
+        self.up.stream_platform.add(self.netflix)
+
+    def search(self, term):
+        response = self.client.get('/watchlist/v1/movie-list/', {'search': term})
+        return [movie['title'] for movie in response.data['results']]
+
+    def test_search_matches_title_synopsis_genre_and_platform(self):
+        self.assertEqual(self.search('heat'), ['Heat'])
+        self.assertEqual(self.search('balloon'), ['Up'])
+        self.assertEqual(self.search('action'), ['Heat'])
+        self.assertEqual(self.search('netflix'), ['Up'])
+        self.assertEqual(self.search('action netflix'), [])
+
+    def test_search_ranks_by_bm25(self):
+        Movie.objects.create(title='Heat Heat Heat', synopsis='heat', runtime=100)
+        self.assertEqual(self.search('heat'), ['Heat Heat Heat', 'Heat'])
+
+    def test_index_follows_renames_and_deletes(self):
+        self.action.name = 'Thriller'
+        self.action.save()
+        self.assertEqual(self.search('thriller'), ['Heat'])
+        self.netflix.delete()
+        self.assertEqual(self.search('netflix'), [])
+        self.heat.delete()
+        self.assertEqual(self.search('thriller'), [])
+
+    def test_index_follows_reverse_m2m_changes(self):
+        self.action.movie_set.add(self.up)
+        self.assertEqual(self.search('action'), ['Heat', 'Up'])
+        self.action.movie_set.clear()
+        self.assertEqual(self.search('action'), [])
+
+    def test_search_input_is_escaped(self):
+        self.assertEqual(self.search('"heat'), ['Heat'])
+        self.assertEqual(self.search('AND OR'), [])
+
+
+class ReferenceCacheTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.action = Genre.objects.create(name='Action')
+        self.netflix = StreamPlatform.objects.create(name='Netflix', description='Netflix')
+
+    def test_genre_list_is_served_from_cache(self):
+        self.client.get('/watchlist/v1/genre/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/watchlist/v1/genre/')
+        self.assertEqual(response.data, [{'name': 'Action'}])
+
+    def test_genre_cache_is_invalidated_on_save_and_delete(self):
+        self.assertEqual(movie_cache.get_genre_ids(), {'Action': self.action.pk})
+        drama = Genre.objects.create(name='Drama')
+        self.assertEqual(movie_cache.get_genre_ids(), {'Action': self.action.pk, 'Drama': drama.pk})
+        self.action.delete()
+        self.assertEqual(self.client.get('/watchlist/v1/genre/').data, [{'name': 'Drama'}])
+
+    def test_generation_moves_after_commit(self):
+        self.assertEqual(movie_cache.get_genre_ids(), {'Action': self.action.pk})
+        with transaction.atomic():
+            drama = Genre.objects.create(name='Drama')
+            # a reader before the commit keeps the current generation, so no pre-commit rows get cached under
+            # the generation that follows the write
+            self.assertEqual(movie_cache.get_genre_ids(), {'Action': self.action.pk})
+        self.assertEqual(movie_cache.get_genre_ids(), {'Action': self.action.pk, 'Drama': drama.pk})
+
+    def test_stream_platform_cache_is_invalidated_on_available_movie_change(self):
+        self.client.get('/watchlist/v1/stream-platform/')
+        self.netflix.available_movie.add(AvailablePlatformsMovie.objects.create(title='Heat'))
+        response = self.client.get('/watchlist/v1/stream-platform/')
+        self.assertEqual(response.data[0]['available_movie'][0]['title'], 'Heat')
+
+    def test_local_layer_follows_shared_generation(self):
+        movie_cache.get_stream_platform_ids()
+        with self.assertNumQueries(0):
+            movie_cache.get_stream_platform_ids()
+        movie_cache.invalidate(movie_cache.STREAM_PLATFORM)
+        with self.assertNumQueries(1):
+            movie_cache.get_stream_platform_ids()
+
+
+class DetailConditionalGetTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.movie = create_catalog(1)[0]
+        self.netflix = StreamPlatform.objects.get(name='Netflix')
+
+    def test_movie_detail_etag_answers_304_without_queries(self):
+        url = '/watchlist/v1/moviedetail/%d/' % self.movie.pk
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_movie_detail_etag_changes_on_relation_change(self):
+        url = '/watchlist/v1/moviedetail/%d/' % self.movie.pk
+        etag = self.client.get(url)['ETag']
+        self.movie.genre.remove(Genre.objects.get(name='Drama'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['genre'], [{'name': 'Action'}])
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_movie_detail_after_delete(self):
+        url = '/watchlist/v1/moviedetail/%d/' % self.movie.pk
+        etag = self.client.get(url)['ETag']
+        self.client.delete(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+    def test_stream_platform_detail_etag(self):
+        url = '/watchlist/v1/stream-platform/%d/' % self.netflix.pk
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.put(url, {'name': 'Netflix', 'description': 'changed', 'available_movie': []}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['description'], 'changed')
+
+
+class UniqueConstraintTest(TestCase):
+
+    def setUp(self):
+        create_catalog(1)
+
+    def test_watchlist_duplicate_is_rejected_by_constraint(self):
+        _, client = create_user('watcher')
+        response = client.post('/watchlist/v1/watch-list/create/', {'movie_title': 'movie 0'})
+        self.assertEqual(response.status_code, 201)
+        response = client.post('/watchlist/v1/watch-list/create/', {'movie_title': 'movie 0'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['message'], 'movie already exist in your watchlist')
+
+    def test_review_duplicate_is_rejected_by_constraint(self):
+        _, client = create_user('reviewer')
+        response = client.post('/watchlist/v1/review-movie/', {'movie_title': 'movie 0', 'review': 'good'})
+        self.assertEqual(response.status_code, 201)
+        response = client.post('/watchlist/v1/review-movie/', {'movie_title': 'movie 0', 'review': 'bad'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['message'], 'movie already exist in your review')
+
+
+    def test_platform_name_inserted_concurrently_is_reported_on_the_name(self):
+        # the platform is created after the view checked the cached names
+        with mock.patch('movie.views.movie_cache.get_stream_platform_ids', return_value={}):
+            response = APIClient().post('/watchlist/v1/stream-platform/', {
+                'name': 'Netflix', 'description': 'Netflix', 'available_movie': [{'title': 'new movie'}]},
+                format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], {'name': ['stream platform already exist']})
+        self.assertFalse(AvailablePlatformsMovie.objects.filter(title='new movie').exists())
+
+    def test_platform_reuses_an_existing_title(self):
+        response = APIClient().post('/watchlist/v1/stream-platform/', {
+            'name': 'Prime', 'description': 'Prime', 'available_movie': [{'title': 'movie 0'}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(StreamPlatform.objects.get(name='Prime').available_movie.values_list('title', flat=True)),
+                         ['movie 0'])
+
+
+class TunedSQLiteTest(SimpleTestCase):
+
+    def test_pragmas_and_immediate_transactions(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections = ConnectionHandler({'default': {
+            'ENGINE': 'watchlist.sqlite',
+            'NAME': os.path.join(directory.name, 'tuned.sqlite3'),
+            'OPTIONS': {'timeout': 5, 'transaction_mode': 'IMMEDIATE',
+                        'pragmas': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -2000}},
+        }})
+        tuned = connections['default']
+        self.addCleanup(tuned.close)
+        with tuned.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            # NORMAL
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)
+            self.assertEqual(cursor.execute('PRAGMA cache_size').fetchone()[0], -2000)
+            self.assertEqual(cursor.execute('PRAGMA foreign_keys').fetchone()[0], 1)
+        # what transaction.atomic() does on sqlite, which stays in autocommit and begins explicitly
+        with CaptureQueriesContext(tuned) as queries:
+            tuned.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+            tuned.rollback()
+            tuned.set_autocommit(True)
+        self.assertEqual(queries.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+
+@override_settings(PROFILING={'ENABLED': True, 'BUFFER_SIZE': 5, 'SIMILAR_THRESHOLD': 3, 'FLUSH_INTERVAL': 0})
+class ProfilingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        profiling.registry.clear()
+        create_catalog(3)
+
+    def test_records_samples_per_view_in_a_bounded_buffer(self):
+        client = APIClient()
+        for _ in range(7):
+            client.get('/watchlist/v1/movie-list/')
+        stats = profiling.report(profiling.registry.snapshot())['movie.views.MovieListAPI']
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['queries']['p50'], 5)
+
+    async def test_records_async_requests(self):
+        await AsyncClient().get('/watchlist/v1/async/movie-list/')
+        stats = profiling.report(profiling.registry.snapshot())['movie.async_views.AsyncMovieListAPI']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['queries']['p50'], 5)
+
+    def test_detects_repeated_queries(self):
+        APIClient().get('/watchlist/v1/stream-platform/')
+        user, client = create_user('watcher')
+        for movie in Movie.objects.all():
+            WatchList.objects.create(user=user, movie=movie)
+        client.get('/watchlist/v1/watch-list/')
+        report = profiling.report(profiling.registry.snapshot())
+        self.assertEqual(report['movie.views.StreamPlatformAPI']['n_plus_one'], [])
+        # each watchlist entry loads its movie on its own
+        self.assertIn('movie_movie', report['movie.views.WatchListAPI']['n_plus_one'][0]['sql'])
+
+    def test_report_endpoint_is_admin_only(self):
+        _, client = create_user('watcher')
+        self.assertEqual(client.get('/watchlist/v1/profiling/').status_code, 403)
+        admin = CustomUser.objects.create_superuser(email='admin@example.com', password='password',
+                                                    first_name='a', last_name='a', username='admin', role='admin')
+        client.force_authenticate(admin)
+        response = client.get('/watchlist/v1/profiling/', {'scope': 'all'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('watchlist.profiling.ProfilingReportAPI', response.data)
+
+    def test_management_command_reads_flushed_snapshots(self):
+        APIClient().get('/watchlist/v1/movie-list/')
+        out = StringIO()
+        call_command('profiling_report', stdout=out)
+        self.assertIn('movie.views.MovieListAPI', out.getvalue())
+
+
+class AsyncViewTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.movies = create_catalog(4)
+
+    async def test_async_movie_list_matches_sync_view(self):
+        client = AsyncClient()
+        for params in ({}, {'page': 2}, {'ordering': '-runtime'}, {'search': 'movie'}, {'paginate': 'cursor'},
+                       {'facets': 'true', 'genre': 'Action'}, {'facets': 'true', 'search': 'movie'}):
+            async_response = await client.get('/watchlist/v1/async/movie-list/', params)
+            sync_response = await sync_to_async(APIClient().get)('/watchlist/v1/movie-list/', params)
+            sync_data = json.loads(sync_response.content.decode())
+            self.assertEqual(async_response.json()['results'], sync_data['results'], params)
+            self.assertEqual(async_response.json().get('count'), sync_data.get('count'), params)
+            self.assertEqual(async_response.json().get('facets'), sync_data.get('facets'), params)
+
+    def test_async_movie_list_serves_the_snapshot(self):
+        snapshot.clear()
+        self.addCleanup(snapshot.clear)
+        client = AsyncClient()
+
+        @async_to_sync
+        async def get(params):
+            return await client.get('/watchlist/v1/async/movie-list/', params)
+
+        with self.settings(CATALOG_SNAPSHOT={'ENABLED': True}):
+            get({'genre': 'Action'})
+            params = {'genre': 'Action', 'ordering': '-runtime'}
+            with self.assertNumQueries(0):
+                data = get(params).json()
+            expected = APIClient().get('/watchlist/v1/movie-list/', params).data
+            self.assertEqual((data['count'], data['results']), (expected['count'], expected['results']))
+            self.assertEqual(get({'page': 9}).status_code, 404)
+
+    async def test_async_movie_list_filters_on_a_cold_cache(self):
+        await sync_to_async(cache.clear)()
+        await sync_to_async(movie_cache._local.clear)()
+        response = await AsyncClient().get('/watchlist/v1/async/movie-list/', {'genre': 'Action', 'runtime_min': 92})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([movie['title'] for movie in response.json()['results']], ['movie 2', 'movie 3'])
+
+    async def test_async_movie_list_invalid_page(self):
+        response = await AsyncClient().get('/watchlist/v1/async/movie-list/', {'page': 9})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_async_movie_list_rejects_bad_parameters_like_the_sync_view(self):
+        for params in ({'runtime_min': 'abc'}, {'paginate': 'cursor', 'cursor': 'garbage'}):
+            async_response = await AsyncClient().get('/watchlist/v1/async/movie-list/', params)
+            sync_response = await sync_to_async(APIClient().get)('/watchlist/v1/movie-list/', params)
+            self.assertIn(sync_response.status_code, (400, 404), params)
+            self.assertEqual(async_response.status_code, sync_response.status_code, params)
+            self.assertEqual(async_response.json(), json.loads(sync_response.content.decode()), params)
+
+    async def test_async_movie_detail_etag(self):
+        client = AsyncClient()
+        url = '/watchlist/v1/async/moviedetail/%d/' % self.movies[0].pk
+        response = await client.get(url)
+        self.assertEqual(response.json()['title'], 'movie 0')
+        # the 4.1 AsyncClient takes request headers by their plain names
+        response = await client.get(url, **{'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        response = await client.get('/watchlist/v1/async/moviedetail/999/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_async_watch_list_requires_watcher_token(self):
+        watcher, _ = await sync_to_async(create_user)('watcher')
+        reviewer, _ = await sync_to_async(create_user)('reviewer')
+        await WatchList.objects.acreate(user=watcher, movie=self.movies[1])
+        client = AsyncClient()
+        self.assertEqual((await client.get('/watchlist/v1/async/watch-list/')).status_code, 401)
+        token = await Token.objects.aget(user=reviewer)
+        response = await client.get('/watchlist/v1/async/watch-list/', AUTHORIZATION='Token ' + token.key)
+        self.assertEqual(response.status_code, 403)
+        token = await Token.objects.aget(user=watcher)
+        response = await client.get('/watchlist/v1/async/watch-list/', AUTHORIZATION='Token ' + token.key)
+        self.assertEqual(response.json()['results'], [{'id': 1, 'movie': 'movie 1'}])
+
+    async def test_async_review_list(self):
+        reviewer, _ = await sync_to_async(create_user)('reviewer')
+        await MovieReview.objects.acreate(user=reviewer, movie=self.movies[2], review='good')
+        response = await AsyncClient().get('/watchlist/v1/async/movie-review-list/')
+        self.assertEqual(response.json()['results'][0]['movie'], 'movie 2')
+
+
+class MovieCounterTest(TestCase):
+
+    def setUp(self):
+        self.movies = create_catalog(3)
+        self.watcher, self.watcher_client = create_user('watcher')
+        self.reviewer, self.reviewer_client = create_user('reviewer')
+
+    def counts(self, movie):
+        movie.refresh_from_db()
+        return movie.watchlist_count, movie.review_count
+
+    def test_counters_follow_adds_and_deletes(self):
+        self.watcher_client.post('/watchlist/v1/watch-list/create/', {'movie_title': 'movie 1'})
+        self.reviewer_client.post('/watchlist/v1/review-movie/', {'movie_title': 'movie 1', 'review': 'good'})
+        self.assertEqual(self.counts(self.movies[1]), (1, 1))
+
+        self.watcher_client.post('/watchlist/v1/watch-list/create/', {'movie_title': 'movie 1'})
+        self.assertEqual(self.counts(self.movies[1]), (1, 1))
+
+        self.watcher_client.delete('/watchlist/v1/watch-list-detail/%d' % WatchList.objects.get().pk)
+        self.reviewer_client.delete('/watchlist/v1/review-put-delete/%d' % MovieReview.objects.get().pk)
+        self.assertEqual(self.counts(self.movies[1]), (0, 0))
+
+    def test_deleting_uncounted_rows_stops_at_zero(self):
+        # added outside the api, like the admin does, so the counters never saw them
+        item = WatchList.objects.create(user=self.watcher, movie=self.movies[0])
+        review = MovieReview.objects.create(user=self.reviewer, movie=self.movies[0], review='admin')
+        self.assertEqual(self.watcher_client.delete('/watchlist/v1/watch-list-detail/%d' % item.pk).status_code, 204)
+        self.assertEqual(self.reviewer_client.delete('/watchlist/v1/review-put-delete/%d' % review.pk).status_code,
+                         204)
+        self.assertEqual(self.counts(self.movies[0]), (0, 0))
+
+    def test_counters_are_listed_and_sortable(self):
+        for title in ('movie 2', 'movie 0'):
+            self.watcher_client.post('/watchlist/v1/watch-list/create/', {'movie_title': title})
+        _, other_client = create_user('watcher', 'other@example.com')
+        other_client.post('/watchlist/v1/watch-list/create/', {'movie_title': 'movie 2'})
+
+        response = APIClient().get('/watchlist/v1/movie-list/', {'ordering': '-watchlist_count'})
+        self.assertEqual([(movie['title'], movie['watchlist_count']) for movie in response.data['results']],
+                         [('movie 2', 2), ('movie 0', 1), ('movie 1', 0)])
+
+    def test_reconcile_fixes_drift(self):
+        WatchList.objects.create(user=self.watcher, movie=self.movies[0])
+        Movie.objects.filter(pk=self.movies[2].pk).update(review_count=5)
+        out = StringIO()
+        call_command('reconcile_movie_counters', stdout=out)
+        self.assertIn('watchlist_count: 1 movies fixed', out.getvalue())
+        self.assertIn('review_count: 1 movies fixed', out.getvalue())
+        self.assertEqual(self.counts(self.movies[0]), (1, 0))
+        self.assertEqual(self.counts(self.movies[2]), (0, 0))
+
+
+class TrendingTest(TestCase):
+
+    def setUp(self):
+        self.movies = create_catalog(3)
+        self.watchers = [create_user('watcher', 'watcher%d@example.com' % i) for i in range(3)]
+
+    def watch(self, client, title):
+        return client.post('/watchlist/v1/watch-list/create/', {'movie_title': title})
+
+    def ranking(self, **params):
+        response = APIClient().get('/watchlist/v1/trending/', params)
+        return [(movie['title'], movie['score']) for movie in response.data]
+
+    def test_ranking_follows_writes(self):
+        for _, client in self.watchers:
+            self.watch(client, 'movie 2')
+        self.watch(self.watchers[0][1], 'movie 0')
+        self.assertEqual(self.ranking(), [('movie 2', 3), ('movie 0', 1)])
+
+        self.watchers[0][1].delete('/watchlist/v1/watch-list-detail/%d' % WatchList.objects.get(
+            user=self.watchers[0][0], movie=self.movies[2]).pk)
+        self.assertEqual(self.ranking(limit=1), [('movie 2', 2)])
+        self.assertEqual(self.ranking(kind='review'), [])
+
+    def test_read_is_one_query(self):
+        self.watch(self.watchers[0][1], 'movie 1')
+        with self.assertNumQueries(1):
+            APIClient().get('/watchlist/v1/trending/')
+
+    def test_old_activity_decays(self):
+        for _, client in self.watchers[:2]:
+            self.watch(client, 'movie 0')
+        WatchList.objects.update(added_at=timezone.now() - timedelta(days=14))
+        self.watch(self.watchers[2][1], 'movie 1')
+        call_command('rebuild_trending', stdout=StringIO())
+        # two watchlists two half lives ago weigh half of one from today
+        self.assertEqual(self.ranking(), [('movie 1', 1), ('movie 0', 0.5)])
+
+        call_command('rebuild_trending', days=7, stdout=StringIO())
+        self.assertEqual(self.ranking(), [('movie 1', 1)])
+
+    def test_removing_activity_older_than_the_rebuild_window(self):
+        self.watch(self.watchers[0][1], 'movie 0')
+        WatchList.objects.update(added_at=timezone.now() - timedelta(days=14))
+        self.watch(self.watchers[1][1], 'movie 0')
+        call_command('rebuild_trending', days=7, stdout=StringIO())
+        for user, client in self.watchers[1::-1]:
+            client.delete('/watchlist/v1/watch-list-detail/%d' % WatchList.objects.get(user=user).pk)
+        # the old watchlist was never counted, taking it back stops at zero
+        self.assertEqual(MovieTrend.objects.get(movie=self.movies[0]).score, 0)
+        self.assertEqual(self.ranking(), [])
+
+    def test_rebuild_matches_incremental(self):
+        for index, (_, client) in enumerate(self.watchers):
+            for movie in self.movies[index:]:
+                self.watch(client, movie.title)
+        incremental = set(MovieTrend.objects.values_list('kind', 'movie', 'score'))
+        trending.rebuild()
+        self.assertEqual(set(MovieTrend.objects.values_list('kind', 'movie', 'score')), incremental)
+
+    def test_rebase_keeps_rankings_and_counts(self):
+        for _, client in self.watchers:
+            self.watch(client, 'movie 2')
+        self.watch(self.watchers[0][1], 'movie 0')
+        WatchList.objects.filter(movie=self.movies[0]).update(added_at=timezone.now() - timedelta(days=7))
+        trending.rebuild()
+        before = self.ranking()
+        call_command('rebase_trending', stdout=StringIO())
+        self.assertEqual(trending.get_epoch(), timezone.localdate())
+        self.assertEqual(self.ranking(), before)
+        # today's events weigh 1 after the rebase, later writes are added at the new scale
+        self.assertAlmostEqual(MovieTrend.objects.get(movie=self.movies[2]).score, 3)
+        self.watch(self.watchers[1][1], 'movie 0')
+        self.assertEqual(self.ranking(), [('movie 2', 3), ('movie 0', 1.5)])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(APIClient().get('/watchlist/v1/trending/', {'kind': 'other'}).status_code, 400)
+        self.assertEqual(APIClient().get('/watchlist/v1/trending/', {'limit': 'x'}).status_code, 400)
+
+
+class WatchListBatchTest(TestCase):
+
+    def setUp(self):
+        self.movies = create_catalog(6)
+        self.user, self.client = create_user('watcher')
+        self.batch('post', ['movie 0'])
+
+    def batch(self, method, movies):
+        return getattr(self.client, method)('/watchlist/v1/watch-list/batch/', {'movies': movies}, format='json')
+
+    def test_add_reports_every_item(self):
+        response = self.batch('post', ['movie 0', self.movies[1].pk, 'movie 2', 'movie 2', 'missing', 10 ** 6])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['added'], 2)
+        self.assertEqual([item['status'] for item in response.data['results']],
+                         ['already in watchlist', 'added', 'added', 'already in watchlist', 'movie does not exist',
+                          'movie does not exist'])
+        self.assertEqual(set(WatchList.objects.filter(user=self.user).values_list('movie__title', flat=True)),
+                         {'movie 0', 'movie 1', 'movie 2'})
+        self.assertEqual(Movie.objects.get(title='movie 2').watchlist_count, 1)
+        self.assertEqual(sorted(movie['title'] for movie in APIClient().get('/watchlist/v1/trending/').data),
+                         ['movie 0', 'movie 1', 'movie 2'])
+
+    def test_rows_inserted_concurrently_are_not_counted(self):
+        def racing(model, objects, fields):
+            # another request of the user adds movie 1 after the batch was checked
+            WatchList.objects.bulk_create([WatchList(user=self.user, movie=self.movies[1])])
+            return insert_new(model, objects, fields)
+
+        with mock.patch('movie.views.insert_new', racing):
+            response = self.batch('post', ['movie 1', 'movie 2'])
+        self.assertEqual(response.data['added'], 1)
+        self.assertEqual([item['status'] for item in response.data['results']], ['already in watchlist', 'added'])
+        self.assertEqual(Movie.objects.get(title='movie 1').watchlist_count, 0)
+        self.assertEqual(Movie.objects.get(title='movie 2').watchlist_count, 1)
+        self.assertFalse(MovieTrend.objects.filter(movie=self.movies[1]).exists())
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        self.batch('post', ['movie 1'])
+        with CaptureQueriesContext(connection) as small:
+            self.batch('post', ['movie 2'])
+        with CaptureQueriesContext(connection) as large:
+            self.batch('post', ['movie 3', 'movie 4', 'movie 5'])
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(WatchList.objects.filter(user=self.user).count(), 6)
+
+    def test_remove(self):
+        self.batch('post', ['movie 1', 'movie 2'])
+        response = self.batch('delete', ['movie 0', 'movie 2', 'movie 3', 'missing'])
+        self.assertEqual(response.data['removed'], 2)
+        self.assertEqual([item['status'] for item in response.data['results']],
+                         ['removed', 'removed', 'not in watchlist', 'movie does not exist'])
+        self.assertEqual(list(WatchList.objects.filter(user=self.user).values_list('movie__title', flat=True)),
+                         ['movie 1'])
+        self.assertEqual(Movie.objects.get(title='movie 2').watchlist_count, 0)
+
+    def test_invalid_batches(self):
+        for movies in ([], 'movie 1', [{'title': 'movie 1'}], [True]):
+            self.assertEqual(self.batch('post', movies).status_code, 400)
+        for body in (['movie 1'], 'movie 1', None):
+            response = self.client.post('/watchlist/v1/watch-list/batch/', body, format='json')
+            self.assertEqual(response.status_code, 400)
+        _, reviewer_client = create_user('reviewer')
+        response = reviewer_client.post('/watchlist/v1/watch-list/batch/', {'movies': ['movie 1']}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(RECOMMENDATIONS={'GENRE_WEIGHT': 0})
+class RecommendationsTest(TestCase):
+
+    def setUp(self):
+        self.movies = create_catalog(5)
+        self.users = {}
+        for name, watched in (('a', [0, 1, 2]), ('b', [0, 1]), ('c', [0, 3]), ('d', [1])):
+            user, client = create_user('watcher', '%s@example.com' % name)
+            self.users[name] = client
+            WatchList.objects.bulk_create([WatchList(user=user, movie=self.movies[i]) for i in watched])
+        counters.reconcile()
+        call_command('rebuild_recommendations', stdout=StringIO())
+
+    def titles(self, response):
+        return [(movie['title'], movie['score']) for movie in response.data]
+
+    def test_similar_movies(self):
+        with self.assertNumQueries(1):
+            response = APIClient().get('/watchlist/v1/moviedetail/%d/similar/' % self.movies[0].pk)
+        # cosine of the co-occurrences, movie 1 shares two of its three users with movie 0
+        self.assertEqual(self.titles(response), [('movie 1', 0.6667), ('movie 2', 0.5774), ('movie 3', 0.5774)])
+        self.assertEqual(APIClient().get('/watchlist/v1/moviedetail/%d/similar/' % self.movies[4].pk).data, [])
+        self.assertEqual(APIClient().get('/watchlist/v1/moviedetail/999/similar/').status_code, 404)
+
+    def test_recommendations_skip_watched_movies(self):
+        self.assertEqual(self.titles(self.users['d'].get('/watchlist/v1/watch-list/recommendations/')),
+                         [('movie 0', 0.6667), ('movie 2', 0.5774)])
+        self.assertEqual(self.titles(self.users['c'].get('/watchlist/v1/watch-list/recommendations/', {'limit': 1})),
+                         [('movie 1', 0.6667)])
+        self.assertEqual(APIClient().get('/watchlist/v1/watch-list/recommendations/').status_code, 401)
+
+    def test_genre_overlap_counts(self):
+        Movie.objects.get(title='movie 3').genre.clear()
+        with override_settings(RECOMMENDATIONS={'GENRE_WEIGHT': 0.5}):
+            recommendations.build()
+        response = APIClient().get('/watchlist/v1/moviedetail/%d/similar/' % self.movies[0].pk)
+        self.assertEqual([movie['title'] for movie in response.data], ['movie 1', 'movie 2', 'movie 3'])
+        self.assertEqual(response.data[2]['score'], round(0.5 / 3 ** 0.5, 4))
+
+    def test_partial_rebuild(self):
+        user, _ = create_user('watcher', 'e@example.com')
+        WatchList.objects.create(user=user, movie=self.movies[4])
+        WatchList.objects.create(user=user, movie=self.movies[2])
+        counters.reconcile()
+        call_command('rebuild_recommendations', since=1, stdout=StringIO())
+        response = APIClient().get('/watchlist/v1/moviedetail/%d/similar/' % self.movies[4].pk)
+        self.assertEqual(self.titles(response), [('movie 2', 0.7071)])
+
+
+class CatalogFilterTest(TestCase):
+
+    def test_filters_by_genre_and_stream_platform(self):
+        movies = create_catalog(4)
+        movies[0].genre.set([Genre.objects.get(name='Action')])
+        movies[1].genre.set([Genre.objects.get(name='Drama')])
+        movies[1].stream_platform.set([StreamPlatform.objects.get(name='Hulu')])
+        client = APIClient()
+
+        def titles(query):
+            return [movie['title'] for movie in client.get('/watchlist/v1/movie-list/?' + query).data['results']]
+
+        self.assertEqual(titles('genre=Action'), ['movie 0', 'movie 2', 'movie 3'])
+        self.assertEqual(titles('genre=Action&genre=Drama&ordering=-id'), ['movie 3', 'movie 2', 'movie 1'])
+        self.assertEqual(titles('genre=Drama&stream_platform=Netflix'), ['movie 2', 'movie 3'])
+        self.assertEqual(titles('genre=Horror'), [])
+
+
+@override_settings(CATALOG_SNAPSHOT={'ENABLED': True})
+class CatalogSnapshotTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        snapshot.clear()
+        self.movies = create_catalog(5)
+        self.movies[1].genre.set([Genre.objects.get(name='Drama')])
+        self.movies[3].stream_platform.set([StreamPlatform.objects.get(name='Hulu')])
+        Movie.objects.filter(pk=self.movies[2].pk).update(watchlist_count=4)
+        Movie.objects.filter(pk=self.movies[4].pk).update(watchlist_count=2)
+        self.client = APIClient()
+
+    def tearDown(self):
+        snapshot.clear()
+
+    def test_matches_the_database(self):
+        queries = ['', 'page=2', 'ordering=-id', 'ordering=title', 'ordering=-watchlist_count', 'ordering=runtime',
+                   'genre=Drama', 'genre=Action&ordering=-watchlist_count', 'stream_platform=Netflix&page=2',
+                   'genre=Action&genre=Drama&stream_platform=Hulu', 'genre=Horror', 'page=9',
+                   'runtime_min=91&runtime_max=93&ordering=-runtime', 'runtime_max=91', 'runtime_min=99',
+                   'genre_id=%d&runtime_min=92' % Genre.objects.get(name='Drama').pk, 'facets=true&genre=Drama']
+        for query in queries:
+            with self.settings(CATALOG_SNAPSHOT={'ENABLED': False}):
+                expected = self.client.get('/watchlist/v1/movie-list/?' + query)
+            response = self.client.get('/watchlist/v1/movie-list/?' + query)
+            self.assertEqual((response.status_code, response.data), (expected.status_code, expected.data), query)
+
+    def test_served_without_queries(self):
+        # loads the snapshot and the cached genre name -> id map
+        self.client.get('/watchlist/v1/movie-list/?genre=Action')
+        with self.assertNumQueries(0):
+            response = self.client.get('/watchlist/v1/movie-list/?genre=Action&ordering=-watchlist_count&page=2')
+        self.assertEqual(response.data['count'], 4)
+        # orderings the snapshot does not keep go to the database
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/watchlist/v1/movie-list/?ordering=synopsis')
+        self.assertTrue(queries)
+
+    def test_catalog_writes_swap_the_snapshot(self):
+        first = snapshot.get()
+        self.assertIs(snapshot.get(), first)
+        Genre.objects.create(name='Horror')
+        self.movies[0].genre.add(Genre.objects.get(name='Horror'))
+        response = self.client.get('/watchlist/v1/movie-list/?genre=Horror')
+        self.assertIsNot(snapshot.get(), first)
+        self.assertEqual([movie['title'] for movie in response.data['results']], ['movie 0'])
+
+    def test_reads_platforms_with_the_rows(self):
+        # a cached platform list older than the rows
+        movie_cache.get_stream_platform_list()
+        platform = StreamPlatform.objects.bulk_create([StreamPlatform(name='Max', description='Max')])[0]
+        Movie.stream_platform.through.objects.create(movie=self.movies[0], streamplatform=platform)
+        snapshot.clear()
+        response = self.client.get('/watchlist/v1/movie-list/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Max', [platform['name'] for platform in response.data['results'][0]['stream_platform']])
+
+    def test_memory_report(self):
+        out = StringIO()
+        call_command('catalog_snapshot', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['movies'], 5)
+        self.assertGreater(report['estimated_bytes'], 0)
+        self.assertGreater(report['traced_bytes_per_100k_movies'], report['traced_bytes'])
+
+
+class FacetTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        facets.clear()
+        self.movies = create_catalog(5)
+        self.action, self.drama = Genre.objects.get(name='Action'), Genre.objects.get(name='Drama')
+        self.netflix, self.hulu = StreamPlatform.objects.get(name='Netflix'), StreamPlatform.objects.get(name='Hulu')
+        self.movies[0].genre.set([self.action])
+        self.movies[1].genre.set([self.drama])
+        self.movies[2].stream_platform.set([self.hulu])
+        self.client = APIClient()
+
+    def tearDown(self):
+        facets.clear()
+
+    def get(self, query):
+        return self.client.get('/watchlist/v1/movie-list/?facets=true&' + query).data
+
+    def counts(self, data, facet):
+        return {item['name']: item['count'] for item in data['facets'][facet]}
+
+    def test_counts_are_disjunctive(self):
+        data = self.get('genre_id=%d' % self.drama.pk)
+        self.assertEqual(data['count'], 4)
+        self.assertEqual(data['facets']['total'], 4)
+        # the genre counts ignore the genre filter, the platform counts apply it
+        self.assertEqual(self.counts(data, 'genre'), {'Action': 4, 'Drama': 4})
+        self.assertEqual(self.counts(data, 'stream_platform'), {'Hulu': 4, 'Netflix': 3})
+
+    def test_runtime_range(self):
+        data = self.get('runtime_min=91&runtime_max=92&stream_platform_id=%d' % self.netflix.pk)
+        self.assertEqual([movie['title'] for movie in data['results']], ['movie 1'])
+        self.assertEqual(self.counts(data, 'genre'), {'Action': 0, 'Drama': 1})
+        self.assertEqual(self.counts(data, 'stream_platform'), {'Hulu': 2, 'Netflix': 1})
+        self.assertEqual(self.get('runtime_min=95')['facets']['total'], 0)
+
+    def test_counts_within_search(self):
+        data = self.get('search=movie 3')
+        self.assertEqual(data['facets']['total'], data['count'])
+        self.assertEqual(self.counts(data, 'genre'), {'Action': 1, 'Drama': 1})
+
+    def test_index_follows_catalog_writes(self):
+        index = facets.get()
+        self.assertIs(facets.get(), index)
+        self.movies[4].genre.remove(self.action)
+        self.assertEqual(self.counts(self.get(''), 'genre'), {'Action': 3, 'Drama': 4})
+
+    def test_index_is_read_in_one_transaction(self):
+        with CaptureQueriesContext(connection) as queries:
+            facets.FacetIndex()
+        self.assertTrue(queries.captured_queries[0]['sql'].startswith('BEGIN'))
+        self.assertEqual(sum(query['sql'].startswith('BEGIN') for query in queries.captured_queries), 1)
+
+    def test_popcount(self):
+        self.assertEqual([facets.popcount(bits) for bits in (0, 1, 0b1011, (1 << 200) - 1)], [0, 1, 3, 200])
+
+    def test_counted_from_the_index(self):
+        self.get('')
+        # count + page + the three prefetches, the facets add no query once the index is built
+        with self.assertNumQueries(5):
+            self.get('genre_id=%d&runtime_max=93' % self.action.pk)
+
+    def test_invalid_filter(self):
+        response = self.client.get('/watchlist/v1/movie-list/?runtime_min=long')
+        self.assertEqual(response.status_code, 400)
+
+
+class MovieReviewFeedTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.movies = create_catalog(2)
+        self.clients = []
+        for i in range(4):
+            user, client = create_user('reviewer', 'reviewer%d@example.com' % i)
+            self.clients.append(client)
+            MovieReview.objects.create(user=user, movie=self.movies[0], review='review %d' % i)
+        MovieReview.objects.create(user=user, movie=self.movies[1], review='other movie')
+        counters.reconcile()
+        self.url = '/watchlist/v1/moviedetail/%d/reviews/' % self.movies[0].pk
+
+    def test_newest_first_with_cursor_pages(self):
+        client = APIClient()
+        with self.assertNumQueries(1):
+            first = client.get(self.url).data
+        self.assertEqual([review['review'] for review in first['results']], ['review 3', 'review 2', 'review 1'])
+        self.assertEqual(first['results'][0]['user'], 'reviewer3@example.com')
+        self.assertEqual(first['results'][0]['movie'], 'movie 0')
+        second = client.get(first['next']).data
+        self.assertEqual([review['review'] for review in second['results']], ['review 0'])
+        self.assertIsNone(second['next'])
+
+    def test_first_page_is_cached_until_a_review_changes(self):
+        client = APIClient()
+        client.get(self.url)
+        with self.assertNumQueries(0):
+            client.get(self.url)
+        review = MovieReview.objects.get(review='review 3')
+        self.clients[3].put('/watchlist/v1/review-put-delete/%d' % review.pk, {'review': 'changed'})
+        self.assertEqual(client.get(self.url).data['results'][0]['review'], 'changed')
+        self.clients[3].delete('/watchlist/v1/review-put-delete/%d' % review.pk)
+        self.assertEqual(client.get(self.url).data['results'][0]['review'], 'review 2')
+        self.clients[3].post('/watchlist/v1/review-movie/', {'movie_title': 'movie 0', 'review': 'again'})
+        self.assertEqual(client.get(self.url).data['results'][0]['review'], 'again')
+
+    def test_feed_moves_after_commit(self):
+        client = APIClient()
+        client.get(self.url)
+        with transaction.atomic():
+            MovieReview.objects.filter(review='review 3').update(review='changed')
+            MovieReview.objects.get(review='changed').save()
+            # the cached page stays until the commit, so it can't be replaced by one read before it
+            self.assertEqual(client.get(self.url).data['results'][0]['review'], 'review 3')
+        self.assertEqual(client.get(self.url).data['results'][0]['review'], 'changed')
+
+    def test_unknown_movie(self):
+        self.assertEqual(APIClient().get('/watchlist/v1/moviedetail/999/reviews/').status_code, 404)
+
+    def test_review_list_joins_the_movie(self):
+        # page + movie joined in, whatever the page size
+        with self.assertNumQueries(1):
+            APIClient().get('/watchlist/v1/movie-review-list/', {'paginate': 'cursor'})
+
+
+class ReviewImportTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.movies = create_catalog(4)
+        self.reviewer, self.client = create_user('reviewer')
+        self.client.post('/watchlist/v1/review-movie/', {'movie_title': 'movie 0', 'review': 'existing'})
+
+    def test_endpoint_dedupes_and_reports(self):
+        # the feed is cached before the import, which has to invalidate it
+        APIClient().get('/watchlist/v1/moviedetail/%d/reviews/' % self.movies[1].pk)
+        rows = [{'movie_title': 'movie 0', 'review': 'again'}, {'movie_title': 'movie 1', 'review': 'first'},
+                {'movie_title': 'movie 1', 'review': 'repeated'}, {'movie_title': 'missing', 'review': 'x'},
+                {'review': 'no title'}, 'not an object', {'movie_title': 'movie 2', 'review': 'second'}]
+        body = '\n'.join(json.dumps(row) for row in rows) + '\n'
+        response = self.client.post('/watchlist/v1/review-movie/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({key: response.data[key] for key in ('rows', 'created', 'duplicates', 'failed')},
+                         {'rows': 7, 'created': 2, 'duplicates': 2, 'failed': 3})
+        self.assertEqual([error['index'] for error in response.data['errors']], [3, 4, 5])
+        self.assertIn('rows_per_second', response.data)
+        self.assertEqual(MovieReview.objects.get(movie=self.movies[1]).review, 'first')
+        self.assertEqual(Movie.objects.get(title='movie 1').review_count, 1)
+        feed = APIClient().get('/watchlist/v1/moviedetail/%d/reviews/' % self.movies[1].pk).data
+        self.assertEqual([review['review'] for review in feed['results']], ['first'])
+
+    def test_endpoint_accepts_json_and_needs_a_reviewer(self):
+        response = self.client.post('/watchlist/v1/review-movie/bulk/', [{'movie_title': 'movie 3', 'review': 'ok'}],
+                                    format='json')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(self.client.post('/watchlist/v1/review-movie/bulk/', {'movie_title': 'movie 3'},
+                                          format='json').status_code, 400)
+        _, watcher_client = create_user('watcher')
+        self.assertEqual(watcher_client.post('/watchlist/v1/review-movie/bulk/', [], format='json').status_code, 403)
+
+    def test_command_streams_batches(self):
+        other, _ = create_user('reviewer', 'critic@example.com')
+        rows = [{'user': email, 'movie_title': 'movie %d' % i, 'review': 'archive'}
+                for email in ('reviewer@example.com', 'critic@example.com', 'nobody@example.com') for i in range(4)]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as file:
+            file.write('\n'.join(json.dumps(row) for row in rows))
+        out, err = StringIO(), StringIO()
+        try:
+            call_command('import_reviews', file.name, batch_size=5, stdout=out, stderr=err)
+        finally:
+            os.unlink(file.name)
+        self.assertIn('12 rows, 7 created, 1 duplicates, 4 failed', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        self.assertIn('reviewer does not exist: nobody@example.com', err.getvalue())
+        self.assertEqual(MovieReview.objects.filter(user=other).count(), 4)
+        self.assertEqual(Movie.objects.get(title='movie 3').review_count, 2)
+
+    def test_reviews_inserted_concurrently_are_duplicates(self):
+        def racing(model, objects, fields):
+            MovieReview.objects.bulk_create([MovieReview(user=self.reviewer, movie=self.movies[1], review='racing')])
+            return insert_new(model, objects, fields)
+
+        rows = [{'movie_title': 'movie 1', 'review': 'late'}, {'movie_title': 'movie 2', 'review': 'new'}]
+        with mock.patch('movie.serializers.insert_new', racing):
+            response = self.client.post('/watchlist/v1/review-movie/bulk/', rows, format='json')
+        self.assertEqual((response.data['created'], response.data['duplicates']), (1, 1))
+        self.assertEqual(MovieReview.objects.get(movie=self.movies[1]).review, 'racing')
+        self.assertEqual(Movie.objects.get(title='movie 1').review_count, 0)
+        self.assertEqual(Movie.objects.get(title='movie 2').review_count, 1)
+
+    def test_command_stops_at_invalid_json(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as file:
+            file.write('{"user": "reviewer@example.com", "movie_title": "movie 1", "review": "ok"}\n{broken\n')
+        try:
+            with self.assertRaisesMessage(CommandError, 'line 2'):
+                call_command('import_reviews', file.name, batch_size=1, stdout=StringIO(), stderr=StringIO())
+        finally:
+            os.unlink(file.name)
+        self.assertTrue(MovieReview.objects.filter(movie=self.movies[1]).exists())
+
+
+class CatalogChangesTest(TransactionTestCase):
+
+    # sequence numbers start at 1 in every test
+    reset_sequences = True
+    url = '/watchlist/v1/changes/'
+
+    def setUp(self):
+        cache.clear()
+        self.movies = create_catalog(2)
+        self.head = APIClient().get(self.url, {'limit': 1000}).data['last_sequence']
+
+    def changes(self, **params):
+        return APIClient().get(self.url, dict({'since': self.head}, **params)).data
+
+    def test_logs_upserts_and_deletes_in_order(self):
+        movie = self.movies[0]
+        movie.runtime = 120
+        movie.save()
+        drama = Genre.objects.get(name='Drama')
+        drama_id = drama.pk
+        drama.delete()
+        deleted_id = self.movies[1].pk
+        self.movies[1].delete()
+        data = self.changes()
+        entries = [(change['kind'], change['id'], change['action']) for change in data['results']]
+        self.assertEqual(entries[0], ('movie', movie.pk, 'upsert'))
+        self.assertIn(('genre', drama_id, 'delete'), entries)
+        self.assertEqual(entries[-1], ('movie', deleted_id, 'delete'))
+        self.assertEqual(data['results'][0]['data']['runtime'], 120)
+        self.assertIsNone(data['results'][-1]['data'])
+        sequences = [change['sequence'] for change in data['results']]
+        self.assertEqual(sequences, sorted(sequences))
+        self.assertEqual(data['last_sequence'], sequences[-1])
+        self.assertFalse(data['has_more'])
+
+    def test_pages_follow_the_sequence(self):
+        for movie in self.movies:
+            movie.save()
+        first = self.changes(limit=1)
+        self.assertTrue(first['has_more'])
+        self.assertEqual(first['results'][0]['id'], self.movies[0].pk)
+        second = APIClient().get(first['next']).data
+        self.assertEqual(second['results'][0]['id'], self.movies[1].pk)
+        self.assertFalse(second['has_more'])
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.changes(since=second['last_sequence'])['results'], [])
+
+    def test_platform_rename_upserts_its_movies(self):
+        platform = StreamPlatform.objects.get(name='Hulu')
+        platform.name = 'Hulu+'
+        platform.save()
+        entries = {(change['kind'], change['id']) for change in self.changes()['results']}
+        self.assertEqual(entries, {('stream_platform', platform.pk)} | {('movie', movie.pk) for movie in self.movies})
+
+    def test_pruned_log_is_gone(self):
+        self.movies[0].save()
+        self.movies[1].save()
+        out = StringIO()
+        call_command('prune_changelog', days=-1, stdout=out)
+        self.assertIn('changes pruned', out.getvalue())
+        response = APIClient().get(self.url, {'since': 1})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(APIClient().get(self.url).status_code, 410)
+        # the newest change is kept, so a mirror that saw the one before it can still catch up
+        latest = APIClient().get(self.url, {'since': self.head + 1})
+        self.assertEqual(latest.status_code, 200)
+        self.assertEqual([change['id'] for change in latest.data['results']], [self.movies[1].pk])
+
+    def test_reads_from_the_start(self):
+        response = APIClient().get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['sequence'], 1)
+        self.assertEqual(response.data['last_sequence'], self.head)
+
+    def test_bad_parameters(self):
+        self.assertEqual(APIClient().get(self.url, {'since': 'x'}).status_code, 400)
+        self.assertEqual(APIClient().get(self.url, {'limit': 'x'}).status_code, 400)
+
+
+class ReadReplicaTest(TransactionTestCase):
+
+    aliases = ['replica1', 'replica2']
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for alias in self.aliases:
+            connections.settings[alias] = dict(connections.settings['default'],
+                                               NAME=os.path.join(directory.name, alias + '.sqlite3'))
+            self.addCleanup(self.remove_alias, alias)
+        replica_settings = override_settings(DATABASE_REPLICAS={'ALIASES': self.aliases, 'STICKY_SECONDS': 5})
+        replica_settings.enable()
+        self.addCleanup(replica_settings.disable)
+        self.movies = create_catalog(2)
+        replicas.replicate()
+        # written after the last replication, only the primary has it
+        Movie.objects.create(title='fresh', synopsis='synopsis', runtime=100)
+
+    @staticmethod
+    def remove_alias(alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+    def count(self, client):
+        return client.get('/watchlist/v1/movie-list/').data['count']
+
+    def test_safe_requests_read_from_replicas(self):
+        anonymous = APIClient()
+        self.assertEqual(self.count(anonymous), 2)
+        replicas.replicate()
+        self.assertEqual(self.count(anonymous), 3)
+        # reads outside a request stay on the primary
+        self.assertEqual(replicas.ReplicaRouter().db_for_read(Movie), 'default')
+
+    def test_one_replica_per_request(self):
+        client = APIClient()
+        for _ in range(10):
+            with CaptureQueriesContext(connections['replica1']) as first, \
+                    CaptureQueriesContext(connections['replica2']) as second:
+                client.get('/watchlist/v1/movie-list/')
+            # count, page and the prefetches all go to the same replica
+            self.assertEqual(len(first) * len(second), 0)
+            self.assertGreater(len(first) + len(second), 2)
+
+    def test_async_requests_read_from_replicas(self):
+        async def get_response(request):
+            return replicas._replica.get()
+
+        middleware = replicas.ReplicaMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertIn(async_to_sync(middleware)(RequestFactory().get('/')), self.aliases)
+        response = async_to_sync(AsyncClient().get)('/watchlist/v1/async/movie-list/')
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_client_reads_its_writes_from_the_primary(self):
+        _, watcher = create_user('watcher')
+        response = watcher.post('/watchlist/v1/watch-list/create/', {'movie_title': 'fresh'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.count(watcher), 3)
+        self.assertEqual(len(watcher.get('/watchlist/v1/watch-list/').data['results']), 1)
+        # other clients are not pinned
+        self.assertEqual(self.count(APIClient()), 2)
+        cache.delete(replicas.client_key(watcher.get('/watchlist/v1/movie-list/').wsgi_request))
+        self.assertEqual(self.count(watcher), 2)
+
+    def test_caches_load_from_the_primary(self):
+        fresh = Movie.objects.get(title='fresh')
+        response = APIClient().get('/watchlist/v1/moviedetail/%d/' % fresh.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'fresh')
+        # a token issued after the last replication authenticates
+        _, watcher = create_user('watcher')
+        self.assertEqual(watcher.get('/watchlist/v1/watch-list/').status_code, 200)
+
+    def test_replicate_command(self):
+        out = StringIO()
+        call_command('replicate', stdout=out)
+        self.assertIn('replica1, replica2 replicated', out.getvalue())
+        self.assertEqual(self.count(APIClient()), 3)
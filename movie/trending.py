@@ -0,0 +1,154 @@
+import math
+from datetime import date, timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Subquery
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+from .models import MovieTrend, TrendEpoch, WatchList, MovieReview
+
+# trending rankings with exponential decay, maintained on every watchlist and review write
+#
+# events are bucketed by day and each bucket weighs 2 ** (days since the epoch / half life), so a movie's
+# stored score is the sum of the weights of its events. dividing every score by today's weight gives the
+# decayed count, and since that divides all scores alike the order never changes as time passes: the
+# ranking is a plain ORDER BY score DESC LIMIT k on the (kind, -score) index, no matter how old the rows are.
+#
+# there is no hard window: "trending this week" means an event counts 1 today, 1/2 a half life ago, 1/4 two
+# half lives ago and so on, a movie watchlisted by many a month ago still outranks one added once today.
+# `rebuild_trending --days N` recomputes the rankings from the last N days only, run periodically it gives
+# the ranking a real window on top of the decay
+#
+# the weights double every half life and grow without bound. the epoch is kept in TrendEpoch and
+# `rebase_trending`, run periodically (monthly is plenty), moves it to today and rescales every score in one
+# UPDATE, so the weights stay small. without a TrendEpoch row the epoch is EPOCH, which migration 0012 ranked
+# the existing activity with
+#
+# scores never go below zero: after `rebuild_trending --days N` the activity older than the window is not
+# counted, removing it later would take back weight that was never added. the clamp leaves the score of such
+# a movie a little low until the next rebuild instead of negative
+
+WATCHLIST = MovieTrend.WATCHLIST
+REVIEW = MovieTrend.REVIEW
+SOURCES = {WATCHLIST: WatchList, REVIEW: MovieReview}
+# the epoch until the first rebase
+EPOCH = date(2026, 1, 1)
+DEFAULTS = {
+    'HALF_LIFE_DAYS': 7,
+    'DEFAULT_LIMIT': 10,
+    'MAX_LIMIT': 100,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'TRENDING', {}).get(name, DEFAULTS[name])
+
+
+def weight(day, epoch):
+    return math.pow(2, (day - epoch).days / get_setting('HALF_LIFE_DAYS'))
+
+
+def get_epoch():
+    """the day the stored scores are relative to, read in the transaction that adds to them"""
+    epoch = TrendEpoch.objects.values_list('day', flat=True).first()
+    return EPOCH if epoch is None else epoch
+
+
+def set_epoch(day):
+    if not TrendEpoch.objects.update(day=day):
+        TrendEpoch.objects.create(day=day)
+
+
+def bucket(moment):
+    return timezone.localdate(moment) if timezone.is_aware(moment) else moment.date()
+
+
+def add(kind, events, sign=1):
+    """events are (movie_id, added_at) pairs, sign=-1 takes back the weight of removed rows
+    call it inside the transaction that adds or removes the rows, a batch costs a few queries per
+    distinct amount instead of one per movie"""
+    if not events:
+        return
+    epoch = get_epoch()
+    by_movie = {}
+    for movie_id, added_at in events:
+        by_movie[movie_id] = by_movie.get(movie_id, 0) + sign * weight(bucket(added_at), epoch)
+    grouped = {}
+    for movie_id, amount in by_movie.items():
+        grouped.setdefault(amount, []).append(movie_id)
+    for amount, ids in grouped.items():
+        rows = MovieTrend.objects.filter(kind=kind, movie_id__in=ids)
+        present = set(rows.values_list('movie_id', flat=True))
+        if present:
+            rows.update(score=shifted(amount))
+        missing = [movie_id for movie_id in ids if movie_id not in present]
+        if not missing:
+            continue
+        try:
+            with transaction.atomic():
+                MovieTrend.objects.bulk_create([MovieTrend(kind=kind, movie_id=movie_id, score=max(amount, 0))
+                                                for movie_id in missing])
+        except IntegrityError:
+            # another writer created some of the rows in between
+            for movie_id in missing:
+                add_one(kind, movie_id, amount)
+
+
+def add_one(kind, movie_id, amount):
+    if MovieTrend.objects.filter(kind=kind, movie_id=movie_id).update(score=shifted(amount)):
+        return
+    try:
+        with transaction.atomic():
+            MovieTrend.objects.create(kind=kind, movie_id=movie_id, score=max(amount, 0))
+    except IntegrityError:
+        MovieTrend.objects.filter(kind=kind, movie_id=movie_id).update(score=shifted(amount))
+
+
+def shifted(amount):
+    return Greatest(F('score') + amount, 0.0)
+
+
+def top(kind, limit):
+    """the `limit` highest ranked movies, each with its decayed count as of today in `score`"""
+    # the epoch comes with the rows, a rebase between two queries would scale them wrong
+    rows = MovieTrend.objects.filter(kind=kind, score__gt=0).select_related('movie').order_by('-score').annotate(
+        epoch=Subquery(TrendEpoch.objects.values('day')[:1], output_field=DateField()))[:limit]
+    movies = []
+    for row in rows:
+        today = weight(timezone.localdate(), row.epoch or EPOCH)
+        row.movie.score = round(row.score / today, 3)
+        movies.append(row.movie)
+    return movies
+
+
+def rebuild(days=None):
+    """recomputes every ranking from the watchlist and review tables with one grouped query per kind,
+    with `days` only the activity of the last `days` days is kept"""
+    epoch = get_epoch()
+    rows = []
+    for kind, model in SOURCES.items():
+        events = model.objects.all()
+        if days is not None:
+            events = events.filter(added_at__gte=timezone.now() - timedelta(days=days))
+        scores = {}
+        buckets = events.order_by().values('movie', day=TruncDate('added_at')).annotate(count=Count('id'))
+        for row in buckets:
+            scores[row['movie']] = scores.get(row['movie'], 0) + row['count'] * weight(row['day'], epoch)
+        rows.extend(MovieTrend(kind=kind, movie_id=movie_id, score=score) for movie_id, score in scores.items())
+    with transaction.atomic():
+        MovieTrend.objects.all().delete()
+        MovieTrend.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rebase(day=None):
+    """moves the epoch to `day`, today by default, and rescales every score to it, the rankings and the
+    decayed counts don't change. returns the new epoch"""
+    day = day or timezone.localdate()
+    with transaction.atomic():
+        # the epoch row is locked first, a concurrent rebase waits and rescales from the new epoch
+        epoch = TrendEpoch.objects.select_for_update().values_list('day', flat=True).first() or EPOCH
+        if day != epoch:
+            MovieTrend.objects.update(score=F('score') / weight(day, epoch))
+            set_epoch(day)
+    return day
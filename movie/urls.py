@@ -1,8 +1,11 @@
 from django.urls import path
+from .async_views import AsyncMovieListAPI, AsyncMovieDetail, AsyncReviewsAPI, AsyncWatchListAPI
 from .views import GenreListCreateAPI, MovieCreateAPI, MovieDetail, \
-                   WatchListCreateAPI, WatchListDetail, ReviewsAPI, \
+                   WatchListCreateAPI, WatchListDetail, WatchListBatchAPI, ReviewsAPI, \
                    ReviewMovieAPI, ReviewDetail, ReviewDetailPutDelete, MovieListAPI, WatchListAPI, StreamPlatformAPI, \
-                   StreamPlatformDetail
+                   StreamPlatformDetail, MovieBulkCreateAPI, MovieExportAPI, TrendingAPI, \
+                   SimilarMoviesAPI, RecommendationsAPI, MovieReviewFeedAPI, ReviewBulkImportAPI, \
+                   CatalogChangesAPI
 
 
 urlpatterns = [
@@ -10,13 +13,26 @@ urlpatterns = [
     path('stream-platform/<int:pk>/', StreamPlatformDetail.as_view()),
     path('genre/', GenreListCreateAPI.as_view()),
     path('movie/', MovieCreateAPI.as_view()),
+    path('movie/bulk/', MovieBulkCreateAPI.as_view()),
     path('movie-list/', MovieListAPI.as_view()),
+    path('movie-export/', MovieExportAPI.as_view()),
+    path('trending/', TrendingAPI.as_view()),
+    path('changes/', CatalogChangesAPI.as_view()),
     path('moviedetail/<int:pk>/', MovieDetail.as_view()),
+    path('moviedetail/<int:pk>/similar/', SimilarMoviesAPI.as_view()),
+    path('moviedetail/<int:pk>/reviews/', MovieReviewFeedAPI.as_view()),
     path('watch-list/', WatchListAPI.as_view()),
     path('watch-list/create/', WatchListCreateAPI.as_view()),
+    path('watch-list/batch/', WatchListBatchAPI.as_view()),
+    path('watch-list/recommendations/', RecommendationsAPI.as_view()),
     path('watch-list-detail/<int:pk>', WatchListDetail.as_view()),
     path('movie-review-list/', ReviewsAPI.as_view()),
     path('review-movie/', ReviewMovieAPI.as_view()),
+    path('review-movie/bulk/', ReviewBulkImportAPI.as_view()),
     path('review-detail/<int:pk>', ReviewDetail.as_view()),
-    path('review-put-delete/<int:pk>', ReviewDetailPutDelete.as_view())
+    path('review-put-delete/<int:pk>', ReviewDetailPutDelete.as_view()),
+    path('async/movie-list/', AsyncMovieListAPI.as_view()),
+    path('async/moviedetail/<int:pk>/', AsyncMovieDetail.as_view()),
+    path('async/watch-list/', AsyncWatchListAPI.as_view()),
+    path('async/movie-review-list/', AsyncReviewsAPI.as_view())
 ]
\ No newline at end of file
@@ -1,35 +1,53 @@
+import csv
+import json
+from types import GeneratorType
 from django.shortcuts import render
+from django.http import StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
-from .models import Genre, Movie, WatchList, MovieReview, StreamPlatform
+from .models import Movie, WatchList, MovieReview, StreamPlatform
 from .serializers import GenreSerializer, MovieSerializer, WatchListSerializer, MovieReviewSerializer, \
-    StreamPlatformSerializer, IsWatcher, IsReviewer
+    StreamPlatformSerializer, IsWatcher, IsReviewer, bulk_create_movies, MOVIE_PREFETCH, \
+    MovieListSerializer, RankedMovieSerializer, MovieReviewFeedSerializer, import_reviews, insert_new
+from .parsers import NDJSONParser, StreamingNDJSONParser
+from .pagination import OptInCursorPagination, AddedAtCursorPagination, ReviewFeedPagination
+from .search import FullTextSearchFilter
+from .filters import CatalogFilter
+from . import cache as movie_cache
+from . import changelog, counters, facets, recommendations, snapshot, trending
 from django.shortcuts import get_object_or_404
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
+from user.authentication import CachedTokenAuthentication
 from rest_framework.generics import ListAPIView
 from rest_framework import serializers
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.parsers import JSONParser
+from rest_framework.utils.urls import replace_query_param
 
 
 class GenreListCreateAPI(APIView):
     def get(self, request):
-        genres = Genre.objects.all()
-        serializer = GenreSerializer(genres, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(movie_cache.get_genre_list(), status=status.HTTP_200_OK)
 
     def post(self, request):
         genre_name = request.data.get('name')
-        if Genre.objects.filter(name=genre_name).exists():
+        if genre_name in movie_cache.get_genre_ids():
             return Response({'message': 'genre already exist'}, status=status.HTTP_400_BAD_REQUEST)
         serializer = GenreSerializer(data=request.data)
 
         try:
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response({'message': 'genre created'}, status=status.HTTP_201_CREATED)
+        except IntegrityError:
+            return Response({'message': 'genre already exist'}, status=status.HTTP_400_BAD_REQUEST)
         except serializers.ValidationError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
@@ -38,31 +56,47 @@ class GenreListCreateAPI(APIView):
 
 class StreamPlatformAPI(APIView):
     def get(self, request):
-        stream_platforms = StreamPlatform.objects.all()
-        serializer = StreamPlatformSerializer(stream_platforms, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(movie_cache.get_stream_platform_list(), status=status.HTTP_200_OK)
 
     def post(self, request):
         stream_platform_name = request.data.get('name')
-        if StreamPlatform.objects.filter(name=stream_platform_name).exists():
+        if stream_platform_name in movie_cache.get_stream_platform_ids():
             return Response({'message': 'stream platform already exist'}, status=status.HTTP_400_BAD_REQUEST)
         serializer = StreamPlatformSerializer(data=request.data)
 
         try:
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response({'message': 'stream platform created'}, status=status.HTTP_201_CREATED)
+        except IntegrityError:
+            return Response({'message': 'stream platform already exist'}, status=status.HTTP_400_BAD_REQUEST)
         except serializers.ValidationError as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'error': e.detail}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+def conditional_detail_response(request, etag, get_detail):
+    """answers a matching If-None-Match with 304 before the payload is loaded, otherwise returns the
+    cached payload with its ETag and Last-Modified validators"""
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    data, last_modified, etag = get_detail()
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    if not_modified is not None:
+        return not_modified
+    response = Response(data)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
 class StreamPlatformDetail(APIView):
     def get(self, request, pk):
-        stream_platform = get_object_or_404(StreamPlatform, pk=pk)
-        serializer = StreamPlatformSerializer(stream_platform)
-        return Response(serializer.data)
+        return conditional_detail_response(request, movie_cache.stream_platform_etag(pk),
+                                           lambda: movie_cache.get_stream_platform_detail(pk))
 
     def put(self, request, pk):
         stream_platform = get_object_or_404(StreamPlatform, pk=pk)
@@ -70,10 +104,13 @@ class StreamPlatformDetail(APIView):
 
         try:
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response({'message': 'stream platform updated'}, status=status.HTTP_201_CREATED)
+        except IntegrityError:
+            return Response({'message': 'stream platform already exist'}, status=status.HTTP_400_BAD_REQUEST)
         except serializers.ValidationError as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'error': e.detail}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -87,38 +124,242 @@ class StreamPlatformDetail(APIView):
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class MovieListAPI(ListAPIView):
-    queryset = Movie.objects.all()
-    serializer_class = MovieSerializer
-    pagination_class = PageNumberPagination
-    filter_backends = (SearchFilter, OrderingFilter)
+class CatalogListMixin:
+
+    """the snapshot and facets of the movie list, shared with its async variant
+    ?facets=true adds the number of matching movies per genre and stream platform, see movie.facets
+    with CATALOG_SNAPSHOT enabled, page number requests that order by at most one field of
+    snapshot.ORDERABLE are served from the in-memory catalog, search and cursor pagination always go to
+    the database"""
+
+    queryset = Movie.objects.prefetch_related(*MOVIE_PREFETCH).order_by('id')
+    serializer_class = MovieListSerializer
+    pagination_class = OptInCursorPagination
+    filter_backends = (CatalogFilter, FullTextSearchFilter, OrderingFilter)
     search_fields = ('title', 'genre__name', 'stream_platform__name')
 
+    def wants_facets(self, request):
+        return request.query_params.get('facets') in ('1', 'true')
+
+    def get_snapshot_ordering(self, request):
+        """the ordering the snapshot would serve the request with, None when it has to go to the database"""
+        params = request.query_params
+        if params.get('search') or params.get('paginate') == 'cursor':
+            return None
+        ordering = params.get('ordering', 'id').strip()
+        return ordering if ordering.lstrip('-') in snapshot.ORDERABLE else None
+
+    def get_facets(self, request):
+        index = facets.get()
+        within = None
+        if request.query_params.get('search'):
+            # the search has to run in the database, the facets are counted among its matches
+            matches = FullTextSearchFilter().filter_queryset(request, Movie.objects.all(), self)
+            within = index.positions_of(matches.values_list('pk', flat=True))
+        return index.counts(CatalogFilter().get_filters(request), within)
+
+
+class MovieListAPI(CatalogListMixin, ListAPIView):
+
+    """filters of CatalogFilter, full text ?search= and ?ordering=, plus the facets and snapshot of
+    CatalogListMixin"""
+
+    def list(self, request, *args, **kwargs):
+        ordering = self.get_snapshot_ordering(request)
+        catalog = snapshot.get() if ordering else None
+        if catalog is None:
+            response = super().list(request, *args, **kwargs)
+        else:
+            selected = catalog.select(CatalogFilter().get_filters(request), ordering)
+            response = self.get_paginated_response(self.paginate_queryset(snapshot.Page(catalog, selected)))
+        if self.wants_facets(request):
+            response.data['facets'] = self.get_facets(request)
+        return response
+
+
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_CSV_HEADER = ['id', 'title', 'synopsis', 'runtime', 'genre', 'stream_platform', 'created_at', 'updated_at']
+
+
+class Echo:
+    """file-like object for csv.writer, returns the written row instead of buffering it"""
+
+    def write(self, value):
+        return value
+
+
+def export_movies():
+    # iterator() keeps only one chunk of movies (and its prefetched genres/platforms) in memory at a time
+    movies = Movie.objects.prefetch_related('genre', 'stream_platform').order_by('id')
+    for movie in movies.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'id': movie.id,
+            'title': movie.title,
+            'synopsis': movie.synopsis,
+            'runtime': movie.runtime,
+            'genre': [genre.name for genre in movie.genre.all()],
+            'stream_platform': [stream_platform.name for stream_platform in movie.stream_platform.all()],
+            'created_at': movie.created_at,
+            'updated_at': movie.updated_at,
+        }
+
+
+def get_limit(request, default, maximum):
+    """?limit= clamped to 1..maximum, ValueError when it is not a number"""
+    return max(1, min(int(request.query_params.get('limit', default)), maximum))
+
+
+class TrendingAPI(APIView):
+
+    """?kind=watchlist (default) or review, ?limit= up to TRENDING['MAX_LIMIT']
+    served from the precomputed rankings in movie.trending, so a read costs the top rows only"""
+
+    def get(self, request):
+        kind = request.query_params.get('kind', trending.WATCHLIST)
+        if kind not in trending.SOURCES:
+            return Response({'error': 'kind must be one of %s' % ', '.join(trending.SOURCES)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = get_limit(request, trending.get_setting('DEFAULT_LIMIT'), trending.get_setting('MAX_LIMIT'))
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = RankedMovieSerializer(trending.top(kind, limit), many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class SimilarMoviesAPI(APIView):
+
+    """users who watchlisted this movie also watchlisted, read from the index of movie.recommendations"""
+
+    def get(self, request, pk):
+        try:
+            limit = get_limit(request, recommendations.get_setting('DEFAULT_LIMIT'),
+                              recommendations.get_setting('MAX_LIMIT'))
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        movies = recommendations.similar(pk, limit)
+        if not movies:
+            get_object_or_404(Movie, pk=pk)
+        serializer = RankedMovieSerializer(movies, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class RecommendationsAPI(APIView):
+
+    """movies similar to the ones in the watcher's watchlist that are not in it yet"""
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated, IsWatcher]
+
+    def get(self, request):
+        try:
+            limit = get_limit(request, recommendations.get_setting('DEFAULT_LIMIT'),
+                              recommendations.get_setting('MAX_LIMIT'))
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = RankedMovieSerializer(recommendations.for_user(request.user, limit), many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class MovieExportAPI(APIView):
+
+    """streams the whole catalog as ndjson (default) or csv, pick with ?output=ndjson or ?output=csv"""
+
+    def get(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output == 'ndjson':
+            rows = (json.dumps(movie, cls=DjangoJSONEncoder) + '\n' for movie in export_movies())
+            content_type = 'application/x-ndjson'
+        elif output == 'csv':
+            writer = csv.writer(Echo())
+            rows = (writer.writerow(row) for row in self.csv_rows())
+            content_type = 'text/csv'
+        else:
+            return Response({'error': 'output should be ndjson or csv'}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(rows, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="movies.%s"' % output
+        return response
+
+    def csv_rows(self):
+        yield EXPORT_CSV_HEADER
+        for movie in export_movies():
+            movie['genre'] = '|'.join(movie['genre'])
+            movie['stream_platform'] = '|'.join(movie['stream_platform'])
+            yield [movie[column] for column in EXPORT_CSV_HEADER]
+
+
+class CatalogChangesAPI(APIView):
+
+    """changes to movies, genres and stream platforms after ?since=<sequence> (0 or absent from the start of
+    the log), ?limit= up to CHANGELOG['MAX_LIMIT']. follow `next` until has_more is false, then keep
+    last_sequence for the next sync. 410 when the log was pruned past `since`, the mirror has to reload"""
+
+    def get(self, request):
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return Response({'error': 'since must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = get_limit(request, changelog.get_setting('DEFAULT_LIMIT'), changelog.get_setting('MAX_LIMIT'))
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            results, has_more = changelog.changes_since(since, limit)
+        except changelog.Expired:
+            return Response({'error': 'changes after %d were pruned, reload the catalog' % since},
+                            status=status.HTTP_410_GONE)
+        last = results[-1]['sequence'] if results else since
+        return Response({
+            'next': replace_query_param(request.build_absolute_uri(), 'since', last) if has_more else None,
+            'last_sequence': last,
+            'has_more': has_more,
+            'results': results,
+        }, status=status.HTTP_200_OK)
+
 
 class MovieCreateAPI(APIView):
 
     def post(self, request):
-        movie_title = request.data.get('title')
-        if Movie.objects.filter(title=movie_title).exists():
-            return Response({'message': 'movie already exist'}, status=status.HTTP_400_BAD_REQUEST)
         serializer = MovieSerializer(data=request.data)
 
         try:
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response({'message': 'movie created'}, status=status.HTTP_201_CREATED)
+        except IntegrityError:
+            return Response({'message': 'movie already exist'}, status=status.HTTP_400_BAD_REQUEST)
         except serializers.ValidationError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class MovieBulkCreateAPI(APIView):
+
+    """accepts a json array or ndjson (application/x-ndjson) of movies and creates them in one transaction
+    the response has one result per row in the same order, rows that failed validation are not created"""
+
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            return Response({'error': 'expected a list of movies'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = bulk_create_movies(request.data)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response({'created': created, 'failed': len(results) - created, 'results': results},
+                        status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+
 class MovieDetail(APIView):
 
     def get(self, request, pk):
-        movie = get_object_or_404(Movie, pk=pk)
-        serializer = MovieSerializer(movie)
-        return Response(serializer.data)
+        return conditional_detail_response(request, movie_cache.movie_etag(pk),
+                                           lambda: movie_cache.get_movie_detail(pk))
 
     def put(self, request, pk):
         movie = get_object_or_404(Movie, pk=pk)
@@ -126,8 +367,11 @@ class MovieDetail(APIView):
 
         try:
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response({'message': 'movie updated'}, status=status.HTTP_201_CREATED)
+        except IntegrityError:
+            return Response({'message': 'movie already exist'}, status=status.HTTP_400_BAD_REQUEST)
         except serializers.ValidationError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
@@ -145,9 +389,9 @@ class MovieDetail(APIView):
 
 class WatchListAPI(ListAPIView):
     serializer_class = WatchListSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsWatcher]
-    pagination_class = PageNumberPagination
+    pagination_class = AddedAtCursorPagination
     filter_backends = (SearchFilter, OrderingFilter)
     search_fields = ['movie__title']
 
@@ -161,14 +405,11 @@ class WatchListCreateAPI(APIView):
     if user has different roles, it will return a message based on the custom permission created
     it should satisfy both permission classes"""
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsWatcher]
 
     def post(self, request):
         movie_title = request.data.get('movie_title')
-        # print(movie_title) verify the input data
-        if WatchList.objects.filter(movie__title=movie_title, user=request.user).exists():
-            return Response({'message': 'movie already exist in your watchlist'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             movie = Movie.objects.get(title=movie_title)
@@ -178,17 +419,113 @@ class WatchListCreateAPI(APIView):
 
         try:
             serializer.is_valid(raise_exception=True)
-            serializer.save(user=request.user, movie=movie)
+            with transaction.atomic():
+                item = serializer.save(user=request.user, movie=movie)
+                counters.add(counters.WATCHLIST, [movie.pk])
+                trending.add(trending.WATCHLIST, [(movie.pk, item.added_at)])
             return Response({'message': 'movie was added to your watchlist'}, status=status.HTTP_201_CREATED)
+        except IntegrityError:
+            return Response({'message': 'movie already exist in your watchlist'}, status=status.HTTP_400_BAD_REQUEST)
         except serializers.ValidationError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def resolve_movies(items):
+    """maps every item of a batch, a movie id (int) or title (str), to its movie id or None, in one query"""
+    ids = {item for item in items if isinstance(item, int)}
+    titles = {item for item in items if isinstance(item, str)}
+    found = Movie.objects.filter(Q(pk__in=ids) | Q(title__in=titles)).values_list('id', 'title')
+    by_id = dict(found)
+    by_title = {title: movie_id for movie_id, title in by_id.items()}
+    return [(item, (item if item in by_id else None) if item in ids else by_title.get(item)) for item in items]
+
+
+class WatchListBatchAPI(APIView):
+
+    """adds (POST) or removes (DELETE) many movies at once, {"movies": [<id or title>, ...]}
+    the batch is resolved with one query and written with one insert or delete, whatever its size
+    the response lists the status of every item in request order"""
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated, IsWatcher]
+    max_batch_size = 1000
+
+    def get_items(self, request):
+        # a json array or scalar body has no 'movies' key to look up
+        if not isinstance(request.data, dict):
+            raise serializers.ValidationError('expected an object like {"movies": [<id or title>, ...]}')
+        items = request.data.get('movies')
+        if not isinstance(items, list) or not items:
+            raise serializers.ValidationError('movies must be a non empty list of movie ids or titles')
+        if len(items) > self.max_batch_size:
+            raise serializers.ValidationError('at most %d movies per request' % self.max_batch_size)
+        if not all(isinstance(item, (int, str)) and not isinstance(item, bool) for item in items):
+            raise serializers.ValidationError('movies must be a non empty list of movie ids or titles')
+        return items
+
+    def post(self, request):
+        try:
+            resolved = resolve_movies(self.get_items(request))
+            movie_ids = {movie_id for _, movie_id in resolved if movie_id is not None}
+            existing = set(WatchList.objects.filter(user=request.user, movie_id__in=movie_ids)
+                           .values_list('movie_id', flat=True))
+            new_items = [WatchList(user=request.user, movie_id=movie_id) for movie_id in movie_ids - existing]
+            with transaction.atomic():
+                # a concurrent request of the same user may insert some of them first, those rows are skipped
+                new_items = insert_new(WatchList, new_items, ('user_id', 'movie_id'))
+                counters.add(counters.WATCHLIST, [item.movie_id for item in new_items])
+                trending.add(trending.WATCHLIST, [(item.movie_id, item.added_at) for item in new_items])
+        except serializers.ValidationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        added = {item.movie_id for item in new_items}
+        return Response({'added': len(added),
+                         'results': self.results(resolved, added, 'added', 'already in watchlist')},
+                        status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        try:
+            resolved = resolve_movies(self.get_items(request))
+            movie_ids = {movie_id for _, movie_id in resolved if movie_id is not None}
+            with transaction.atomic():
+                rows = list(WatchList.objects.select_for_update().filter(user=request.user, movie_id__in=movie_ids)
+                            .values_list('id', 'movie_id', 'added_at'))
+                WatchList.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+                counters.add(counters.WATCHLIST, [movie_id for _, movie_id, _ in rows], -1)
+                trending.add(trending.WATCHLIST, [(movie_id, added_at) for _, movie_id, added_at in rows], -1)
+        except serializers.ValidationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        removed = {movie_id for _, movie_id, _ in rows}
+        return Response({'removed': len(removed),
+                         'results': self.results(resolved, removed, 'removed', 'not in watchlist')},
+                        status=status.HTTP_200_OK)
+
+    @staticmethod
+    def results(resolved, done, done_status, skipped_status):
+        """per item status, a movie listed twice is only reported as done the first time"""
+        results, seen = [], set()
+        for item, movie_id in resolved:
+            if movie_id is None:
+                item_status = 'movie does not exist'
+            elif movie_id in done and movie_id not in seen:
+                item_status = done_status
+                seen.add(movie_id)
+            else:
+                item_status = skipped_status
+            results.append({'movie': item, 'status': item_status})
+        return results
+
+
 class WatchListDetail(APIView):
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsWatcher]
 
     def get(self, request, pk):
@@ -212,31 +549,54 @@ class WatchListDetail(APIView):
     def delete(self, request, pk):
         watchlist_item = get_object_or_404(WatchList, user=request.user, pk=pk)
 
-        try:
+        with transaction.atomic():
             watchlist_item.delete()
-            return Response({'message': 'movie deleted from watchlist'}, status=status.HTTP_204_NO_CONTENT)
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            counters.add(counters.WATCHLIST, [watchlist_item.movie_id], -1)
+            trending.add(trending.WATCHLIST, [(watchlist_item.movie_id, watchlist_item.added_at)], -1)
+        return Response({'message': 'movie deleted from watchlist'}, status=status.HTTP_204_NO_CONTENT)
 
 
 class ReviewsAPI(ListAPIView):
 
-    queryset = MovieReview.objects.all()
+    # the serializer prints the movie, so it is joined in instead of loaded per review
+    queryset = MovieReview.objects.select_related('movie')
     serializer_class = MovieReviewSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = AddedAtCursorPagination
     filter_backends = (SearchFilter, OrderingFilter)
     search_fields = ['movie__title']
 
 
+class MovieReviewFeedAPI(ListAPIView):
+
+    """reviews of one movie, newest first, keyset paginated over the (movie, -added_at) index
+    the first page is cached until a review of the movie is added, changed or deleted"""
+
+    serializer_class = MovieReviewFeedSerializer
+    pagination_class = ReviewFeedPagination
+
+    def get_queryset(self):
+        return MovieReview.objects.filter(movie_id=self.kwargs['pk']).select_related('movie', 'user')
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get(self.paginator.cursor_query_param):
+            return super().list(request, *args, **kwargs)
+
+        def load():
+            data = super(MovieReviewFeedAPI, self).list(request, *args, **kwargs).data
+            if not data['results']:
+                get_object_or_404(Movie, pk=kwargs['pk'])
+            return data
+
+        return Response(movie_cache.get_review_feed(kwargs['pk'], request.build_absolute_uri(), load))
+
+
 class ReviewMovieAPI(APIView):
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsReviewer]
 
     def post(self, request):
         movie_title = request.data.get('movie_title')
-        if MovieReview.objects.filter(movie__title=movie_title, user=request.user).exists():
-            return Response({'message': 'movie already exist in your review'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             movie = Movie.objects.get(title=movie_title)
@@ -246,14 +606,42 @@ class ReviewMovieAPI(APIView):
 
         try:
             serializer.is_valid(raise_exception=True)
-            serializer.save(user=request.user, movie=movie)
+            with transaction.atomic():
+                review = serializer.save(user=request.user, movie=movie)
+                counters.add(counters.REVIEW, [movie.pk])
+                trending.add(trending.REVIEW, [(movie.pk, review.added_at)])
             return Response({'message': 'review for the movie has been added'}, status=status.HTTP_201_CREATED)
+        except IntegrityError:
+            return Response({'message': 'movie already exist in your review'}, status=status.HTTP_400_BAD_REQUEST)
         except serializers.ValidationError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class ReviewBulkImportAPI(APIView):
+
+    """imports the reviewer's reviews from a json array or streamed ndjson of {"movie_title", "review"} rows
+    rows are written in batches as they are read, the response summarizes the import and reports the
+    first errors by row index, duplicates of existing reviews are skipped"""
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated, IsReviewer]
+    parser_classes = [JSONParser, StreamingNDJSONParser]
+
+    def post(self, request):
+        rows = request.data
+        if not isinstance(rows, (list, GeneratorType)):
+            return Response({'error': 'expected a list of reviews'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            summary = import_reviews(rows, user=request.user)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(summary,
+                        status=status.HTTP_201_CREATED if summary['created'] else status.HTTP_400_BAD_REQUEST)
+
+
 class ReviewDetail(APIView):
 
     def get(self, request, pk):
@@ -266,7 +654,7 @@ class ReviewDetailPutDelete(APIView):
 
     """reviewer only have the permission to PUT and DELETE review"""
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsReviewer]
 
     def put(self, request, pk):
@@ -285,8 +673,8 @@ class ReviewDetailPutDelete(APIView):
     def delete(self, request, pk):
         review = get_object_or_404(MovieReview, user=request.user, pk=pk)
 
-        try:
+        with transaction.atomic():
             review.delete()
-            return Response({'message': 'review for the movie has been deleted'}, status=status.HTTP_204_NO_CONTENT)
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            counters.add(counters.REVIEW, [review.movie_id], -1)
+            trending.add(trending.REVIEW, [(review.movie_id, review.added_at)], -1)
+        return Response({'message': 'review for the movie has been deleted'}, status=status.HTTP_204_NO_CONTENT)
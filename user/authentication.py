@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from watchlist.replicas import primary
+from .models import CustomUser
+
+# token key -> (expires at, user id, role, is_active), kept per process
+# the signals in user/signals.py evict entries when a token is deleted or its user changes, other processes
+# stop trusting an entry once its TTL runs out, so keep TOKEN_CACHE['TTL'] short
+
+
+class TokenCache:
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1:]
+
+    def set(self, key, user):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, user.pk, user.role, user.is_active)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def evict_key(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def evict_user(self, user_id):
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if entry[1] == user_id]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache(getattr(settings, 'TOKEN_CACHE', {}).get('SIZE', 10000),
+                         getattr(settings, 'TOKEN_CACHE', {}).get('TTL', 60))
+
+
+def partial_instance(model, **values):
+    """a model instance with only the given fields loaded, the rest are deferred"""
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db(model.objects.db, names, [values[name] for name in names])
+
+
+def cached_user(key):
+    """the user of a cached token, or None on a miss. only id, role and is_active are loaded, any other
+    field is fetched from the db the first time it is read"""
+    entry = token_cache.get(key)
+    if entry is None:
+        return None
+    user_id, role, is_active = entry
+    return partial_instance(CustomUser, id=user_id, role=role, is_active=is_active)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    """TokenAuthentication that skips the token/user query while the token is in the cache
+    the query goes to the primary database, so a token issued a moment ago works before it reaches the
+    read replicas"""
+
+    def authenticate_credentials(self, key):
+        user = cached_user(key)
+        if user is None:
+            with primary():
+                user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user)
+            return user, token
+        if not user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        return user, partial_instance(Token, key=key, user_id=user.pk)
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher as DjangoPBKDF2PasswordHasher
+
+
+class PBKDF2PasswordHasher(DjangoPBKDF2PasswordHasher):
+
+    """django's pbkdf2_sha256 hasher with the iteration count taken from PASSWORD_HASH_ITERATIONS
+    it keeps the algorithm name, so stored hashes stay valid and are rehashed on the next login
+    whenever the configured count differs from the one they were made with"""
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_ITERATIONS', DjangoPBKDF2PasswordHasher.iterations)
+
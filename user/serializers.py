@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import CustomUser, LogInUser
+from .models import CustomUser
 
 
 class CustomUserSerializer(serializers.ModelSerializer):
@@ -29,8 +29,6 @@ class CustomUserSerializer(serializers.ModelSerializer):
         return user
 
 
-class LogInUserSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        model = LogInUser
-        fields = ['id', 'email', 'password']
+class LogInUserSerializer(serializers.Serializer):
+    email = serializers.EmailField(max_length=150)
+    password = serializers.CharField(max_length=50, trim_whitespace=False)
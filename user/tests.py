@@ -1,3 +1,126 @@
-from django.test import TestCase
+from django.contrib.auth.signals import user_login_failed
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+from .authentication import token_cache, TokenCache
+from .models import CustomUser
 
-# Create your tests here.
+
+class CachedTokenAuthenticationTest(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = CustomUser.objects.create_user(email='watcher@example.com', password='password', first_name='w',
+                                                   last_name='w', username='watcher', role='watcher')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_second_request_skips_the_token_query(self):
+        self.client.get('/watchlist/v1/watch-list/')
+        # only the (empty) page count, the token and its user come from the cache
+        with self.assertNumQueries(1):
+            response = self.client.get('/watchlist/v1/watch-list/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_role_change_evicts_the_token(self):
+        self.client.get('/watchlist/v1/watch-list/')
+        self.user.role = 'reviewer'
+        self.user.save()
+        self.assertEqual(self.client.get('/watchlist/v1/watch-list/').status_code, 403)
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get('/watchlist/v1/watch-list/')
+        self.token.delete()
+        self.assertEqual(self.client.get('/watchlist/v1/watch-list/').status_code, 401)
+
+    def test_inactive_user_is_rejected(self):
+        self.client.get('/watchlist/v1/watch-list/')
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        token_cache.evict_user(self.user.pk)
+        self.assertEqual(self.client.get('/watchlist/v1/watch-list/').status_code, 401)
+
+
+class TokenCacheTest(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = TokenCache(size=2, ttl=60)
+        users = [CustomUser(pk=i, role='watcher', is_active=True) for i in range(3)]
+        cache.set('a', users[0])
+        cache.set('b', users[1])
+        cache.get('a')
+        cache.set('c', users[2])
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), (0, 'watcher', True))
+
+    def test_entries_expire(self):
+        cache = TokenCache(size=2, ttl=-1)
+        cache.set('a', CustomUser(pk=1, role='watcher', is_active=True))
+        self.assertIsNone(cache.get('a'))
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class LogInTest(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='watcher@example.com', password='password', first_name='w',
+                                                   last_name='w', username='watcher', role='watcher')
+        self.client = APIClient()
+
+    def login(self, password='password'):
+        return self.client.post('/watchlist/v1/login/', {'email': 'watcher@example.com', 'password': password})
+
+    def test_first_login_creates_the_token(self):
+        # user, token lookup, then the token insert in a savepoint
+        with self.assertNumQueries(5):
+            response = self.login()
+        self.assertEqual(response.data['token'], Token.objects.get(user=self.user).key)
+
+    def test_login_reuses_the_token(self):
+        token = Token.objects.create(user=self.user)
+        with self.assertNumQueries(2):
+            response = self.login()
+        self.assertEqual(response.data['token'], token.key)
+
+    def test_failed_login_is_signalled(self):
+        failures = []
+
+        def receiver(sender, credentials, request=None, **kwargs):
+            failures.append(credentials['email'])
+
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+        self.login('wrong')
+        self.assertEqual(failures, ['watcher@example.com'])
+
+    def test_invalid_credentials(self):
+        self.assertEqual(self.login('wrong').status_code, 404)
+        response = self.client.post('/watchlist/v1/login/', {'email': 'nobody@example.com', 'password': 'password'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.post('/watchlist/v1/login/', {'email': 'not an email'}).status_code, 400)
+
+    def test_login_rehashes_when_the_hasher_cost_changes(self):
+        self.assertIn('$1000$', self.user.password)
+        with override_settings(PASSWORD_HASH_ITERATIONS=2000):
+            self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertIn('$2000$', self.user.password)
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_login_rehashes_when_the_policy_changes(self):
+        with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.ScryptPasswordHasher',
+                                                 'user.hashers.PBKDF2PasswordHasher']):
+            self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+
+
+class DefaultAuthenticationTest(TestCase):
+
+    def test_unauthenticated_request_is_forbidden(self):
+        view = type('PrivateView', (APIView,), {'permission_classes': [IsAuthenticated]}).as_view()
+        response = view(APIRequestFactory().get('/'))
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('WWW-Authenticate', response)
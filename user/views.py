@@ -34,10 +34,13 @@ class LogInAPI(APIView):
     def post(self, request):
         serializer = LogInUserSerializer(data=request.data)
         if serializer.is_valid():
-            user = authenticate(email=serializer.data['email'], password=serializer.data['password'])
+            # the configured backends check the password, rehash it when the hasher policy changed and send
+            # user_login_failed. get_or_create takes the token a concurrent first login may have just created
+            user = authenticate(request, email=serializer.validated_data['email'],
+                                password=serializer.validated_data['password'])
             if not user:
                 return Response({'message': 'invalid email and password'}, status=status.HTTP_404_NOT_FOUND)
-            token = Token.objects.get_or_create(user=user)
-            return Response({'message': 'successfully logged in', 'token': user.auth_token.key}, status=status.HTTP_200_OK)
+            token, _ = Token.objects.get_or_create(user=user)
+            return Response({'message': 'successfully logged in', 'token': token.key}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
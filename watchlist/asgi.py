@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'watchlist.settings')
 
 application = get_asgi_application()
+
+# loads the catalog snapshot now instead of on the first request, a no-op unless it is enabled
+from movie import snapshot  # noqa: E402
+
+snapshot.warm()
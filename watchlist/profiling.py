@@ -0,0 +1,233 @@
+"""
+Request profiling, enabled with PROFILING['ENABLED'] in settings.
+
+ProfilingMiddleware records wall time, query count, total SQL time and repeated queries for every
+request, keyed by the resolved view class. Samples live in bounded ring buffers per view, so memory
+and overhead stay constant. Each process also copies its buffers into the django cache every
+PROFILING['FLUSH_INTERVAL'] seconds, that is what `manage.py profiling_report` reads, so the report
+covers every worker when a shared cache backend is configured.
+
+Queries are recorded by an execute wrapper installed once on every connection, it records into the
+recorder of the request in a context variable. Under ASGI the queries of a request run in threads other
+than the one serving it, and sync_to_async copies the context into them.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import Counter, deque
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.authentication import TokenAuthentication, SessionAuthentication
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+DEFAULTS = {
+    'ENABLED': False,
+    # samples kept per view
+    'BUFFER_SIZE': 1000,
+    # a query template executed this many times in one request is reported as a possible N+1
+    'SIMILAR_THRESHOLD': 3,
+    # repeated query templates kept per view
+    'MAX_SIMILAR': 20,
+    'FLUSH_INTERVAL': 10,
+}
+PROCESSES_KEY = 'profiling:processes'
+PROCESS_KEY = 'profiling:process:%s'
+METRICS = ('wall_ms', 'queries', 'sql_ms', 'duplicate_queries')
+
+
+def get_setting(name):
+    return getattr(settings, 'PROFILING', {}).get(name, DEFAULTS[name])
+
+
+class ViewProfile:
+    __slots__ = ('samples', 'similar')
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self.similar = Counter()
+
+
+class ProfileRegistry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view, sample, similar):
+        profile = self.views.get(view)
+        if profile is None:
+            with self.lock:
+                profile = self.views.setdefault(view, ViewProfile(get_setting('BUFFER_SIZE')))
+        profile.samples.append(sample)
+        for sql in similar:
+            if sql in profile.similar or len(profile.similar) < get_setting('MAX_SIMILAR'):
+                profile.similar[sql] += 1
+
+    def snapshot(self):
+        return {view: {'samples': list(profile.samples), 'similar': dict(profile.similar)}
+                for view, profile in list(self.views.items())}
+
+    def clear(self):
+        with self.lock:
+            self.views = {}
+
+
+registry = ProfileRegistry()
+
+# the QueryRecorder of the request being profiled
+_recorder = contextvars.ContextVar('profiling_recorder', default=None)
+
+
+class QueryRecorder:
+
+    """execute wrapper that times every query, it works with DEBUG off unlike connection.queries"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, repr(params), time.perf_counter() - start))
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ProfilingMiddleware:
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.last_flush = time.monotonic()
+        # connections opened from now on, in any thread
+        connection_created.connect(install, dispatch_uid='profiling')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # connections of this thread opened before the middleware loaded
+        for connection in connections.all(initialized_only=True):
+            install(connection=connection)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        token = _recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self.record(request, recorder, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        token = _recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        # flushing writes to the cache
+        await sync_to_async(self.record)(request, recorder, time.perf_counter() - start)
+        return response
+
+    def record(self, request, recorder, wall):
+        templates = Counter(sql for sql, _, _ in recorder.queries)
+        statements = Counter((sql, params) for sql, params, _ in recorder.queries)
+        sample = (wall * 1000, len(recorder.queries), sum(duration for _, _, duration in recorder.queries) * 1000,
+                  sum(count - 1 for count in statements.values()))
+        similar = [sql for sql, count in templates.items() if count >= get_setting('SIMILAR_THRESHOLD')]
+        registry.record(view_name(request), sample, similar)
+
+        if time.monotonic() - self.last_flush >= get_setting('FLUSH_INTERVAL'):
+            self.last_flush = time.monotonic()
+            flush()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    view = getattr(match.func, 'view_class', match.func)
+    return '%s.%s' % (view.__module__, view.__name__)
+
+
+def flush():
+    """copies this process' buffers into the cache for the management command"""
+    pid = os.getpid()
+    cache.set(PROCESS_KEY % pid, registry.snapshot(), None)
+    processes = cache.get(PROCESSES_KEY, [])
+    if pid not in processes:
+        cache.set(PROCESSES_KEY, processes + [pid], None)
+
+
+def collect():
+    """merges the snapshots of every process that flushed into the cache"""
+    merged = {}
+    for pid in cache.get(PROCESSES_KEY, []):
+        for view, profile in (cache.get(PROCESS_KEY % pid) or {}).items():
+            view_profile = merged.setdefault(view, {'samples': [], 'similar': {}})
+            view_profile['samples'].extend(profile['samples'])
+            for sql, count in profile['similar'].items():
+                view_profile['similar'][sql] = view_profile['similar'].get(sql, 0) + count
+    return merged
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+
+    def rank(percent):
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+    return {'p50': rank(50), 'p90': rank(90), 'p99': rank(99), 'max': values[-1]}
+
+
+def report(snapshot):
+    """per view percentiles of every metric plus the query templates most often repeated in a request"""
+    result = {}
+    for view, profile in snapshot.items():
+        columns = list(zip(*profile['samples'])) or [()] * len(METRICS)
+        result[view] = {'requests': len(profile['samples'])}
+        result[view].update({metric: percentiles(column) for metric, column in zip(METRICS, columns)})
+        result[view]['n_plus_one'] = [{'sql': sql, 'requests': count} for sql, count in
+                                      sorted(profile['similar'].items(), key=lambda item: -item[1])]
+    return result
+
+
+class ProfilingReportAPI(APIView):
+
+    """admin only, the profile of the process that serves the request, ?scope=all merges every process
+    that flushed into the cache"""
+
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        snapshot = collect() if request.query_params.get('scope') == 'all' else registry.snapshot()
+        return Response(report(snapshot))
@@ -0,0 +1,133 @@
+"""
+Read replicas, enabled by listing database aliases in DATABASE_REPLICAS['ALIASES'].
+
+ReplicaMiddleware picks one of the aliases at random for every safe request (GET, HEAD, OPTIONS), and
+ReplicaRouter sends all the reads of that request to it, so its count, page and prefetch queries see the
+same state. Everything else stays on the primary ('default'):
+- writes, and the reads of unsafe requests
+- reads outside a request, such as management commands
+- reads inside primary(). The caches (movie.cache, the catalog snapshot, the token cache) load through
+  it, so a lagging replica can never be cached under a fresh generation
+
+Read-your-writes: an unsafe request pins its client to the primary for STICKY_SECONDS, so the list the
+client fetches right after its own write shows it. The pin lives in the django cache, keyed by the
+client's Authorization header, or else its session cookie, or else its address. Use a shared cache
+backend when running several workers, or a pin only holds in the worker that served the write.
+
+replicate() is a stand-in for real replication when the replicas are sqlite files: it copies the primary
+into each one with the sqlite backup api. `manage.py replicate --interval N` keeps doing so, which
+simulates a replica lagging up to N seconds behind.
+"""
+import contextvars
+import hashlib
+import random
+import sqlite3
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DEFAULTS = {
+    'ALIASES': [],
+    # seconds a client reads from the primary after a write
+    'STICKY_SECONDS': 5,
+}
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_KEY = 'replicas:sticky:%s'
+
+# the replica of the safe, unpinned request being served, None reads from the primary
+_replica = contextvars.ContextVar('replica', default=None)
+
+
+def get_setting(name):
+    return getattr(settings, 'DATABASE_REPLICAS', {}).get(name, DEFAULTS[name])
+
+
+@contextmanager
+def primary():
+    """reads inside the block go to the primary"""
+    token = _replica.set(None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return _replica.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary
+        return db not in get_setting('ALIASES')
+
+
+def client_key(request):
+    credential = (request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+                  or request.META.get('REMOTE_ADDR', ''))
+    return STICKY_KEY % hashlib.md5(credential.encode()).hexdigest()
+
+
+class ReplicaMiddleware:
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_setting('ALIASES'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = client_key(request)
+        safe = request.method in SAFE_METHODS
+        token = _replica.set(pick(safe and not cache.get(key)))
+        try:
+            return self.get_response(request)
+        finally:
+            _replica.reset(token)
+            if not safe:
+                cache.set(key, True, get_setting('STICKY_SECONDS'))
+
+    async def __acall__(self, request):
+        # the sync views and the sync_to_async calls of the async ones run in a copy of this context
+        key = client_key(request)
+        safe = request.method in SAFE_METHODS
+        token = _replica.set(pick(safe and not await cache.aget(key)))
+        try:
+            return await self.get_response(request)
+        finally:
+            _replica.reset(token)
+            if not safe:
+                await cache.aset(key, True, get_setting('STICKY_SECONDS'))
+
+
+def pick(use_replica):
+    """a random replica, or None for the primary"""
+    return random.choice(get_setting('ALIASES')) if use_replica else None
+
+
+def replicate(aliases=None):
+    """copies the primary into every replica, sqlite only"""
+    source = connections[DEFAULT_DB_ALIAS]
+    source.ensure_connection()
+    for alias in aliases or get_setting('ALIASES'):
+        target = sqlite3.connect(connections[alias].settings_dict['NAME'], timeout=20)
+        try:
+            source.connection.backup(target)
+        finally:
+            target.close()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -54,6 +55,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'watchlist.replicas.ReplicaMiddleware',
+    'watchlist.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'watchlist.urls'
@@ -88,6 +91,114 @@ DATABASES = {
 }
 
 
+# Read replicas, see watchlist/replicas.py
+# WATCHLIST_REPLICAS=N adds N sqlite replicas next to db.sqlite3 for local testing, fill and refresh them
+# with `manage.py replicate --interval SECONDS`. leave it unset when running the tests, they only use the
+# primary and register replicas of their own where they need them
+
+DATABASE_REPLICAS = {
+    'ALIASES': ['replica%d' % i for i in range(1, int(os.environ.get('WATCHLIST_REPLICAS', 0)) + 1)],
+    'STICKY_SECONDS': 5,
+}
+for alias in DATABASE_REPLICAS['ALIASES']:
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / ('db.%s.sqlite3' % alias),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['watchlist.replicas.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# genre and stream platform lookups are cached here, use a shared backend (file, memcached, redis) when
+# running more than one worker so invalidations reach every process
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+# token key -> user cache used by user.authentication.CachedTokenAuthentication, entries live TTL seconds
+
+TOKEN_CACHE = {
+    'SIZE': 10000,
+    'TTL': 60,
+}
+
+
+# Request profiling, see watchlist/profiling.py
+# the report is served at watchlist/v1/profiling/ (admin only) and by `manage.py profiling_report`
+
+PROFILING = {
+    'ENABLED': False,
+    'BUFFER_SIZE': 1000,
+    'SIMILAR_THRESHOLD': 3,
+    'FLUSH_INTERVAL': 10,
+}
+
+
+# Trending rankings, see movie/trending.py
+# activity loses half its weight every HALF_LIFE_DAYS, `manage.py rebuild_trending` recomputes the rankings
+
+TRENDING = {
+    'HALF_LIFE_DAYS': 7,
+    'DEFAULT_LIMIT': 10,
+    'MAX_LIMIT': 100,
+}
+
+
+# In-memory catalog snapshot, see movie/snapshot.py
+# serves the movie list from memory, reloaded on catalog writes and at least every MAX_AGE seconds so the
+# watchlist/review counters it shows stay fresh. `manage.py catalog_snapshot` reports its memory use
+
+CATALOG_SNAPSHOT = {
+    'ENABLED': os.environ.get('WATCHLIST_CATALOG_SNAPSHOT') == '1',
+    'MAX_AGE': 60,
+}
+
+
+# Recommendations, see movie/recommendations.py
+# the index is rebuilt by `manage.py rebuild_recommendations`, run it on a schedule (--since HOURS in between)
+
+RECOMMENDATIONS = {
+    'TOP_N': 20,
+    'GENRE_WEIGHT': 0.2,
+    'MAX_ITEMS_PER_USER': 500,
+    'DEFAULT_LIMIT': 10,
+    'MAX_LIMIT': 50,
+}
+
+
+# Catalog change feed, see movie/changelog.py
+# served at changes/, `manage.py prune_changelog --days N` drops the older changes, mirrors further behind reload
+
+CHANGELOG = {
+    'DEFAULT_LIMIT': 100,
+    'MAX_LIMIT': 1000,
+}
+
+
+# Password hashing
+# WATCHLIST_PASSWORD_HASHER picks the preferred hasher, the others stay listed so existing hashes still
+# verify. changing the policy or the pbkdf2 iteration count rehashes each password transparently the
+# next time its user logs in. argon2 needs argon2-cffi installed, scrypt is in the standard library
+
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('WATCHLIST_PASSWORD_HASH_ITERATIONS', 390000))
+PASSWORD_HASHER_POLICIES = {
+    'pbkdf2': 'user.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+}
+PASSWORD_HASHER_POLICY = os.environ.get('WATCHLIST_PASSWORD_HASHER', 'pbkdf2')
+PASSWORD_HASHERS = [PASSWORD_HASHER_POLICIES[PASSWORD_HASHER_POLICY]] + [
+    hasher for policy, hasher in PASSWORD_HASHER_POLICIES.items() if policy != PASSWORD_HASHER_POLICY
+]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -131,17 +242,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 REST_FRAMEWORK = {
+    # session first, as rest_framework's defaults: an unauthenticated request is answered 403, not 401
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-    ]
-}
-
-
-REST_FRAMEWORK = {
+        'rest_framework.authentication.BasicAuthentication',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_PAGINATION_CLASS': "rest_framework.pagination.PageNumberPagination",
     'PAGE_SIZE': 3
-}
\ No newline at end of file
+}
@@ -0,0 +1,83 @@
+"""
+Production settings, select them with DJANGO_SETTINGS_MODULE=watchlist.settings_production
+
+Everything not overridden here comes from watchlist/settings.py. WATCHLIST_SECRET_KEY and
+WATCHLIST_CACHE_URL are required, WATCHLIST_ALLOWED_HOSTS is a comma separated list of host names.
+
+The database keeps its connections open across requests (CONN_MAX_AGE) and tunes sqlite for a server
+with concurrent readers and writers, see watchlist/sqlite/base.py. `python benchmarks/settings_bench.py`
+compares the throughput of both settings under mixed load.
+"""
+import os
+from urllib.parse import urlsplit
+from django.core.exceptions import ImproperlyConfigured
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASE_REPLICAS, REST_FRAMEWORK
+
+DEBUG = False
+
+SECRET_KEY = os.environ['WATCHLIST_SECRET_KEY']
+
+ALLOWED_HOSTS = [host for host in os.environ.get('WATCHLIST_ALLOWED_HOSTS', '').split(',') if host]
+
+
+# Database
+# wal lets readers run alongside the writer and, with synchronous=NORMAL, only syncs at checkpoints: a
+# power loss can drop the last commits but never corrupts the file. `timeout` is the busy timeout, the
+# seconds a connection waits for the write lock before failing with "database is locked"
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'watchlist.sqlite',
+        'NAME': os.environ.get('WATCHLIST_DATABASE', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': int(os.environ.get('WATCHLIST_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                # 256 MB of the file mapped in memory, 64 MB page cache per connection (negative is KiB)
+                'mmap_size': 268435456,
+                'cache_size': -64000,
+                'temp_store': 'MEMORY',
+            },
+        },
+    }
+}
+# replicas share the tuning, WATCHLIST_DATABASE_<ALIAS> overrides the path of each
+for alias in DATABASE_REPLICAS['ALIASES']:
+    DATABASES[alias] = dict(DATABASES['default'], NAME=os.environ.get(
+        'WATCHLIST_DATABASE_%s' % alias.upper(), BASE_DIR / ('db.%s.sqlite3' % alias)))
+
+
+# Cache
+# every worker must share it: the cache generations, the catalog version behind the snapshot and facets,
+# and the read-replica pins only reach the other workers through it. WATCHLIST_CACHE_URL is one of
+# redis://host:port/db, memcached://host:port or file:///absolute/path (one host only)
+
+CACHE_BACKENDS = {
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+}
+CACHE_URL = urlsplit(os.environ.get('WATCHLIST_CACHE_URL', ''))
+if CACHE_URL.scheme not in CACHE_BACKENDS:
+    raise ImproperlyConfigured('WATCHLIST_CACHE_URL must be a %s url of a cache shared by every worker'
+                               % ', '.join(CACHE_BACKENDS))
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_URL.scheme],
+        'LOCATION': {'file': CACHE_URL.path, 'memcached': CACHE_URL.netloc}.get(CACHE_URL.scheme,
+                                                                              CACHE_URL.geturl()),
+    }
+}
+
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ],
+}
@@ -0,0 +1,26 @@
+from django.db.backends.sqlite3 import base
+
+# sqlite backend taking two more OPTIONS, used by the production settings:
+# - 'pragmas': {name: value} run in order on every new connection (journal_mode, synchronous, cache_size...)
+# - 'transaction_mode': 'IMMEDIATE' makes atomic blocks take the write lock when they begin. a deferred
+#   transaction that reads first and writes later fails with "database is locked" without waiting for the
+#   busy timeout when another connection writes in between, an immediate one waits for its turn instead
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            connection.execute('PRAGMA %s = %s' % (name, value))
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute('BEGIN %s' % mode if mode else 'BEGIN')
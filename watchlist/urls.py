@@ -15,9 +15,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from .profiling import ProfilingReportAPI
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('watchlist/v1/profiling/', ProfilingReportAPI.as_view()),
     path('watchlist/v1/', include('user.urls')),
     path('watchlist/v1/', include('movie.urls'))
 ]
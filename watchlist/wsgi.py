@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'watchlist.settings')
 
 application = get_wsgi_application()
+
+# loads the catalog snapshot now instead of on the first request, a no-op unless it is enabled
+from movie import snapshot  # noqa: E402
+
+snapshot.warm()